@@ -0,0 +1,140 @@
+import torch
+import numpy as np
+import yaml, os, time, json, platform, argparse
+from types import MethodType
+
+from Modules import Maximum_Path_Generater, Maximum_Path_Torch
+
+from Arg_Parser import Recursive_Parse
+hp = Recursive_Parse(yaml.load(
+    open('Hyper_Parameters.yaml', encoding='utf-8'),
+    Loader=yaml.Loader
+    ))
+
+def Inputs_Generate(batch_size, mel_length, token_ratio, seed= 0):
+    '''
+    Random log likelihoods with random lengths, so the padding is included as in training.
+    The mel lengths are between the half and the full length, and the token lengths are the mel lengths / token_ratio.
+    return: log_p and mask, [Batch, Token_t, Mel_t] each.
+    '''
+    generator = torch.Generator().manual_seed(seed)
+    mel_Lengths = torch.randint(max(mel_length // 2, 1), mel_length + 1, (batch_size,), generator= generator)
+    mel_Lengths[0] = mel_length
+    token_Lengths = torch.clamp(mel_Lengths // token_ratio, min= 1)
+    token_Time = int(token_Lengths.max())
+
+    mask = \
+        (torch.arange(token_Time)[None, :, None] < token_Lengths[:, None, None]) & \
+        (torch.arange(mel_length)[None, None, :] < mel_Lengths[:, None, None])
+    log_p = torch.randn(batch_size, token_Time, mel_length, generator= generator) * 10.0
+
+    return log_p, mask.float()
+
+def Methods_Generate(use_python= False):
+    '''
+    return: {name: function(log_p, mask)}. The cython is skipped when it is not compiled.
+    '''
+    method_Dict = {'Torch_CPU': Maximum_Path_Torch}
+    if torch.cuda.is_available():
+        method_Dict['Torch_CUDA'] = Maximum_Path_Torch
+    try:
+        import monotonic_align
+        method_Dict['Cython'] = monotonic_align.maximum_path
+    except ImportError:
+        pass
+    if use_python:
+        generater = Maximum_Path_Generater.__new__(Maximum_Path_Generater)
+        torch.nn.Module.__init__(generater)
+        method_Dict['Python'] = MethodType(Maximum_Path_Generater.forward, generater)
+
+    return method_Dict
+
+def Method_Time(method, log_p, mask, device, repeats= 5):
+    '''
+    The inputs are on the device before timing, so Torch_CUDA is without the copy and the Cython is with its host round trip.
+    return: the median ms and the paths.
+    '''
+    log_p, mask = log_p.to(device), mask.to(device)
+    paths = method(log_p.clone(), mask)    # Warm up.
+    times = []
+    for _ in range(repeats):
+        x = log_p.clone()
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        start_Time = time.perf_counter()
+        paths = method(x, mask)
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        times.append((time.perf_counter() - start_Time) * 1000.0)
+
+    return float(np.median(times)), paths.cpu()
+
+def Benchmark(batch_sizes, mel_lengths, token_ratio= 5, repeats= 5, use_python= False):
+    '''
+    Every method is compared with the first method which is not the torch (the cython if it is compiled).
+    '''
+    method_Dict = Methods_Generate(use_python)
+    reference = [name for name in method_Dict.keys() if not name.startswith('Torch')]
+    reference = reference[0] if len(reference) > 0 else None
+
+    results = []
+    for batch_Size in batch_sizes:
+        for mel_Length in mel_lengths:
+            log_p, mask = Inputs_Generate(batch_Size, mel_Length, token_ratio, seed= len(results))
+            time_Dict, path_Dict = {}, {}
+            for name, method in method_Dict.items():
+                device = torch.device('cuda:0') if name == 'Torch_CUDA' else torch.device('cpu')
+                time_Dict[name], path_Dict[name] = Method_Time(method, log_p, mask, device, repeats)
+            results.append({
+                'Batch': batch_Size,
+                'Mel_Length': mel_Length,
+                'Token_Length': log_p.size(1),
+                'MS': time_Dict,
+                'Exact': {
+                    name: bool(torch.equal(paths, path_Dict[reference]))
+                    for name, paths in path_Dict.items()
+                    if name != reference
+                    } if not reference is None else {},
+                })
+
+    return results
+
+def Print(result):
+    print('Batch: {}\tMel_t: {}\tToken_t: {}'.format(result['Batch'], result['Mel_Length'], result['Token_Length']))
+    for name, ms in result['MS'].items():
+        exact = result['Exact'].get(name)
+        print('    {:<12}{:>10.2f} ms{}'.format(name, ms, '' if exact is None else '    Exact: {}'.format(exact)))
+
+if __name__ == '__main__':
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument("-b", "--batch_sizes", default= '1,16,32', required=False)
+    argParser.add_argument("-l", "--mel_lengths", default= '200,500,1000', required=False)
+    argParser.add_argument("-tr", "--token_ratio", default= 5, required=False, type= int)    # Mel frames per token.
+    argParser.add_argument("-r", "--repeats", default= 5, required=False, type= int)
+    argParser.add_argument("-python", "--use_python", action= 'store_true')  # The python implementation is very slow.
+    argParser.add_argument("-o", "--output_path", default= 'Alignment_Benchmark.json', required=False)
+    args = argParser.parse_args()
+
+    results = Benchmark(
+        batch_sizes= [int(x) for x in args.batch_sizes.split(',')],
+        mel_lengths= [int(x) for x in args.mel_lengths.split(',')],
+        token_ratio= args.token_ratio,
+        repeats= args.repeats,
+        use_python= args.use_python
+        )
+    for result in results:
+        Print(result)
+
+    with open(args.output_path, 'w') as f:
+        json.dump({
+            'Time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'Environment': {
+                'Python': platform.python_version(),
+                'Platform': platform.platform(),
+                'CPU_Count': os.cpu_count(),
+                'Torch': torch.__version__,
+                'CUDA': torch.cuda.get_device_name(0) if torch.cuda.is_available() else None,
+                },
+            'Token_Ratio': args.token_ratio,
+            'Results': results,
+            }, f, indent= 4)
@@ -1,6 +1,9 @@
 import numpy as np
+import torch
 from scipy import signal
-import librosa
+import librosa, inspect
+import soundfile as sf
+from functools import lru_cache
 
 
 def Audio_Prep(path, sample_rate, trim_top_db= 60):
@@ -10,6 +13,277 @@ def Audio_Prep(path, sample_rate, trim_top_db= 60):
 
     return audio
 
+def Audio_Length(path, sample_rate):
+    '''
+    The length after 'librosa.core.load'. Only the header is read.
+    '''
+    info = sf.info(path)
+    if info.samplerate == sample_rate:
+        return info.frames
+    return int(np.ceil(info.frames * sample_rate / info.samplerate))
+
+def Audio_Blocks(path, sample_rate, block_size= 2 ** 16):
+    '''
+    Reads the file by blocks. The samples are the same as 'librosa.core.load':
+    the channels are averaged and the resampling is done by a soxr stream with the same quality as librosa's default.
+    '''
+    length = Audio_Length(path, sample_rate)
+    read_Length = 0
+    with sf.SoundFile(path) as f:
+        resampler = None
+        if f.samplerate != sample_rate:
+            import soxr # Only the streaming resampling needs soxr. librosa < 0.10 does not install it.
+            resampler = soxr.ResampleStream(f.samplerate, sample_rate, 1, dtype= 'float32', quality= 'soxr_hq')
+        while True:
+            block = f.read(block_size, dtype= 'float32', always_2d= True)
+            last = block.shape[0] < block_size
+            block = block.mean(axis= 1) if block.shape[1] > 1 else block[:, 0]
+            if not resampler is None:
+                block = resampler.resample_chunk(block, last= last)
+            block = block[:length - read_Length]
+            read_Length += block.shape[0]
+            if block.shape[0] > 0:
+                yield block
+            if last:
+                break
+
+    if read_Length < length:    # librosa fixes the length of the resampled audio.
+        yield np.zeros(length - read_Length, dtype= np.float32)
+
+class Overlap_Framer:
+    '''
+    Receives a signal by blocks and returns segments which contain only whole frames.
+    Consecutive segments overlap by frame_length - hop_length samples, and the frames are the same as
+    the frames of the full signal padded by 'np.pad(signal, pad, mode= pad_mode)'.
+    '''
+    def __init__(self, length, frame_length, hop_length, pad, pad_mode, frame_count, dtype= np.float32, frame_multiple= 1):
+        self.length = length
+        self.frame_length = frame_length
+        self.hop_length = hop_length
+        self.pad = pad
+        self.pad_mode = pad_mode
+        self.frame_count = frame_count
+        self.frame_multiple = frame_multiple
+
+        self.buffer = np.zeros(0, dtype= dtype)
+        self.received = 0
+        self.left_Padded = False
+        self.emitted = 0
+
+    def Segment(self, last= False):
+        if not self.left_Padded or self.buffer.shape[0] < self.frame_length:
+            return None
+        frames = min((self.buffer.shape[0] - self.frame_length) // self.hop_length + 1, self.frame_count - self.emitted)
+        if not last:
+            frames = frames // self.frame_multiple * self.frame_multiple
+        if frames <= 0:
+            return None
+
+        segment = self.buffer[:(frames - 1) * self.hop_length + self.frame_length]
+        self.buffer = self.buffer[frames * self.hop_length:]
+        self.emitted += frames
+
+        return segment
+
+    def Feed(self, block):
+        self.buffer = np.concatenate([self.buffer, block])
+        self.received += block.shape[0]
+        if not self.left_Padded and self.received > self.pad:   # Reflection needs pad + 1 samples.
+            self.buffer = np.pad(self.buffer, (self.pad, 0), mode= self.pad_mode)
+            self.left_Padded = True
+
+        return self.Segment()
+
+    def Flush(self):
+        if self.left_Padded:
+            self.buffer = np.pad(self.buffer, (0, self.pad), mode= self.pad_mode)
+        else:
+            self.buffer = np.pad(self.buffer, self.pad, mode= self.pad_mode)
+            self.left_Padded = True
+
+        return self.Segment(last= True)
+
+def Audio_Prep_Stream(path, sample_rate, trim_top_db= 60, block_size= 2 ** 16):
+    '''
+    Streaming version of Audio_Prep for long recordings. The samples are the same as Audio_Prep.
+    The file is read twice: the first pass gets the trim bounds and the peak from the frame RMS and the peak of every hop,
+    and the second pass yields the trimmed and normalized blocks. Only the frame level values are kept in memory.
+    return: the length of the prepared audio and a generator of its blocks.
+    '''
+    frame_length, hop_length = 512, 256
+    length = Audio_Length(path, sample_rate)
+
+    framer = Overlap_Framer(
+        length= length,
+        frame_length= frame_length,
+        hop_length= hop_length,
+        pad= frame_length // 2,
+        pad_mode= inspect.signature(librosa.feature.rms).parameters['pad_mode'].default,
+        frame_count= 1 + length // hop_length
+        )
+    def RMS(segment):
+        if segment is None:
+            return np.zeros(0, dtype= np.float32)
+        return librosa.feature.rms(y= segment, frame_length= frame_length, hop_length= hop_length, center= False)[0]
+
+    rms_List, peak_List = [], []
+    remainder = np.zeros(0, dtype= np.float32)
+    for block in Audio_Blocks(path, sample_rate, block_size):
+        rms_List.append(RMS(framer.Feed(block)))
+        remainder = np.concatenate([remainder, block])
+        hops = remainder.shape[0] // hop_length
+        peak_List.append(np.abs(remainder[:hops * hop_length]).reshape(hops, hop_length).max(axis= 1))
+        remainder = remainder[hops * hop_length:]
+    rms_List.append(RMS(framer.Flush()))
+    if remainder.shape[0] > 0:
+        peak_List.append(np.abs(remainder).max(keepdims= True))
+
+    # Same as 'librosa.effects.trim'
+    non_Silent = librosa.amplitude_to_db(np.concatenate(rms_List), ref= np.max, top_db= None) > -trim_top_db
+    nonzero = np.flatnonzero(non_Silent)
+    if nonzero.size == 0:
+        raise ValueError('All frames are silent.')
+    start = int(nonzero[0]) * hop_length
+    end = min(length, (int(nonzero[-1]) + 1) * hop_length)
+
+    # Same as 'librosa.util.normalize'
+    peak = np.concatenate(peak_List)[start // hop_length:(end + hop_length - 1) // hop_length].max().astype(float)
+    peak = np.array([peak if peak >= np.finfo(np.float32).tiny else 1.0])
+
+    def Blocks():
+        position = 0
+        for block in Audio_Blocks(path, sample_rate, block_size):
+            block_Start, block_End = max(start - position, 0), min(end - position, block.shape[0])
+            position += block.shape[0]
+            if block_Start >= block_End:
+                continue
+            block = block[block_Start:block_End]
+            if not np.all(np.isfinite(block)):
+                raise ValueError('Input must be finite')
+            normalized = np.empty_like(block)
+            normalized[:] = block / peak
+            yield normalized
+
+    return end - start, Blocks()
+
+
+class Mel_Extractor:
+    '''
+    The mel basis and the window are built once, and an audio is processed by one torch.stft and the mel projection.
+    The audio is padded like librosa's centered stft (the pad mode follows the installed librosa), so the result is
+    the same as 'librosa.stft' with its default parameters. The computation is done in float64 like the numpy version.
+    '''
+    def __init__(
+        self,
+        sample_rate,
+        num_mel,
+        num_frequency,
+        window_length,
+        hop_length,
+        pre_emphasis= 0.97,
+        mel_fmin= 125,
+        mel_fmax= 7600,
+        min_level_db= -100,
+        max_abs_value= 4.0,
+        pad_mode= inspect.signature(librosa.stft).parameters['pad_mode'].default
+        ):
+        self.n_fft = (num_frequency - 1) * 2
+        self.hop_length = hop_length
+        self.pre_emphasis = pre_emphasis
+        self.min_level_db = min_level_db
+        self.max_abs_value = max_abs_value
+        self.pad_mode = pad_mode
+        self.projection_Frames = 64
+
+        window = librosa.filters.get_window('hann', window_length, fftbins= True)
+        self.window = torch.from_numpy(librosa.util.pad_center(window, size= self.n_fft)).double()
+        self.mel_filter = torch.from_numpy(librosa.filters.mel(
+            sr= sample_rate,
+            n_fft= self.n_fft,
+            n_mels= num_mel,
+            fmin= mel_fmin,
+            fmax= mel_fmax
+            )).double()
+
+    def __call__(self, audio):
+        '''
+        audio: 1D numpy array.
+        return: [Time, Mel_dim]
+        '''
+        length = 1 + audio.shape[0] // self.hop_length
+        audio = np.pad(Preemphasis(audio, pre_emphasis= self.pre_emphasis), self.n_fft // 2, mode= self.pad_mode)
+
+        return self.Padded_to_Mel(audio.astype(np.float64))[:length]
+
+    def Padded_to_Mel(self, audio):
+        '''
+        audio: [Time] float64 array of the pre-emphasized and padded audio.
+        return: [Frame, Mel_dim] array. Every frame which fits in the audio is computed.
+        '''
+        spectrograms = torch.stft(
+            torch.from_numpy(audio),
+            n_fft= self.n_fft,
+            hop_length= self.hop_length,
+            window= self.window,
+            center= False,
+            return_complex= True
+            )   # [Freq, Time]
+        magnitudes = torch.from_numpy(np.abs(spectrograms.numpy()))    # numpy's complex abs is several times faster than torch's on CPU.
+        # BLAS rounds a frame differently by its position in the matrix, so the projection is done by fixed chunks.
+        # Mel_Stream sends the frames by multiples of the chunk, so its frames are the same as the full audio.
+        magnitudes = torch.cat([
+            self.mel_filter @ magnitudes[..., index:index + self.projection_Frames]
+            for index in range(0, magnitudes.shape[-1], self.projection_Frames)
+            ], dim= -1)
+
+        db = 20 * torch.log10(magnitudes + 1e-7)
+        mels = torch.clamp(
+            (2 * self.max_abs_value) * (db - self.min_level_db) / -self.min_level_db - self.max_abs_value,
+            -self.max_abs_value,
+            self.max_abs_value
+            ).t().numpy()
+
+        return mels
+
+    def Stream(self, length):
+        return Mel_Stream(self, length)
+
+class Mel_Stream:
+    '''
+    Receives the prepared audio by blocks and returns the mel frames which are complete.
+    The pre-emphasis filter keeps its state between blocks, so the frames are the same as Mel_Extractor of the full audio.
+    '''
+    def __init__(self, mel_extractor, length):
+        self.mel_extractor = mel_extractor
+        self.filter_State = np.zeros(1)
+        self.framer = Overlap_Framer(
+            length= length,
+            frame_length= mel_extractor.n_fft,
+            hop_length= mel_extractor.hop_length,
+            pad= mel_extractor.n_fft // 2,
+            pad_mode= mel_extractor.pad_mode,
+            frame_count= 1 + length // mel_extractor.hop_length,
+            dtype= np.float64,
+            frame_multiple= mel_extractor.projection_Frames
+            )
+
+    def Mel(self, segment):
+        if segment is None:
+            return np.zeros((0, self.mel_extractor.mel_filter.shape[0]))
+        return self.mel_extractor.Padded_to_Mel(segment)
+
+    def Feed(self, block):
+        block, self.filter_State = signal.lfilter(
+            [1.0, -self.mel_extractor.pre_emphasis], [1.0], block, zi= self.filter_State
+            )
+        return self.Mel(self.framer.Feed(block))
+
+    def Flush(self):
+        return self.Mel(self.framer.Flush())
+
+@lru_cache(maxsize= None)
+def Mel_Extractor_Get(*args, **kwargs):
+    return Mel_Extractor(*args, **kwargs)
 
 def Mel_Generate(
     audio,
@@ -24,27 +298,20 @@ def Mel_Generate(
     min_level_db= -100,   
     max_abs_value= 4.0
     ):
-    pre_emphasis_audio = Preemphasis(audio, pre_emphasis= pre_emphasis)
-    
-    n_fft = (num_frequency - 1) * 2
-    magnitude = np.abs(librosa.stft(
-        y= pre_emphasis_audio,
-        n_fft= n_fft,
+    mel_extractor = Mel_Extractor_Get(
+        sample_rate= sample_rate,
+        num_mel= num_mel,
+        num_frequency= num_frequency,
+        window_length= window_length,
         hop_length= hop_length,
-        win_length= window_length
-        ))
-
-    mel_filter = librosa.filters.mel(sr= sample_rate, n_fft= n_fft, n_mels= num_mel, fmin= mel_fmin, fmax= mel_fmax)
-    magnitude = mel_filter @ magnitude
-    
-    db = 20 * np.log10(magnitude + 1e-7)
-    mel = np.clip(
-        (2 * max_abs_value) * (db - min_level_db)/-min_level_db - max_abs_value,
-        -max_abs_value,
-        max_abs_value
-        ).T
+        pre_emphasis= pre_emphasis,
+        mel_fmin= mel_fmin,
+        mel_fmax= mel_fmax,
+        min_level_db= min_level_db,
+        max_abs_value= max_abs_value
+        )
     
-    return mel 
+    return mel_extractor(audio)
 
 
 def Preemphasis(audio, pre_emphasis = 0.97):
@@ -0,0 +1,92 @@
+import os, pickle, hashlib
+from concurrent.futures import ThreadPoolExecutor as PE
+
+def Directory_Scan(directory, cached= None):
+    '''
+    Returns (mtime, files, subdirectories) of a directory.
+    Adding, removing or renaming an entry changes the mtime of its directory, so a cached entry with the same mtime is used without listing.
+    Symbolic links to directories are not followed, same as os.walk.
+    '''
+    mtime = os.stat(directory).st_mtime_ns
+    if not cached is None and cached[0] == mtime:
+        return cached
+
+    files, subdirectories = [], []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    subdirectories.append(entry.name)
+            else:
+                files.append(entry.name)
+
+    return mtime, sorted(files), sorted(subdirectories)
+
+class Corpus_Index:
+    '''
+    File index of a corpus. The directories are scanned level by level by a thread pool, which hides the latency of network storage.
+    If index_path is not None, the index is saved there and only the directories whose mtime changed are listed again in the next run.
+    '''
+    def __init__(self, root, index_path= None, max_worker= 16):
+        self.root = root.replace('\\', '/').rstrip('/')
+        self.max_Worker = max_worker
+        self.index_File = None
+        if not index_path is None:
+            self.index_File = os.path.join(
+                index_path,
+                '{}.PICKLE'.format(hashlib.sha1(os.path.abspath(self.root).encode('utf-8')).hexdigest().upper())
+                ).replace('\\', '/')
+
+        self.directory_Dict = self.Scan(self.Load())
+        self.Save()
+
+    def Load(self):
+        if self.index_File is None:
+            return {}
+        try:
+            with open(self.index_File, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return {}
+
+    def Save(self):
+        if self.index_File is None:
+            return
+        os.makedirs(os.path.dirname(self.index_File), exist_ok= True)
+        with open(self.index_File, 'wb') as f:
+            pickle.dump(self.directory_Dict, f, protocol= 4)
+
+    def Scan(self, previous_dict):
+        directory_Dict = {}
+        directories = [self.root]
+        with PE(max_workers= self.max_Worker) as executor:
+            while len(directories) > 0:
+                results = list(executor.map(
+                    lambda directory: Directory_Scan(directory, previous_dict.get(directory)),
+                    directories
+                    ))
+                next_Directories = []
+                for directory, result in zip(directories, results):
+                    directory_Dict[directory] = result
+                    next_Directories.extend(['{}/{}'.format(directory, subdirectory) for subdirectory in result[2]])
+                directories = next_Directories
+
+        return directory_Dict
+
+    def Files(self, extensions= None, names= None):
+        '''
+        extensions: upper case extensions like '.WAV'. names: file names. Both are sets to make the membership check O(1).
+        '''
+        return [
+            '{}/{}'.format(directory, file)
+            for directory, (_, files, _) in sorted(self.directory_Dict.items())
+            for file in files
+            if (extensions is None or os.path.splitext(file)[1].upper() in extensions) and (names is None or file in names)
+            ]
+
+    def Map(self, function, items):
+        '''
+        Applies function to items by the thread pool, for the text file reads.
+        '''
+        with PE(max_workers= self.max_Worker) as executor:
+            return list(executor.map(function, items))
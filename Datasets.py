@@ -1,9 +1,14 @@
 import torch
 import numpy as np
-import yaml, pickle, os, math, logging
-from random import shuffle, sample
+import yaml, os, math, logging, random
+from random import sample
+from collections import deque
 
-from Pattern_Generator import Pattern_Generate, Text_Filtering
+from Text_Frontend import Text_Frontend
+from Feature_Cache import Feature_Cache
+from Pattern_Generator import top_DB_Dict
+from Pattern_Store import Shard_Reader, Store_Path, Pattern_Load
+from Metadata import Metadata
 
 from Arg_Parser import Recursive_Parse
 hp = Recursive_Parse(yaml.load(
@@ -13,38 +18,54 @@ hp = Recursive_Parse(yaml.load(
 
 with open(hp.Token_Path) as f:
     token_Dict = yaml.load(f, Loader=yaml.Loader)
+text_Frontend = Text_Frontend(token_dict= token_Dict)
 
 def Text_to_Token(text):
-    return np.array([
-        token_Dict[letter]
-        for letter in ['<S>'] + list(text) + ['<E>']
-        ], dtype= np.int32)
+    return text_Frontend.Tokenize(text)
 
+# The stacks preallocate the padded batch once and write each item in the final layout,
+# so the collaters can hand them to torch by torch.from_numpy without another copy.
 def Token_Stack(tokens):
-    max_Token_Length = max([token.shape[0] for token in tokens])
-    tokens = np.stack(
-        [np.pad(token, [0, max_Token_Length - token.shape[0]], constant_values= token_Dict['<E>']) for token in tokens],
-        axis= 0
+    '''
+    return: [Batch, Time] int64
+    '''
+    stacked_Tokens = np.full(
+        (len(tokens), max([token.shape[0] for token in tokens])),
+        token_Dict['<E>'],
+        dtype= np.int64
         )
+    for index, token in enumerate(tokens):
+        stacked_Tokens[index, :token.shape[0]] = token
         
-    return tokens
+    return stacked_Tokens
 
 def Mel_Stack(mels):
-    max_Mel_Length = max([mel.shape[0] for mel in mels])
-    mels = np.stack(
-        [np.pad(mel, [[0, max_Mel_Length - mel.shape[0]], [0, 0]], constant_values= -hp.Sound.Max_Abs_Mel) for mel in mels],
-        axis= 0
+    '''
+    mels: [Time, Mel_dim] each
+    return: [Batch, Mel_dim, Time] float32
+    '''
+    stacked_Mels = np.full(
+        (len(mels), mels[0].shape[1], max([mel.shape[0] for mel in mels])),
+        -hp.Sound.Max_Abs_Mel,
+        dtype= np.float32
         )
+    for index, mel in enumerate(mels):
+        stacked_Mels[index, :, :mel.shape[0]] = mel.T
 
-    return mels
+    return stacked_Mels
 
 def Mel_for_GE2E_Stack(mels):
-    mels_for_embeddig = []
-    for mel in mels:
-        overlap_Length = hp.Speaker_Embedding.GE2E.Inference.Overlap_Length
-        slice_Length = hp.Speaker_Embedding.GE2E.Inference.Slice_Length
-        required_Length = hp.Speaker_Embedding.GE2E.Inference.Samples * (slice_Length - overlap_Length) + overlap_Length
-
+    '''
+    mels: [Time, Mel_dim] each
+    return: [Batch * Samples, Mel_dim, Slice_Length] float32
+    '''
+    overlap_Length = hp.Speaker_Embedding.GE2E.Inference.Overlap_Length
+    slice_Length = hp.Speaker_Embedding.GE2E.Inference.Slice_Length
+    samples = hp.Speaker_Embedding.GE2E.Inference.Samples
+    required_Length = samples * (slice_Length - overlap_Length) + overlap_Length
+
+    stacked_Mels = np.empty((len(mels) * samples, mels[0].shape[1], slice_Length), dtype= np.float32)
+    for index, mel in enumerate(mels):
         if mel.shape[0] > required_Length:
             offset = np.random.randint(0, mel.shape[0] - required_Length)
             mel = mel[offset:offset + required_Length]
@@ -56,23 +77,211 @@ def Mel_for_GE2E_Stack(mels):
                 mode= 'reflect'
                 )
 
-        mel = np.stack([
-            mel[index:index + slice_Length]
-            for index in range(0, required_Length - overlap_Length, slice_Length - overlap_Length)
-            ])
-        mels_for_embeddig.append(mel)
+        # [Windows, Mel_dim, Slice_Length] view. The window starts are every (slice_Length - overlap_Length) frames.
+        windows = np.lib.stride_tricks.sliding_window_view(mel, slice_Length, axis= 0)[::slice_Length - overlap_Length]
+        stacked_Mels[index * samples:(index + 1) * samples] = windows[:samples]
 
-    return np.vstack(mels_for_embeddig)
+    return stacked_Mels
 
 def Pitch_Stack(pitches):
-    max_Pitch_Length = max([pitch.shape[0] for pitch in pitches])    
-    pitches = np.stack(
-        [np.pad(pitch, [0, max_Pitch_Length - pitch.shape[0]], constant_values= 0.0) for pitch in pitches],
-        axis= 0
-        )
+    '''
+    return: [Batch, Time] float32
+    '''
+    stacked_Pitches = np.zeros((len(pitches), max([pitch.shape[0] for pitch in pitches])), dtype= np.float32)
+    for index, pitch in enumerate(pitches):
+        stacked_Pitches[index, :pitch.shape[0]] = pitch
+
+    return stacked_Pitches
+
+
+def Source_Features(feature_cache, pattern_dict):
+    '''
+    The mel and pitch of a source pattern. The trimming is same as the pattern generator.
+    '''
+    if not 'Source' in pattern_dict.keys():
+        raise ValueError('The pattern has no source audio. Generate the patterns by \'Pattern_Generator.py -raw\' for the raw audio training.')
+    _, mel, pitch = feature_cache.Get(pattern_dict['Source'], top_db= top_DB_Dict[pattern_dict['Dataset']])
+
+    return mel, pitch
+
+
+class Bucket_Batch_Sampler(torch.utils.data.Sampler):
+    '''
+    Batches of patterns with similar lengths. Every epoch, the indices are shuffled and cut into buckets of bucket_size batches.
+    Each bucket is sorted by the mel length (the text length for ties) and cut into batches, and then the batch order is shuffled.
+    So the batch members and the batch order are still random, but the padding in each batch is small.
+    mel_lengths, text_lengths: the lengths of the metadata in the dataset index order.
+    max_frames, max_area: if not None, a batch is filled until the padded mel frames (Batch * Mel_t) or the padded alignment
+    matrix (Batch * Token_t * Mel_t) would be over the budget, instead of batch_size patterns. A longer pattern than the budget
+    becomes a batch alone. drop_last is only for the fixed batch size.
+    seed: the batches of an epoch are decided by the seed and the epoch only. If None, a random seed is used.
+    infinite: if True, the iterator does not stop at the end of an epoch and continues with the next epoch.
+    The state is the position after the last consumed batch. The DataLoader workers and a prefetcher produce batches before
+    they are used, so the training loop calls Consume() when a batch is really used, and state_dict() is saved with the
+    checkpoint. After load_state_dict(), the next iterator starts at the exact next batch.
+    '''
+    def __init__(
+        self,
+        mel_lengths,
+        text_lengths,
+        batch_size,
+        bucket_size= 32,
+        shuffle= True,
+        drop_last= False,
+        max_frames= None,
+        max_area= None,
+        seed= None,
+        infinite= False
+        ):
+        self.mel_Lengths = np.asarray(mel_lengths, dtype= np.int64)
+        self.text_Lengths = np.asarray(text_lengths, dtype= np.int64)
+        self.batch_Size = batch_size
+        self.bucket_Size = max(bucket_size, 1)
+        self.shuffle = shuffle
+        self.drop_Last = drop_last
+        self.max_Frames = max_frames
+        self.max_Area = max_area
+        self.seed = seed if not seed is None else random.randrange(2 ** 32)
+        self.infinite = infinite
+        self.efficiency_Dict = None
+
+        self.epoch = 0
+        self.position = 0   # The index of the next batch in the epoch.
+        self.produced_Queue = deque()   # (epoch, position) of the batches which are produced but not consumed yet.
+        self.epoch_Batches = None   # (epoch, batches). The last made epoch.
+
+    def Batches(self, epoch):
+        if not self.epoch_Batches is None and self.epoch_Batches[0] == epoch:
+            return self.epoch_Batches[1]
+
+        random_State = np.random.default_rng([self.seed, epoch])
+        if self.shuffle:
+            indices = random_State.permutation(self.mel_Lengths.shape[0])
+        else:
+            indices = np.arange(self.mel_Lengths.shape[0])
+
+        batches = []
+        bucket_Pattern_Count = self.batch_Size * self.bucket_Size
+        for bucket_Start in range(0, indices.shape[0], bucket_Pattern_Count):
+            bucket = indices[bucket_Start:bucket_Start + bucket_Pattern_Count]
+            bucket = bucket[np.lexsort((self.text_Lengths[bucket], self.mel_Lengths[bucket]))].tolist()  # Stable, so ties keep the shuffled order.
+            if self.max_Frames is None and self.max_Area is None:
+                batches.extend([bucket[index:index + self.batch_Size] for index in range(0, len(bucket), self.batch_Size)])
+            else:
+                batches.extend(self.Budget_Batches(bucket))
+
+        if self.max_Frames is None and self.max_Area is None and self.drop_Last and len(batches) > 0 and len(batches[-1]) < self.batch_Size:
+            batches = batches[:-1]  # Only the last bucket can have a short batch.
+        if self.shuffle:
+            batches = [batches[index] for index in random_State.permutation(len(batches))]
+
+        self.epoch_Batches = epoch, batches
+        return batches
+
+    def Budget_Batches(self, bucket):
+        '''
+        The bucket is sorted by the mel length, so the last added pattern has the longest mel in the batch.
+        '''
+        batches = []
+        batch, max_Token_Length = [], 0
+        for index in bucket:
+            mel_Length = int(self.mel_Lengths[index])
+            token_Length = max(max_Token_Length, int(self.text_Lengths[index]) + 2)
+            if len(batch) > 0 and (
+                (not self.max_Frames is None and (len(batch) + 1) * mel_Length > self.max_Frames) or
+                (not self.max_Area is None and (len(batch) + 1) * mel_Length * token_Length > self.max_Area)
+                ):
+                batches.append(batch)
+                batch, token_Length = [], int(self.text_Lengths[index]) + 2
+            batch.append(index)
+            max_Token_Length = token_Length
+        if len(batch) > 0:
+            batches.append(batch)
+
+        return batches
+
+    def Efficiency(self, batches):
+        '''
+        The ratio of the real elements to the padded elements of the mel batch, the token batch (with '<S>' and '<E>')
+        and the [Batch, Token_t, Mel_t] alignment matrix.
+        '''
+        real_Dict = {'Mel': 0, 'Token': 0, 'Alignment': 0}
+        padded_Dict = {'Mel': 0, 'Token': 0, 'Alignment': 0}
+        for batch in batches:
+            mel_Lengths = self.mel_Lengths[batch]
+            token_Lengths = self.text_Lengths[batch] + 2
+            real_Dict['Mel'] += int(mel_Lengths.sum())
+            real_Dict['Token'] += int(token_Lengths.sum())
+            real_Dict['Alignment'] += int((mel_Lengths * token_Lengths).sum())
+            padded_Dict['Mel'] += len(batch) * int(mel_Lengths.max())
+            padded_Dict['Token'] += len(batch) * int(token_Lengths.max())
+            padded_Dict['Alignment'] += len(batch) * int(mel_Lengths.max()) * int(token_Lengths.max())
+
+        return {
+            key: real_Dict[key] / max(padded_Dict[key], 1)
+            for key in real_Dict.keys()
+            }
+
+    def __iter__(self):
+        if not self.infinite:
+            batches = self.Batches(self.epoch)
+            self.efficiency_Dict = self.Efficiency(batches)
+            self.epoch += 1
+            return iter(batches)
+
+        return self.Infinite_Iterate()
+
+    def Infinite_Iterate(self):
+        self.produced_Queue.clear()  # The batches of a previous iterator are not used anymore.
+        epoch, position = self.epoch, self.position
+        while True:
+            batches = self.Batches(epoch)
+            if len(batches) == 0:
+                return
+            if position == 0 or self.efficiency_Dict is None:
+                self.efficiency_Dict = self.Efficiency(batches)
+            for position in range(position, len(batches)):
+                self.produced_Queue.append((epoch, position, len(batches)))
+                yield batches[position]
+            epoch, position = epoch + 1, 0
+
+    def Consume(self):
+        '''
+        Marks the oldest produced batch as used. The DataLoader keeps the sampler order, so it is the batch of the current step.
+        '''
+        epoch, position, epoch_Length = self.produced_Queue.popleft()
+        if position + 1 < epoch_Length:
+            self.epoch, self.position = epoch, position + 1
+        else:
+            self.epoch, self.position = epoch + 1, 0
+
+    def state_dict(self):
+        '''
+        The batches are decided by the seed and the epoch, so the seed is the whole RNG state.
+        '''
+        return {
+            'Seed': self.seed,
+            'Epoch': self.epoch,
+            'Position': self.position,
+            }
+
+    def load_state_dict(self, state_dict):
+        self.seed = state_dict['Seed']
+        self.epoch = state_dict['Epoch']
+        self.position = state_dict['Position']
+        self.produced_Queue.clear()
+        self.epoch_Batches = None
 
-    return pitches
+    def __len__(self):
+        '''
+        The batches of an epoch.
+        '''
+        if self.max_Frames is None and self.max_Area is None:
+            if self.drop_Last:
+                return len(self.mel_Lengths) // self.batch_Size
+            return math.ceil(len(self.mel_Lengths) / self.batch_Size)
 
+        return len(self.Batches(self.epoch))   # Made by the same seed and epoch, so __iter__ reuses it.
 
 
 class Dataset(torch.utils.data.Dataset):
@@ -80,64 +289,92 @@ class Dataset(torch.utils.data.Dataset):
         self,
         pattern_path,
         metadata_file,
-        accumulated_dataset_epoch= 1,
         mel_length_min= -math.inf,
         mel_length_max= math.inf,
         text_length_min= -math.inf,
         text_length_max= math.inf,
-        use_cache = False
+        use_cache = False,
+        use_store = False,
+        pattern_cache= None,
+        feature_cache= None
         ):
+        '''
+        pattern_cache: a Pattern_Cache shared by all workers. If not None, use_cache is ignored.
+        feature_cache: a Feature_Cache. If not None, the patterns are the source patterns of 'Pattern_Generator.py -raw',
+            and the mel and pitch are extracted from the source audio in the workers and cached.
+        '''
         super(Dataset, self).__init__()
 
         self.pattern_Path = pattern_path
         self.use_cache = use_cache
-
-        metadata_Dict = pickle.load(open(
-            os.path.join(pattern_path, metadata_file).replace('\\', '/'),
-            mode= 'rb'
-            ))
-            
-        self.file_List = [
-            x for x in metadata_Dict['File_List']
-            if all([
-                metadata_Dict['Mel_Length_Dict'][x] >= mel_length_min,
-                metadata_Dict['Mel_Length_Dict'][x] <= mel_length_max,
-                metadata_Dict['Text_Length_Dict'][x] >= text_length_min,
-                metadata_Dict['Text_Length_Dict'][x] <= text_length_max
-                ])
-            ]
-        self.base_Length = len(self.file_List)
-        self.file_List *= accumulated_dataset_epoch
+        self.pattern_Cache = pattern_cache
+        self.feature_Cache = feature_cache
+        self.store = Shard_Reader(Store_Path(pattern_path)) if use_store else None
+
+        # The file paths are decoded from the metadata when they are loaded, so no list of paths is copied to the workers.
+        self.metadata = Metadata(os.path.join(pattern_path, metadata_file).replace('\\', '/'))
+        self.indices = self.metadata.Filter(
+            mel_length_min= mel_length_min,
+            mel_length_max= mel_length_max,
+            text_length_min= text_length_min,
+            text_length_max= text_length_max
+            )
+        self.mel_Length_List = self.metadata.records['Mel_Length'][self.indices]   # For the bucket batch sampler.
+        self.text_Length_List = self.metadata.records['Text_Length'][self.indices]
             
         self.cache_Dict = {}
 
     def __getitem__(self, idx):
-        if (idx % self.base_Length) in self.cache_Dict.keys():
-            return self.cache_Dict[idx % self.base_Length]
+        if idx in self.cache_Dict.keys():
+            return self.cache_Dict[idx]
 
-        file = self.file_List[idx]
-        path = os.path.join(self.pattern_Path, file).replace('\\', '/')
-        pattern_Dict = pickle.load(open(path, 'rb'))
-        pattern = Text_to_Token(pattern_Dict['Text']), pattern_Dict['Mel'], pattern_Dict['Speaker_ID'], pattern_Dict['Pitch']
+        file = self.metadata.File(self.indices[idx])
+        cache_Key = 'Dataset:{}/{}'.format(self.pattern_Path, file)
+        if not self.pattern_Cache is None:
+            pattern = self.pattern_Cache.Get(cache_Key)
+            if not pattern is None:
+                return pattern
 
-        if self.use_cache:
-            self.cache_Dict[idx % self.base_Length] = pattern
+        fields = ('Text', 'Token', 'Token_Dict_Hash', 'Mel', 'Speaker_ID', 'Pitch', 'Source', 'Dataset')
+        if not self.store is None:
+            pattern_Dict = self.store.Load(file, fields= fields)
+        else:
+            path = os.path.join(self.pattern_Path, file).replace('\\', '/')
+            pattern_Dict = Pattern_Load(path, fields= fields)
+        if pattern_Dict.get('Token_Dict_Hash') == text_Frontend.Hash():
+            token = pattern_Dict['Token']
+        else:   # The patterns of an older version or of another token dict.
+            token = Text_to_Token(pattern_Dict['Text'])
+        if not self.feature_Cache is None:
+            pattern_Dict['Mel'], pattern_Dict['Pitch'] = Source_Features(self.feature_Cache, pattern_Dict)
+        pattern = token, pattern_Dict['Mel'], pattern_Dict['Speaker_ID'], pattern_Dict['Pitch']
+
+        if not self.pattern_Cache is None:
+            self.pattern_Cache.Put(cache_Key, pattern)
+        elif self.use_cache:
+            self.cache_Dict[idx] = pattern
         
         return pattern
 
     def __len__(self):
-        return len(self.file_List)
+        return self.indices.shape[0]
 
 class Inference_Dataset(torch.utils.data.Dataset):
     def __init__(self, pattern_path, use_cache = False):
         super(Inference_Dataset, self).__init__()
         self.use_cache = use_cache
+        self.feature_Cache = Feature_Cache(
+            cache_path= hp.Feature_Cache.Path,
+            max_disk_size= hp.Feature_Cache.Max_Disk_Size,
+            max_memory_items= hp.Feature_Cache.Max_Memory_Items
+            )
 
-        self.pattern_List = []
-        for index, line in enumerate(open(pattern_path, 'r').readlines()[1:]):
-            label, text, length_Scale, speaker, wav_for_GE2E, wav_for_Prosody, wav_for_Pitch = [x.strip() for x in line.strip().split('\t')]
+        lines = [[x.strip() for x in line.strip().split('\t')] for line in open(pattern_path, 'r').readlines()[1:]]
+        texts = text_Frontend.Filter_Batch([line[1] for line in lines])    # All texts are normalized and tokenized once.
+        self.token_List = text_Frontend.Tokenize_Batch(texts)
 
-            text = Text_Filtering(text)
+        self.pattern_List = []
+        for (label, _, length_Scale, speaker, wav_for_GE2E, wav_for_Prosody, wav_for_Pitch), text in zip(lines, texts):
             length_Scale = float(length_Scale)
             speaker = int(speaker)
 
@@ -150,11 +387,11 @@ class Inference_Dataset(torch.utils.data.Dataset):
             return self.cache_Dict[idx]
 
         label, text, length_Scale, speaker, wav_for_GE2E, wav_for_Prosody, wav_for_Pitch = self.pattern_List[idx]
-        token = Text_to_Token(text)
+        token = self.token_List[idx]
 
-        _, mel_for_GE2E, _ = Pattern_Generate(wav_for_GE2E, top_db= 30)
-        _, mel_for_Prosody, _ = Pattern_Generate(wav_for_Prosody, top_db= 30)
-        _, _, pitch = Pattern_Generate(wav_for_Pitch, top_db= 30)
+        _, mel_for_GE2E, _ = self.feature_Cache.Get(wav_for_GE2E, top_db= 30)
+        _, mel_for_Prosody, _ = self.feature_Cache.Get(wav_for_Prosody, top_db= 30)
+        _, _, pitch = self.feature_Cache.Get(wav_for_Pitch, top_db= 30)
         pattern = token, length_Scale, speaker, mel_for_GE2E, mel_for_Prosody, pitch, label, text
 
         if self.use_cache:
@@ -174,7 +411,10 @@ class Prosody_Check_Dataset(torch.utils.data.Dataset):
         sample_per_speaker= 100,
         mel_length_min= -math.inf,
         mel_length_max= math.inf,
-        use_cache = False
+        use_cache = False,
+        use_store = False,
+        pattern_cache= None,
+        feature_cache= None
         ):
         if check_speakers > 50:
             logging.warn('Maximum number of color labels in TensorBoard is 50. The visualization may be restricted.')
@@ -182,24 +422,23 @@ class Prosody_Check_Dataset(torch.utils.data.Dataset):
 
         self.pattern_Path = pattern_path
         self.use_cache = use_cache
-
-        metadata_Dict = pickle.load(open(
-            os.path.join(pattern_path, metadata_file).replace('\\', '/'),
-            mode= 'rb'
-            ))
-
-        self.file_List = [
-            file
-            for file_List in sample(
-                list(metadata_Dict['File_List_by_Speaker_Dict'].values()),
-                min(check_speakers, len(metadata_Dict['File_List_by_Speaker_Dict']))
+        self.pattern_Cache = pattern_cache
+        self.feature_Cache = feature_cache
+        self.store = Shard_Reader(Store_Path(pattern_path)) if use_store else None
+
+        metadata = Metadata(os.path.join(pattern_path, metadata_file).replace('\\', '/'))
+        indices_by_Speaker = metadata.Indices_by_Speaker()
+        mel_Lengths = metadata.records['Mel_Length']
+
+        self.file_List = metadata.Files([
+            index
+            for indices in sample(
+                list(indices_by_Speaker.values()),
+                min(check_speakers, len(indices_by_Speaker))
                 )
-            for file in sample(file_List, sample_per_speaker)
-            if all([
-                metadata_Dict['Mel_Length_Dict'][file] >= mel_length_min,
-                metadata_Dict['Mel_Length_Dict'][file] <= mel_length_max
-                ])
-            ]
+            for index in sample(indices.tolist(), sample_per_speaker)
+            if mel_Lengths[index] >= mel_length_min and mel_Lengths[index] <= mel_length_max
+            ])
             
         self.cache_Dict = {}
 
@@ -208,11 +447,25 @@ class Prosody_Check_Dataset(torch.utils.data.Dataset):
             return self.cache_Dict[idx]
 
         file = self.file_List[idx]
-        path = os.path.join(self.pattern_Path, file).replace('\\', '/')
-        pattern_Dict = pickle.load(open(path, 'rb'))
+        cache_Key = 'Prosody_Check_Dataset:{}/{}'.format(self.pattern_Path, file)
+        if not self.pattern_Cache is None:
+            pattern = self.pattern_Cache.Get(cache_Key)
+            if not pattern is None:
+                return pattern
+
+        fields = ('Mel', 'Speaker', 'Source', 'Dataset')
+        if not self.store is None:
+            pattern_Dict = self.store.Load(file, fields= fields)
+        else:
+            path = os.path.join(self.pattern_Path, file).replace('\\', '/')
+            pattern_Dict = Pattern_Load(path, fields= fields)
+        if not self.feature_Cache is None:
+            pattern_Dict['Mel'], _ = Source_Features(self.feature_Cache, pattern_Dict)
         pattern = pattern_Dict['Mel'], pattern_Dict['Speaker']
 
-        if self.use_cache:
+        if not self.pattern_Cache is None:
+            self.pattern_Cache.Put(cache_Key, pattern)
+        elif self.use_cache:
             self.cache_Dict[idx] = pattern
         
         return pattern
@@ -239,13 +492,13 @@ class Collater:
         mels_for_GE2E = Mel_for_GE2E_Stack(mels_for_GE2E)
         pitches = Pitch_Stack(pitches)
         
-        tokens = torch.LongTensor(tokens)   # [Batch, Time]
+        tokens = torch.from_numpy(tokens)   # [Batch, Time]
         token_Lengths = torch.LongTensor(token_Lengths)   # [Batch]
-        mels = torch.FloatTensor(mels).transpose(2, 1)   # [Batch, Mel_dim, Time]
+        mels = torch.from_numpy(mels)   # [Batch, Mel_dim, Time]
         mel_Lengths = torch.LongTensor(mel_Lengths)   # [Batch]        
         speakers = torch.LongTensor(speakers)
-        mels_for_GE2E = torch.FloatTensor(mels_for_GE2E).transpose(2, 1)   # [Batch, Mel_dim, Time]
-        pitches = torch.FloatTensor(pitches)    # [Batch, Time] Mel_t == Pitch_t
+        mels_for_GE2E = torch.from_numpy(mels_for_GE2E)   # [Batch, Mel_dim, Time]
+        pitches = torch.from_numpy(pitches)    # [Batch, Time] Mel_t == Pitch_t
 
         return tokens, token_Lengths, mels, mel_Lengths, speakers, mels_for_GE2E, pitches
 
@@ -262,13 +515,13 @@ class Inference_Collater:
         mels_for_GE2E = Mel_for_GE2E_Stack(mels_for_GE2E)
         pitches = Pitch_Stack(pitches)
 
-        tokens = torch.LongTensor(tokens)   # [Batch, Time]
+        tokens = torch.from_numpy(tokens)   # [Batch, Time]
         token_Lengths = torch.LongTensor(token_Lengths)   # [Batch]
-        mels_for_Prosody = torch.FloatTensor(mels_for_Prosody).transpose(2, 1)   # [Batch, Mel_dim, Time]
+        mels_for_Prosody = torch.from_numpy(mels_for_Prosody)   # [Batch, Mel_dim, Time]
         mel_Lengths_for_Prosody = torch.LongTensor(mel_Lengths_for_Prosody)   # [Batch]
         speakers = torch.LongTensor(speakers)   # [Batch]
-        mels_for_GE2E = torch.FloatTensor(mels_for_GE2E).transpose(2, 1)   # [Batch, Mel_dim, Time]
-        pitches = torch.FloatTensor(pitches)    # [Batch, Time]
+        mels_for_GE2E = torch.from_numpy(mels_for_GE2E)   # [Batch, Mel_dim, Time]
+        pitches = torch.from_numpy(pitches)    # [Batch, Time]
         pitch_Lengths = torch.LongTensor(pitch_Lengths)   # [Batch]
         length_Scales = torch.FloatTensor(length_Scales)    # [Batch]
         
@@ -281,7 +534,7 @@ class Prosody_Check_Collater:
         mel_Lengths = [mel.shape[0] for mel in mels]
         mels = Mel_Stack(mels)
         
-        mels = torch.FloatTensor(mels).transpose(2, 1)   # [Batch, Mel_dim, Time]
+        mels = torch.from_numpy(mels)   # [Batch, Mel_dim, Time]
         mel_Lengths = torch.LongTensor(mel_Lengths)   # [Batch]
         
         return mels, mel_Lengths, labels
@@ -0,0 +1,151 @@
+import yaml, os, pickle, hashlib, uuid
+import multiprocessing as mp
+from collections import OrderedDict
+
+from Pattern_Generator import Pattern_Generate, Pattern_Generate_Stream, Source_Length
+
+from Arg_Parser import Recursive_Parse
+hp = Recursive_Parse(yaml.load(
+    open('Hyper_Parameters.yaml', encoding='utf-8'),
+    Loader=yaml.Loader
+    ))
+
+class Feature_Cache:
+    '''
+    Memory and disk cache of the reference wav features (audio length, mel, pitch).
+    The key is the hash of the file content, the 'Sound' hyper parameters and top_db, so a moved or copied file is still a hit
+    and a changed file or changed sound parameters is a miss.
+    The memory cache keeps the last max_memory_items features. The disk cache removes the least recently used files
+    when it is larger than max_disk_size MB. If cache_path is None, only the memory cache is used.
+    shared: if True, the statistics and the disk size are shared memory counters, so the DataLoader workers which have
+    copies of the cache count together and the main process can read them by Stats().
+    stream_seconds: a file longer than this by its header is extracted by blocks, so the memory does not grow with the length.
+    A shorter file is extracted at once, which reads the file once instead of twice.
+    '''
+    stat_Keys = ('Memory_Hit', 'Disk_Hit', 'Miss', 'Disk_Size')
+
+    def __init__(self, cache_path= None, max_disk_size= 1024, max_memory_items= 64, shared= False, stream_seconds= 60):
+        self.cache_Path = cache_path
+        self.max_Disk_Size = max_disk_size * 1024 ** 2
+        self.max_Memory_Items = max_memory_items
+        self.shared = shared
+        self.stream_Length = stream_seconds * hp.Sound.Sample_Rate
+
+        self.sound_Key = repr(sorted(vars(hp.Sound).items()))
+        self.digest_Dict = {}   # (path, size, mtime) -> content hash. A file is hashed once while it is not changed.
+        self.memory_Dict = OrderedDict()
+        self.stat_Array = mp.Array('q', len(self.stat_Keys)) if shared else [0] * len(self.stat_Keys)
+
+        if not self.cache_Path is None:
+            os.makedirs(self.cache_Path, exist_ok= True)
+            self.Evict()    # The current disk size is counted, and the cache is reduced if the limit was lowered.
+
+    def Count(self, key, value= 1, reset= False):
+        index = self.stat_Keys.index(key)
+        if not self.shared:
+            self.stat_Array[index] = value if reset else self.stat_Array[index] + value
+            return
+        with self.stat_Array.get_lock():
+            self.stat_Array[index] = value if reset else self.stat_Array[index] + value
+
+    def Stats(self):
+        return dict(zip(self.stat_Keys, self.stat_Array[:]))
+
+    def Content_Digest(self, path):
+        stat = os.stat(path)
+        stat_Key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        if not stat_Key in self.digest_Dict.keys():
+            hasher = hashlib.sha1()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(2 ** 20), b''):
+                    hasher.update(block)
+            self.digest_Dict[stat_Key] = hasher.hexdigest()
+
+        return self.digest_Dict[stat_Key]
+
+    def Key(self, path, top_db):
+        return hashlib.sha1('{}\t{}\t{}'.format(self.Content_Digest(path), self.sound_Key, top_db).encode('utf-8')).hexdigest().upper()
+
+    def File(self, key):
+        return os.path.join(self.cache_Path, '{}.PICKLE'.format(key)).replace('\\', '/')
+
+    def Get(self, path, top_db= 60):
+        '''
+        Same return as 'Pattern_Generate_Stream': audio length, mel and pitch.
+        '''
+        key = self.Key(path, top_db)
+        if key in self.memory_Dict.keys():
+            self.memory_Dict.move_to_end(key)
+            self.Count('Memory_Hit')
+            return self.memory_Dict[key]
+
+        features = self.Disk_Load(key)
+        if features is None:
+            self.Count('Miss')
+            features = self.Extract(path, top_db)
+            self.Disk_Save(key, features)
+        else:
+            self.Count('Disk_Hit')
+
+        self.memory_Dict[key] = features
+        while len(self.memory_Dict) > self.max_Memory_Items:
+            self.memory_Dict.popitem(last= False)
+
+        return features
+
+    def Extract(self, path, top_db= 60):
+        if Source_Length(path) > self.stream_Length:
+            return Pattern_Generate_Stream(path, top_db)
+
+        audio, mel, pitch = Pattern_Generate(path, top_db)
+        return audio.shape[0], mel.astype('float32'), pitch
+
+    def Disk_Load(self, key):
+        if self.cache_Path is None:
+            return None
+        try:
+            with open(self.File(key), 'rb') as f:
+                features = pickle.load(f)
+            os.utime(self.File(key))    # The modified time is the last used time for the eviction.
+            return features
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def Disk_Save(self, key, features):
+        if self.cache_Path is None:
+            return
+
+        # DataLoader workers can write the same key at once, so the file is moved to its name after writing.
+        temp_File = os.path.join(self.cache_Path, '{}.TEMP'.format(uuid.uuid4().hex.upper())).replace('\\', '/')
+        with open(temp_File, 'wb') as f:
+            pickle.dump(features, f, protocol= 4)
+        size = os.path.getsize(temp_File)
+        os.replace(temp_File, self.File(key))
+
+        # The directory is scanned only when the counted size is over the limit. Overwriting the same key is counted twice,
+        # but the next scan corrects it.
+        self.Count('Disk_Size', size)
+        if self.Stats()['Disk_Size'] > self.max_Disk_Size:
+            self.Evict()
+
+    def Evict(self):
+        files = []
+        for entry in os.scandir(self.cache_Path):
+            if not entry.name.endswith('.PICKLE'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue    # Removed by another worker.
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_Size = sum([size for _, size, _ in files])
+        for _, size, file in sorted(files):
+            if total_Size <= self.max_Disk_Size:
+                break
+            try:
+                os.remove(file)
+            except OSError:
+                pass
+            total_Size -= size
+        self.Count('Disk_Size', total_Size, reset= True)
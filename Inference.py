@@ -8,10 +8,11 @@ import matplotlib.pyplot as plt
 from scipy.io import wavfile
 from random import sample
 
-from Modules import GlowTTS
-from Datasets import Text_to_Token, Token_Stack, Mel_Stack, Mel_for_GE2E_Stack, Pitch_Stack
+from Modules import GlowTTS, Autocast
+from Datasets import text_Frontend, Token_Stack, Mel_Stack, Mel_for_GE2E_Stack, Pitch_Stack
 
-from Pattern_Generator import Pattern_Generate, Text_Filtering
+from Feature_Cache import Feature_Cache
+from Prosody_Index import Prosody_Index, Encoder_Hash
 
 from Speaker_Embedding.Modules import Encoder as Speaker_Embedding, Normalize
 
@@ -36,45 +37,43 @@ logging.basicConfig(
     format= '%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s'
     )
 
-if hp.Use_Mixed_Precision:
-    try:
-        from apex import amp
-    except:
-        logging.info('There is no apex modules in the environment. Mixed precision does not work.')
-        hp.Use_Mixed_Precision = False
-
 
 class Dataset(torch.utils.data.Dataset):
-    def __init__(self, labels, texts, scales, speakers= None, references= None):
+    def __init__(self, labels, texts, scales, speakers= None, references= None, prosodies= None):
         super(Dataset, self).__init__()
         speakers = speakers or [None] * len(texts)
         references = references or [None] * len(texts)
-
-        self.patterns = [x for x in zip(labels, texts, scales, speakers, references)]
+        prosodies = prosodies or [None] * len(texts)
+
+        texts = text_Frontend.Filter_Batch(texts)
+        tokens = text_Frontend.Tokenize_Batch(texts)   # All texts are normalized and tokenized once.
+        self.patterns = [x for x in zip(labels, texts, tokens, scales, speakers, references, prosodies)]
+        self.feature_Cache = Feature_Cache(
+            cache_path= hp.Feature_Cache.Path,
+            max_disk_size= hp.Feature_Cache.Max_Disk_Size,
+            max_memory_items= hp.Feature_Cache.Max_Memory_Items
+            )
 
     def __getitem__(self, idx):
-        label, text, scale, speaker, reference = self.patterns[idx]
-        
-        text = Text_Filtering(text)
-        token = Text_to_Token(text)
+        label, text, token, scale, speaker, reference, prosody = self.patterns[idx]
 
         if not reference is None:
-            _, reference, pitch = Pattern_Generate(reference, top_db= 30)
+            _, reference, pitch = self.feature_Cache.Get(reference, top_db= 30)
         else:
             pitch = None
 
-        return token, scale, speaker, reference, pitch, label, text
+        return token, scale, speaker, reference, pitch, prosody, label, text
 
     def __len__(self):
         return len(self.patterns)
 
 class Collater:
     def __call__(self, batch):
-        tokens, scales, speakers, references, pitches, labels, texts = zip(*batch)
+        tokens, scales, speakers, references, pitches, prosody_Vectors, labels, texts = zip(*batch)
         
         token_Lengths = [token.shape[0] for token in tokens]
         tokens = Token_Stack(tokens)
-        tokens = torch.LongTensor(tokens)   # [Batch, Time]
+        tokens = torch.from_numpy(tokens)   # [Batch, Time]
         token_Lengths = torch.LongTensor(token_Lengths)   # [Batch]
 
         scales = torch.FloatTensor(scales)    # [Batch]
@@ -90,14 +89,14 @@ class Collater:
             pitch_Lengths = [pitch.shape[0] for pitch in pitches]
 
             prosodies = Mel_Stack(references)
-            prosodies = torch.FloatTensor(prosodies).transpose(2, 1)   # [Batch, Mel_dim, Time]
+            prosodies = torch.from_numpy(prosodies)   # [Batch, Mel_dim, Time]
             prosody_Lengths = torch.LongTensor(prosody_Lengths)   # [Batch]
 
             ge2es = Mel_for_GE2E_Stack(references)
-            ge2es = torch.FloatTensor(ge2es).transpose(2, 1)   # [Batch, Mel_dim, Time]
+            ge2es = torch.from_numpy(ge2es)   # [Batch, Mel_dim, Time]
             
             pitches = Pitch_Stack(pitches)
-            pitches = torch.FloatTensor(pitches)    # [Batch, Time]
+            pitches = torch.from_numpy(pitches)    # [Batch, Time]
             pitch_Lengths = torch.LongTensor(pitch_Lengths)   # [Batch]
 
         if any([(x is None) for x in speakers]):
@@ -105,13 +104,28 @@ class Collater:
         else:
             speakers = torch.LongTensor(speakers)   # [Batch]
 
-        return tokens, token_Lengths, prosodies, prosody_Lengths, speakers, ge2es, pitches, pitch_Lengths, scales, labels, texts
+        if all([(x is None) for x in prosody_Vectors]):
+            prosody_Vectors = None
+        elif any([(x is None) for x in prosody_Vectors]):
+            raise ValueError('The prosodies must be given for all texts or for none of them.')
+        else:
+            prosody_Vectors = torch.from_numpy(np.stack(prosody_Vectors).astype(np.float32))  # [Batch, Prosody_dim]
+
+        return tokens, token_Lengths, prosodies, prosody_Lengths, speakers, ge2es, pitches, pitch_Lengths, prosody_Vectors, scales, labels, texts
 
 
 class Inferencer:
-    def __init__(self, checkpoint_path):
+    def __init__(self, checkpoint_path, prosody_index_path= None):
+        '''
+        prosody_index_path: the prosody index made by Prosody_Index.py. If not None, the prosodies can be picked from the index.
+        '''
         self.Model_Generate()
         self.Load_Checkpoint(checkpoint_path)
+        self.prosody_Index = Prosody_Index(prosody_index_path) if not prosody_index_path is None else None
+        if not self.prosody_Index is None and \
+            'Prosody_Encoder' in self.model_Dict['GlowTTS'].layer_Dict.keys() and \
+            self.prosody_Index.header_Dict['Encoder_Hash'] != Encoder_Hash(self.model_Dict['GlowTTS'].layer_Dict['Prosody_Encoder']):
+            logging.warning('The prosody index \'{}\' was made by another checkpoint.'.format(prosody_index_path))
 
     def Model_Generate(self):
         self.model_Dict = {
@@ -126,17 +140,12 @@ class Inferencer:
                 embedding_size= hp.Speaker_Embedding.Embedding_Size,
                 ).to(device)
 
-        if hp.Use_Mixed_Precision:
-            self.model_Dict['GlowTTS'] = amp.initialize(
-                models= self.model_Dict['GlowTTS']
-                )
-
         for model in self.model_Dict.values():
             model.eval()
 
 
     @torch.no_grad()
-    def Inference_Step(self, tokens, token_lengths, prosodies, prosody_lengths, speakers, ge2es, pitches, pitch_lengths, length_scales, labels, texts, start_index= 0, tag_index= False, inference_path= './inference'):
+    def Inference_Step(self, tokens, token_lengths, prosodies, prosody_lengths, speakers, ge2es, pitches, pitch_lengths, prosody_vectors, length_scales, labels, texts, start_index= 0, tag_index= False, inference_path= './inference'):
         tokens = tokens.to(device)
         token_lengths = token_lengths.to(device)
         
@@ -146,20 +155,23 @@ class Inferencer:
         ge2es = ge2es if ge2es is None else ge2es.to(device)
         pitches = pitches if pitches is None else pitches.to(device)
         pitch_lengths = pitch_lengths if pitch_lengths is None else pitch_lengths.to(device)
+        prosody_vectors = prosody_vectors if prosody_vectors is None else prosody_vectors.to(device)
 
         length_scales = length_scales.to(device)
 
-        mels, mel_Lengths, attentions = self.model_Dict['GlowTTS'].inference(
-            tokens= tokens,
-            token_lengths= token_lengths,
-            mels_for_prosody= prosodies,
-            mel_lengths_for_prosody= prosody_lengths,
-            speakers= speakers,
-            mels_for_ge2e= ge2es,
-            pitches= pitches,
-            pitch_lengths= pitch_lengths,
-            length_scale= length_scales
-            )
+        with Autocast(device):
+            mels, mel_Lengths, attentions = self.model_Dict['GlowTTS'].inference(
+                tokens= tokens,
+                token_lengths= token_lengths,
+                mels_for_prosody= prosodies,
+                mel_lengths_for_prosody= prosody_lengths,
+                speakers= speakers,
+                mels_for_ge2e= ge2es,
+                pitches= pitches,
+                pitch_lengths= pitch_lengths,
+                length_scale= length_scales,
+                prosodies= prosody_vectors
+                )
 
         files = []
         for index, label in enumerate(labels):
@@ -229,16 +241,34 @@ class Inferencer:
         scales,
         speakers= None,
         references= None,
+        prosodies= None,
         inference_path= './inference'
         ):
+        '''
+        prosodies: the ID or the pattern file in the prosody index, or a prosody vector, for each text.
+            If not None, the prosody encoder is not used, and the references are used only for the speaker embedding and the pitch.
+            The IDs of the similar prosodies can be found by 'self.prosody_Index.Search(vector, k)'.
+            The prosodies must be given for all texts. A None prosody is not replaced by the prosody encoder.
+        '''
         logging.info('Start inference.')
+        if not prosodies is None:
+            if any([(x is None) for x in prosodies]):
+                raise ValueError('The prosodies must be given for all texts or for none of them. {} of {} prosodies are None.'.format(
+                    sum([(x is None) for x in prosodies]),
+                    len(prosodies)
+                    ))
+            prosodies = [
+                self.prosody_Index.Get(prosody) if isinstance(prosody, (int, np.integer, str)) else prosody
+                for prosody in prosodies
+                ]
         dataLoader = torch.utils.data.DataLoader(
             dataset= Dataset(
                 labels= labels,
                 texts= texts,
                 scales= scales,
                 speakers= speakers,
-                references= references
+                references= references,
+                prosodies= prosodies
                 ),
             shuffle= False,
             collate_fn= Collater(),
@@ -248,22 +278,16 @@ class Inferencer:
             )
         logging.info('The number of inference patterns = {}.'.format(len(dataLoader.dataset)))
 
-        for step, (tokens, token_Lengths, prosodies, prosody_Lengths, speakers, ge2es, pitches, pitch_Lengths, scales, labels, texts) in tqdm(
+        for step, (tokens, token_Lengths, prosodies, prosody_Lengths, speakers, ge2es, pitches, pitch_Lengths, prosody_Vectors, scales, labels, texts) in tqdm(
             enumerate(dataLoader),
             desc='[Inference]',
             total= math.ceil(len(dataLoader.dataset) / (hp.Inference_Batch_Size or hp.Train.Batch_Size))
             ):
-            self.Inference_Step(tokens, token_Lengths, prosodies, prosody_Lengths, speakers, ge2es, pitches, pitch_Lengths, scales, labels, texts, start_index= step * (hp.Inference_Batch_Size or hp.Train.Batch_Size), inference_path= inference_path)
+            self.Inference_Step(tokens, token_Lengths, prosodies, prosody_Lengths, speakers, ge2es, pitches, pitch_Lengths, prosody_Vectors, scales, labels, texts, start_index= step * (hp.Inference_Batch_Size or hp.Train.Batch_Size), inference_path= inference_path)
 
     def Load_Checkpoint(self, checkpoint_path):
         state_Dict = torch.load(checkpoint_path, map_location= 'cpu')
         self.model_Dict['GlowTTS'].load_state_dict(state_Dict['Model'])
-        
-        if hp.Use_Mixed_Precision:
-            if not 'AMP' in state_Dict.keys():
-                logging.info('No AMP state dict is in the checkpoint. Model regards this checkpoint is trained without mixed precision.')
-            else:                
-                amp.load_state_dict(state_Dict['AMP'])
 
         for flow in self.model_Dict['GlowTTS'].layer_Dict['Decoder'].layer_Dict['Flows']:
             flow.layers[0].initialized = True   # Activation_Norm is already initialized when checkpoint is loaded.
@@ -15,6 +15,18 @@ class Logger(SummaryWriter):
                 )
         self.flush()
 
+    def add_latency_dict(self, latency_dict, global_step= None, walltime= None, prefix= 'Latency'):
+        '''
+        latency_dict: {tag: latencies in ms}, e.g. 'Profiler.Collect()'.
+        The latencies are written as histograms and the mean, median and 95th percentile as scalars.
+        '''
+        for tag, latencies in latency_dict.items():
+            tag = '{}/{}'.format(prefix, tag)
+            self.add_histogram(tag= tag, values= latencies, global_step= global_step, walltime= walltime)
+            for name, value in [('Mean', np.mean(latencies)), ('P50', np.percentile(latencies, 50)), ('P95', np.percentile(latencies, 95))]:
+                self.add_scalar(tag= '{}/{}'.format(tag, name), scalar_value= value, global_step= global_step, walltime= walltime)
+        self.flush()
+
     def add_image_dict(self, image_dict, global_step, walltime= None):
         for tag, (data, limit) in image_dict.items():
             fig= plt.figure(figsize=(10, 5), dpi= 100)
@@ -0,0 +1,264 @@
+import numpy as np
+import os, pickle, math, glob, uuid
+
+# The columns of the metadata. 'Directory', 'Speaker' and 'Dataset' are the indices of the interned string tables.
+# 'Text_Length' is -1 when the metadata is generated without the text.
+record_Dtype = np.dtype([
+    ('Directory', np.int32),
+    ('Audio_Length', np.int64),
+    ('Mel_Length', np.int32),
+    ('Pitch_Length', np.int32),
+    ('Text_Length', np.int32),
+    ('Speaker_ID', np.int32),
+    ('Speaker', np.int32),
+    ('Dataset', np.int32),
+    ])
+column_Files = ('RECORDS', 'NAMES', 'NAME_OFFSETS')
+header_Keys = ('Spectrogram_Dim', 'Mel_Dim', 'Frame_Shift', 'Frame_Length', 'Sample_Rate', 'Max_Abs_Mel')
+
+def Column_Path(metadata_path, column, version= None):
+    '''
+    The columns are saved next to the metadata pickle as '<Metadata>.<COLUMN>.<VERSION>.NPY'.
+    The header has the version of its columns. The columns of an older metadata have no version.
+    '''
+    if version is None:
+        return '{}.{}.NPY'.format(os.path.splitext(metadata_path)[0], column)
+    return '{}.{}.{}.NPY'.format(os.path.splitext(metadata_path)[0], column, version)
+
+class Metadata_Builder:
+    '''
+    Collects the records of the patterns and writes the columnar metadata.
+    header_dict: the sound parameters. These are compared when the metadata is reused.
+    '''
+    def __init__(self, header_dict, use_text= False):
+        self.header_Dict = dict(header_dict)
+        self.use_Text = use_text
+        self.table_Dict = {'Directory': {}, 'Speaker': {}, 'Dataset': {}}
+        self.names = []
+        self.rows = []
+
+    def Intern(self, table, value):
+        table_Dict = self.table_Dict[table]
+        if not value in table_Dict.keys():
+            table_Dict[value] = len(table_Dict)
+        return table_Dict[value]
+
+    def Add(self, file, record):
+        '''
+        record: '<Field>_Length' of the arrays, 'Speaker_ID', 'Speaker', 'Dataset' and 'Text_Length' or 'Text' (only when use_text).
+        '''
+        directory, name = os.path.split(file)
+        if self.use_Text:
+            text_Length = record['Text_Length'] if 'Text_Length' in record.keys() else len(record['Text'])
+        else:
+            text_Length = -1
+        self.names.append(name)
+        self.rows.append((
+            self.Intern('Directory', directory),
+            record['Audio_Length'],
+            record['Mel_Length'],
+            record['Pitch_Length'],
+            text_Length,
+            record['Speaker_ID'],
+            self.Intern('Speaker', record['Speaker']),
+            self.Intern('Dataset', record['Dataset']),
+            ))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def Columns(self):
+        '''
+        return: the header dict and {column: array}
+        '''
+        name_Bytes = [name.encode('utf-8') for name in self.names]
+        column_Dict = {
+            'RECORDS': np.array(self.rows, dtype= record_Dtype),
+            'NAMES': np.frombuffer(b''.join(name_Bytes), dtype= np.uint8),
+            'NAME_OFFSETS': np.cumsum([0] + [len(name) for name in name_Bytes], dtype= np.int64),
+            }
+        header_Dict = dict(self.header_Dict)
+        header_Dict.update({
+            'Format': 'Columnar',
+            'Use_Text': self.use_Text,
+            'Directories': list(self.table_Dict['Directory'].keys()),
+            'Speakers': list(self.table_Dict['Speaker'].keys()),
+            'Datasets': list(self.table_Dict['Dataset'].keys()),
+            })
+
+        return header_Dict, column_Dict
+
+    def Write(self, metadata_path):
+        '''
+        The columns are written under a new version, and the header which has the version replaces the older header last.
+        So a reader loads the older or the new metadata, never a mix of them.
+        The older columns are removed after that. A mapped file stays valid after it is removed,
+        but it cannot be removed on Windows, so such a file is left until a later write.
+        '''
+        header_Dict, column_Dict = self.Columns()
+        header_Dict['Column_Version'] = uuid.uuid4().hex
+        for column, array in column_Dict.items():
+            with open(Column_Path(metadata_path, column, header_Dict['Column_Version']), 'wb') as f:
+                np.save(f, array, allow_pickle= False)
+        with open('{}.TMP'.format(metadata_path), 'wb') as f:
+            pickle.dump(header_Dict, f, protocol= 4)
+        os.replace('{}.TMP'.format(metadata_path), metadata_path)
+
+        for column in column_Files:
+            current_File = os.path.basename(Column_Path(metadata_path, column, header_Dict['Column_Version']))
+            for path in glob.glob(Column_Path(glob.escape(metadata_path), column, '*')) + [Column_Path(metadata_path, column)]:
+                if os.path.basename(path) == current_File:
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+class Metadata:
+    '''
+    The columnar metadata. The records are a numpy structured array and the file paths are an interned table,
+    so no Python object is made per pattern. The columns are memory mapped, so the DataLoader workers share the pages.
+    The dict metadata of an older version is converted when it is loaded.
+    '''
+    def __init__(self, metadata_path, mmap= True):
+        self.metadata_Path = metadata_path
+        self.mmap = mmap
+        self.Load()
+
+    def Load(self):
+        with open(self.metadata_Path, 'rb') as f:
+            header_Dict = pickle.load(f)
+
+        if header_Dict.get('Format') != 'Columnar':
+            self.mmap = False   # There is no column file to map.
+            builder = Metadata_Builder(
+                {key: header_Dict[key] for key in header_Keys if key in header_Dict.keys()},
+                use_text= 'Text_Length_Dict' in header_Dict.keys()
+                )
+            for file in header_Dict['File_List']:
+                builder.Add(file, {
+                    'Audio_Length': header_Dict['Audio_Length_Dict'][file],
+                    'Mel_Length': header_Dict['Mel_Length_Dict'][file],
+                    'Pitch_Length': header_Dict['Pitch_Length_Dict'][file],
+                    'Speaker_ID': header_Dict['Speaker_ID_Dict'][file],
+                    'Speaker': header_Dict['Speaker_Dict'][file],
+                    'Dataset': header_Dict['Dataset_Dict'][file],
+                    'Text_Length': header_Dict['Text_Length_Dict'][file] if builder.use_Text else -1
+                    })
+            header_Dict, column_Dict = builder.Columns()
+            self.records, self.names, self.name_Offsets = [column_Dict[column] for column in column_Files]
+        else:
+            try:
+                self.records, self.names, self.name_Offsets = [
+                    np.load(Column_Path(self.metadata_Path, column, header_Dict.get('Column_Version')), mmap_mode= 'r' if self.mmap else None)
+                    for column in column_Files
+                    ]
+            except FileNotFoundError:
+                # The columns were removed by a newer metadata after the header was read.
+                with open(self.metadata_Path, 'rb') as f:
+                    if pickle.load(f).get('Column_Version') == header_Dict.get('Column_Version'):
+                        raise
+                return self.Load()
+
+        self.header_Dict = {key: header_Dict[key] for key in header_Keys if key in header_Dict.keys()}
+        self.use_Text = header_Dict['Use_Text']
+        self.directories = header_Dict['Directories']
+        self.speakers = header_Dict['Speakers']
+        self.datasets = header_Dict['Datasets']
+
+        self.index_Dict = None
+
+    def __getstate__(self):
+        '''
+        The mapped columns are mapped again in the other process instead of being copied.
+        '''
+        state = self.__dict__.copy()
+        state['index_Dict'] = None
+        if self.mmap:
+            for key in ('records', 'names', 'name_Offsets'):
+                state[key] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.mmap:
+            self.Load()
+
+    def __len__(self):
+        return self.records.shape[0]
+
+    def File(self, index):
+        name = bytes(self.names[self.name_Offsets[index]:self.name_Offsets[index + 1]]).decode('utf-8')
+        directory = self.directories[self.records['Directory'][index]]
+
+        return '{}/{}'.format(directory, name) if directory != '' else name
+
+    def Files(self, indices= None):
+        if indices is None:
+            indices = range(len(self))
+        return [self.File(index) for index in indices]
+
+    def Index(self, file):
+        '''
+        The record index of the file. The lookup dict is made when it is used first.
+        '''
+        if self.index_Dict is None:
+            self.index_Dict = {file: index for index, file in enumerate(self.Files())}
+        return self.index_Dict[file]
+
+    def Record(self, index):
+        row = self.records[index]
+        record = {
+            'Audio_Length': int(row['Audio_Length']),
+            'Mel_Length': int(row['Mel_Length']),
+            'Pitch_Length': int(row['Pitch_Length']),
+            'Speaker_ID': int(row['Speaker_ID']),
+            'Speaker': self.speakers[row['Speaker']],
+            'Dataset': self.datasets[row['Dataset']],
+            }
+        if self.use_Text:
+            record['Text_Length'] = int(row['Text_Length'])
+
+        return record
+
+    def Filter(
+        self,
+        mel_length_min= -math.inf,
+        mel_length_max= math.inf,
+        text_length_min= -math.inf,
+        text_length_max= math.inf,
+        speakers= None
+        ):
+        '''
+        speakers: if not None, only the patterns of these speaker names are selected.
+        return: the record indices which pass all conditions, in the metadata order.
+        '''
+        mel_Lengths = self.records['Mel_Length']
+        mask = (mel_Lengths >= mel_length_min) & (mel_Lengths <= mel_length_max)
+        if text_length_min > -math.inf or text_length_max < math.inf:
+            if not self.use_Text:
+                raise ValueError('The metadata \'{}\' has no text length. Generate the patterns with the text.'.format(self.metadata_Path))
+            text_Lengths = self.records['Text_Length']
+            mask &= (text_Lengths >= text_length_min) & (text_Lengths <= text_length_max)
+        if not speakers is None:
+            speaker_Indices = [index for index, speaker in enumerate(self.speakers) if speaker in set(speakers)]
+            mask &= np.isin(self.records['Speaker'], speaker_Indices)
+
+        return np.flatnonzero(mask)
+
+    def Indices_by_Speaker(self, indices= None):
+        '''
+        return: {speaker name: record indices}
+        '''
+        if indices is None:
+            indices = np.arange(len(self))
+        speaker_Indices = np.asarray(self.records['Speaker'][indices])
+        order = np.argsort(speaker_Indices, kind= 'stable')
+        speaker_Indices, indices = speaker_Indices[order], np.asarray(indices)[order]
+        boundaries = np.flatnonzero(np.diff(speaker_Indices)) + 1
+
+        return {
+            self.speakers[speaker_Group[0]]: index_Group
+            for speaker_Group, index_Group in zip(np.split(speaker_Indices, boundaries), np.split(indices, boundaries))
+            if speaker_Group.shape[0] > 0
+            }
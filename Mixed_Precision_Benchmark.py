@@ -0,0 +1,199 @@
+import torch
+import numpy as np
+import yaml, os, time, json, platform, argparse
+import multiprocessing as mp
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+from Arg_Parser import Recursive_Parse
+hp = Recursive_Parse(yaml.load(
+    open('Hyper_Parameters.yaml', encoding='utf-8'),
+    Loader=yaml.Loader
+    ))
+
+def Inputs_Generate(batch_size, mel_length, token_ratio, seed= 0):
+    '''
+    Random patterns with random lengths, so the padding is included as in training.
+    The mel lengths are between the half and the full length, and the token lengths are the mel lengths / token_ratio.
+    The mel lengths are rounded down to the multiples of 'Decoder.Num_Squeeze' as Collater does.
+    '''
+    mel_length = mel_length // hp.Decoder.Num_Squeeze * hp.Decoder.Num_Squeeze
+    generator = torch.Generator().manual_seed(seed)
+    mel_Lengths = torch.randint(max(mel_length // 2, 1), mel_length + 1, (batch_size,), generator= generator)
+    mel_Lengths = mel_Lengths // hp.Decoder.Num_Squeeze * hp.Decoder.Num_Squeeze
+    mel_Lengths[0] = mel_length
+    token_Lengths = torch.clamp(mel_Lengths // token_ratio, min= 1)
+    token_Time = int(token_Lengths.max())
+
+    tokens = torch.randint(1, hp.Encoder.Embedding_Tokens, (batch_size, token_Time), generator= generator)
+    tokens *= torch.arange(token_Time)[None] < token_Lengths[:, None]
+    mels = torch.randn(batch_size, hp.Sound.Mel_Dim, mel_length, generator= generator)
+    mels *= (torch.arange(mel_length)[None] < mel_Lengths[:, None])[:, None]
+    speakers = torch.randint(0, hp.Speaker_Embedding.Num_Speakers, (batch_size,), generator= generator)
+    pitches = torch.randn(batch_size, mel_length, generator= generator)
+
+    return tokens, token_Lengths, mels, mel_Lengths, speakers, pitches
+
+def Peak_Memory(device):
+    '''
+    MB. On CPU, this is the peak resident memory of the process, so each mode runs in its own process.
+    It is None on CPU without the resource module.
+    '''
+    if device.type == 'cuda':
+        return torch.cuda.max_memory_allocated(device) / 1024 ** 2
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def Mode_Run(dtype, device, batch_size, mel_length, token_ratio, steps, warmup, seed= 0):
+    '''
+    The train steps of Train.py (forward, losses, backward, clipping and optimizer step) in a new process.
+    dtype: 'float32' is without autocast.
+    return: {'MS': median ms of a step, 'Frames_per_Second', 'Peak_Memory_MB', 'Loss'}
+    '''
+    import Modules
+    from Modules import GlowTTS, MLE_Loss, Length_Loss, Autocast
+    Modules.hp.Mixed_Precision.Use = dtype != 'float32'
+    Modules.hp.Mixed_Precision.Dtype = dtype
+
+    torch.manual_seed(seed)
+    model = GlowTTS().to(device)
+    model.train()
+    mle_Loss, length_Loss = MLE_Loss(), Length_Loss()
+    optimizer = torch.optim.Adam(model.parameters(), lr= 1e-4)
+    scaler = torch.amp.GradScaler(device.type, enabled= dtype == 'float16')
+    tokens, token_Lengths, mels, mel_Lengths, speakers, pitches = [
+        x.to(device)
+        for x in Inputs_Generate(batch_size, mel_length, token_ratio, seed)
+        ]
+
+    if device.type == 'cuda':
+        torch.cuda.reset_peak_memory_stats(device)
+
+    times, losses = [], []
+    for step in range(warmup + steps):
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        start_Time = time.perf_counter()
+        with Autocast(device):
+            z, mel_Mean, mel_Log_Std, log_Dets, log_Durations, log_Duration_Targets, _, _ = model(
+                tokens= tokens,
+                token_lengths= token_Lengths,
+                mels= mels,
+                mel_lengths= mel_Lengths,
+                speakers= speakers,
+                mels_for_ge2e= None,
+                pitches= pitches
+                )
+            loss = \
+                mle_Loss(z, mel_Mean, mel_Log_Std, log_Dets, mel_Lengths) + \
+                length_Loss(log_Durations, log_Duration_Targets, token_Lengths)
+        optimizer.zero_grad()
+        scaler.scale(loss).backward()
+        scaler.unscale_(optimizer)
+        torch.nn.utils.clip_grad_norm_(model.parameters(), hp.Train.Gradient_Norm)
+        scaler.step(optimizer)
+        scaler.update()
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        if step >= warmup:
+            times.append((time.perf_counter() - start_Time) * 1000.0)
+            losses.append(loss.item())
+
+    ms = float(np.median(times))
+    return {
+        'MS': ms,
+        'Frames_per_Second': float(mel_Lengths.sum()) / ms * 1000.0,
+        'Peak_Memory_MB': Peak_Memory(device),
+        'Loss': losses,
+        }
+
+def Mode_Process(queue, *args):
+    try:
+        queue.put(Mode_Run(*args))
+    except Exception as e:  # The parent would wait forever without the result.
+        queue.put(e)
+        raise
+
+def Benchmark(dtypes, device, batch_size, mel_length, token_ratio= 5, steps= 5, warmup= 2):
+    '''
+    Every dtype is run in a spawned process with the same seed, so the memory peaks and the losses are comparable.
+    '''
+    context = mp.get_context('spawn')
+    result_Dict = {}
+    for dtype in dtypes:
+        queue = context.Queue()
+        process = context.Process(
+            target= Mode_Process,
+            args= (queue, dtype, device, batch_size, mel_length, token_ratio, steps, warmup)
+            )
+        process.start()
+        result_Dict[dtype] = queue.get()
+        process.join()
+        if isinstance(result_Dict[dtype], Exception):
+            raise result_Dict[dtype]
+
+    reference = result_Dict[dtypes[0]]
+    for result in result_Dict.values():
+        result['Speedup'] = reference['MS'] / result['MS']
+        result['Memory_Ratio'] = result['Peak_Memory_MB'] / reference['Peak_Memory_MB'] if not reference['Peak_Memory_MB'] is None else None
+
+    return result_Dict
+
+def Print(result_Dict):
+    for dtype, result in result_Dict.items():
+        print('{:<10}{:>10.1f} ms{:>12.1f} frames/s    Speedup: {:.2f}    Last loss: {:.4f}'.format(
+            dtype,
+            result['MS'],
+            result['Frames_per_Second'],
+            result['Speedup'],
+            result['Loss'][-1]
+            ))
+        if not result['Peak_Memory_MB'] is None:
+            print('{:<10}{:>10.1f} MB    Memory: {:.2f}'.format('', result['Peak_Memory_MB'], result['Memory_Ratio']))
+
+if __name__ == '__main__':
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument("-d", "--dtypes", default= None, required=False)  # The first is the reference. If None, float32 and the default autocast dtype.
+    argParser.add_argument("-b", "--batch_size", default= 8, required=False, type= int)
+    argParser.add_argument("-l", "--mel_length", default= 400, required=False, type= int)
+    argParser.add_argument("-tr", "--token_ratio", default= 5, required=False, type= int)    # Mel frames per token.
+    argParser.add_argument("-s", "--steps", default= 5, required=False, type= int)
+    argParser.add_argument("-w", "--warmup", default= 2, required=False, type= int)
+    argParser.add_argument("-cpu", "--use_cpu", action= 'store_true')
+    argParser.add_argument("-o", "--output_path", default= 'Mixed_Precision_Benchmark.json', required=False)
+    args = argParser.parse_args()
+
+    device = torch.device('cuda:0') if torch.cuda.is_available() and not args.use_cpu else torch.device('cpu')
+    dtypes = \
+        args.dtypes.split(',') if not args.dtypes is None else \
+        ['float32', 'float16' if device.type == 'cuda' else 'bfloat16']
+
+    result_Dict = Benchmark(
+        dtypes= dtypes,
+        device= device,
+        batch_size= args.batch_size,
+        mel_length= args.mel_length,
+        token_ratio= args.token_ratio,
+        steps= args.steps,
+        warmup= args.warmup
+        )
+    Print(result_Dict)
+
+    with open(args.output_path, 'w') as f:
+        json.dump({
+            'Time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'Environment': {
+                'Python': platform.python_version(),
+                'Platform': platform.platform(),
+                'CPU_Count': os.cpu_count(),
+                'Torch': torch.__version__,
+                'Device': torch.cuda.get_device_name(device) if device.type == 'cuda' else 'CPU',
+                },
+            'Batch': args.batch_size,
+            'Mel_Length': args.mel_length,
+            'Token_Ratio': args.token_ratio,
+            'Results': result_Dict,
+            }, f, indent= 4)
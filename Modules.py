@@ -1,9 +1,10 @@
 import torch
 import numpy as np
-import yaml, logging, math
+import yaml, logging, math, functools
 
 from RPR_MHA import RPR_Multihead_Attention
 from Gradient_Reversal_Layer import GRL
+from Profiler import Profiler
 from Speaker_Embedding.Modules import Encoder as GE2E, Normalize as GE2E_Normalize
 
 from Arg_Parser import Recursive_Parse
@@ -12,6 +13,38 @@ hp = Recursive_Parse(yaml.load(
     Loader=yaml.Loader
     ))
 
+def Autocast_Dtype(device):
+    '''
+    The dtype of the mixed precision. If 'Mixed_Precision.Dtype' is null, float16 on CUDA and bfloat16 on CPU.
+    '''
+    if not hp.Mixed_Precision.Dtype is None:
+        return getattr(torch, hp.Mixed_Precision.Dtype)
+    return torch.float16 if device.type == 'cuda' else torch.bfloat16
+
+def Autocast(device):
+    '''
+    The autocast region of the model and the losses. It does nothing when 'Mixed_Precision.Use' is false.
+    '''
+    return torch.autocast(device_type= device.type, dtype= Autocast_Dtype(device), enabled= hp.Mixed_Precision.Use)
+
+def Full_Precision(function):
+    '''
+    The numerically sensitive parts (log determinants, the inverse, the log likelihood and the loss) run in float32
+    even in an autocast region. The floating tensor arguments are cast to float32.
+    '''
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        tensors = [x for x in list(args) + list(kwargs.values()) if torch.is_tensor(x)]
+        device_Type = tensors[0].device.type if len(tensors) > 0 else 'cpu'
+        if not torch.is_autocast_enabled(device_Type):
+            return function(*args, **kwargs)
+
+        args = [x.float() if torch.is_tensor(x) and x.is_floating_point() else x for x in args]
+        kwargs = {key: x.float() if torch.is_tensor(x) and x.is_floating_point() else x for key, x in kwargs.items()}
+        with torch.autocast(device_type= device_Type, enabled= False):
+            return function(*args, **kwargs)
+
+    return wrapper
 
 class GlowTTS(torch.nn.Module):
     def __init__(self):
@@ -47,6 +80,26 @@ class GlowTTS(torch.nn.Module):
         self.layer_Dict['Decoder'] = Decoder()
         self.layer_Dict['Maximum_Path_Generater'] = Maximum_Path_Generater()
 
+        self.profiler = Profiler()
+
+    def Profile(self, enable= True, use_cuda= None):
+        '''
+        Enables or disables the latency measurement. The latencies are read by 'self.profiler.Collect()'.
+        '''
+        if not enable:
+            self.profiler.Disable()
+            return
+
+        module_Dict = {'Encoder': self.layer_Dict['Encoder']}
+        for key in ['LUT', 'GE2E']:
+            if key in self.layer_Dict.keys():
+                module_Dict['Speaker_Embedding'] = self.layer_Dict[key]
+        if 'Prosody_Encoder' in self.layer_Dict.keys():
+            module_Dict['Prosody_Encoder'] = self.layer_Dict['Prosody_Encoder']
+        for index, flow in enumerate(self.layer_Dict['Decoder'].layer_Dict['Flows']):
+            module_Dict['Decoder/Flow_{:02d}'.format(index)] = flow
+        self.profiler.Enable(module_Dict, use_cuda)
+
     def forward(
         self,
         tokens,
@@ -91,37 +144,30 @@ class GlowTTS(torch.nn.Module):
         if not 'Pitch_Interpolater' in self.layer_Dict.keys():
             pitches = None
 
-        if hp.Device != '-1': torch.cuda.synchronize()
-
         token_Masks = self.Mask_Generate(token_lengths)
         mel_Masks = self.Mask_Generate(mel_lengths)
 
         mean, log_Std, log_Durations, token_Masks = self.layer_Dict['Encoder'](tokens, token_Masks, speakers, prosodies)
-        z, log_Dets, mel_Masks = self.layer_Dict['Decoder'](mels, mel_Masks, speakers, prosodies, pitches)
+        with self.profiler.Section('Decoder'):
+            z, log_Dets, mel_Masks = self.layer_Dict['Decoder'](mels, mel_Masks, speakers, prosodies, pitches)
         
         attention_Masks = torch.unsqueeze(token_Masks, -1) * torch.unsqueeze(mel_Masks, 2)
         attention_Masks = attention_Masks.squeeze(1)
 
-        if hp.Device != '-1': torch.cuda.synchronize()
-
         with torch.no_grad():
-            std_Square_R = torch.exp(-2 * log_Std)
-            # [Batch, Token_t, 1] [Batch, Token_t, Mel_t] [Batch, Token_t, Mel_t] [Batch, Token_t, 1]
-            log_P = \
-                torch.sum(-0.5 * math.log(2 * math.pi) - log_Std, dim= 1).unsqueeze(-1) + \
-                std_Square_R.transpose(2, 1) @ (-0.5 * (z ** 2)) + \
-                (mean * std_Square_R).transpose(2, 1) @ z + \
-                torch.sum(-0.5 * (mean ** 2) * std_Square_R, dim= 1).unsqueeze(-1)
-
-            attentions = self.layer_Dict['Maximum_Path_Generater'](log_P, attention_Masks)
-
-        if hp.Device != '-1': torch.cuda.synchronize()
+            with self.profiler.Section('Log_Likelihood'):
+                log_P = self.Log_Likelihood_Generate(z, mean, log_Std)
+            with self.profiler.Section('MAS'):
+                path_Indices = self.layer_Dict['Maximum_Path_Generater'].Indices(log_P, attention_Masks)    # [Batch, Mel_t]
 
-        mel_Mean = mean @ attentions    # [Batch, Mel_Dim, Token_t] @ [Batch, Token_t, Mel_t] -> [Batch, Mel_dim, Mel_t]
-        mel_Log_Std = log_Std @ attentions    # [Batch, Mel_Dim, Token_t] @ [Batch, Token_t, Mel_t] -> [Batch, Mel_dim, Mel_t]
-        log_Duration_Targets = torch.log(torch.sum(attentions.unsqueeze(1), dim= -1) + 1e-7) * token_Masks
+        with self.profiler.Section('Expansion'):
+            mel_Mean = self.Expand(mean, path_Indices, mel_Masks)   # [Batch, Mel_dim, Mel_t]
+            mel_Log_Std = self.Expand(log_Std, path_Indices, mel_Masks)   # [Batch, Mel_dim, Mel_t]
+            durations = torch.zeros_like(token_Masks).scatter_add_(2, path_Indices.unsqueeze(1), mel_Masks)  # [Batch, 1, Token_t]
+            log_Duration_Targets = torch.log(durations + 1e-7) * token_Masks
 
-        if hp.Device != '-1': torch.cuda.synchronize()
+        # The dense alignment is only for the evaluation images.
+        attentions = None if self.training else self.Attention_Generate(path_Indices, attention_Masks)
 
         return z, mel_Mean, mel_Log_Std, log_Dets, log_Durations, log_Duration_Targets, attentions, classified_Speakers
 
@@ -136,7 +182,8 @@ class GlowTTS(torch.nn.Module):
         pitches,
         pitch_lengths,
         noise_scale= 1.0,
-        length_scale= 1.0
+        length_scale= 1.0,
+        prosodies= None
         ):
         '''
         For inference.
@@ -148,60 +195,54 @@ class GlowTTS(torch.nn.Module):
         mels_for_ge2e: [Batch * Samples, Mel_d, Mel_SE_t]    # Input of speaker embedding
         noise_scale: scalar of float
         length_scale: scalar of float or [Batch]. (I may change this to matrix to control speed letter by letter later)
+        prosodies: [Batch, Prosody_dim] or None   # Prosody vectors from the prosody index. If not None, the prosody encoder is skipped.
         '''        
-        if 'LUT' in self.layer_Dict.keys():
-            speakers = self.layer_Dict['LUT'](speakers)
-        elif 'GE2E' in self.layer_Dict.keys():
-            speakers = self.layer_Dict['GE2E'](mels_for_ge2e)
-            speakers = GE2E_Normalize(speakers)
-        else:
-            speakers = None
-
-        if 'Prosody_Encoder' in self.layer_Dict.keys():
-            prosodies = self.layer_Dict['Prosody_Encoder'](mels_for_prosody, mel_lengths_for_prosody)
-        else:
-            prosodies = None
-
-        if hp.Device != '-1': torch.cuda.synchronize()
-
-        token_Masks = self.Mask_Generate(token_lengths)
-        mean, log_Std, log_Durations, mask = self.layer_Dict['Encoder'](tokens, token_Masks, speakers, prosodies)
-        length_scale = length_scale.unsqueeze(-1).unsqueeze(-1)
-
-        if hp.Device != '-1': torch.cuda.synchronize()
-
-        durations = torch.ceil(torch.exp(log_Durations) * mask * length_scale).squeeze(1)
-        mel_Lengths = torch.clamp_min(torch.sum(durations, dim= 1), 1.0).long()
-        mel_Masks = self.Mask_Generate(mel_Lengths)
+        with self.profiler.Phase('Inference'):    # The tags are 'Inference/<Part>'.
+            if 'LUT' in self.layer_Dict.keys():
+                speakers = self.layer_Dict['LUT'](speakers)
+            elif 'GE2E' in self.layer_Dict.keys():
+                speakers = self.layer_Dict['GE2E'](mels_for_ge2e)
+                speakers = GE2E_Normalize(speakers)
+            else:
+                speakers = None
 
-        attention_Masks = torch.unsqueeze(token_Masks, -1) * torch.unsqueeze(mel_Masks, 2)
-        attention_Masks = attention_Masks.squeeze(1)
+            if not 'Prosody_Encoder' in self.layer_Dict.keys():
+                prosodies = None
+            elif prosodies is None:
+                prosodies = self.layer_Dict['Prosody_Encoder'](mels_for_prosody, mel_lengths_for_prosody)
 
+            token_Masks = self.Mask_Generate(token_lengths)
+            mean, log_Std, log_Durations, mask = self.layer_Dict['Encoder'](tokens, token_Masks, speakers, prosodies)
+            length_scale = length_scale.unsqueeze(-1).unsqueeze(-1)
 
-        attentions = self.Path_Generate(durations, attention_Masks) # [Batch, Token_t, Mel_t]
+            with self.profiler.Section('Expansion'):
+                durations = torch.ceil(torch.exp(log_Durations) * mask * length_scale).squeeze(1)
+                mel_Lengths = torch.clamp_min(torch.sum(durations, dim= 1), 1.0).long()
+                mel_Masks = self.Mask_Generate(mel_Lengths)
 
-        if hp.Device != '-1': torch.cuda.synchronize()
+                attention_Masks = torch.unsqueeze(token_Masks, -1) * torch.unsqueeze(mel_Masks, 2)
+                attention_Masks = attention_Masks.squeeze(1)
 
-        mel_Mean = mean @ attentions    # [Batch, Mel_Dim, Token_t] @ [Batch, Token_t, Mel_t] -> [Batch, Mel_dim, Mel_t]
-        mel_Log_Std = log_Std @ attentions    # [Batch, Mel_Dim, Token_t] @ [Batch, Token_t, Mel_t] -> [Batch, Mel_dim, Mel_t]
-        noises = torch.randn_like(mel_Mean) * noise_scale
+                path_Indices, path_Masks = self.Path_Index_Generate(durations, mel_Masks)  # [Batch, Mel_t], [Batch, 1, Mel_t]
+                mel_Mean = self.Expand(mean, path_Indices, path_Masks)  # [Batch, Mel_dim, Mel_t]
+                mel_Log_Std = self.Expand(log_Std, path_Indices, path_Masks)  # [Batch, Mel_dim, Mel_t]
+                attentions = self.Attention_Generate(path_Indices, attention_Masks * path_Masks)    # [Batch, Token_t, Mel_t]
 
-        if hp.Device != '-1': torch.cuda.synchronize()
+            noises = torch.randn_like(mel_Mean) * noise_scale
 
-        z = (mel_Mean + torch.exp(mel_Log_Std) * noises) * mel_Masks
+            z = (mel_Mean + torch.exp(mel_Log_Std) * noises) * mel_Masks
 
-        if 'Pitch_Interpolater' in self.layer_Dict.keys():
-            pitches = self.layer_Dict['Pitch_Interpolater'](pitches, pitch_lengths, mel_Lengths)
-        else:
-            pitches = None
-
-        mels, _, mel_Masks = self.layer_Dict['Decoder'](z, mel_Masks, speakers, prosodies, pitches, reverse= True)
+            if 'Pitch_Interpolater' in self.layer_Dict.keys():
+                pitches = self.layer_Dict['Pitch_Interpolater'](pitches, pitch_lengths, mel_Lengths)
+            else:
+                pitches = None
 
-        if hp.Device != '-1': torch.cuda.synchronize()
+            with self.profiler.Section('Decoder'):
+                mels, _, mel_Masks = self.layer_Dict['Decoder'](z, mel_Masks, speakers, prosodies, pitches, reverse= True)
 
-        mels.masked_fill_(mel_Masks == 0.0, -hp.Sound.Max_Abs_Mel)
+            mels.masked_fill_(mel_Masks == 0.0, -hp.Sound.Max_Abs_Mel)
 
-        return mels, mel_Lengths, attentions
+            return mels, mel_Lengths, attentions
 
     def Mask_Generate(self, lengths, max_lengths= None, dtype= torch.float):
         '''
@@ -210,23 +251,51 @@ class GlowTTS(torch.nn.Module):
         mask = torch.arange(max_lengths or torch.max(lengths))[None, :].to(lengths.device) < lengths[:, None]    # [Batch, Time]
         return mask.unsqueeze(1).to(dtype)  # [Batch, 1, Time]
 
-    def Path_Generate(self, durations, masks):
+    @Full_Precision
+    def Log_Likelihood_Generate(self, z, mean, log_std):
+        '''
+        z: [Batch, Mel_dim, Mel_t]
+        mean, log_std: [Batch, Mel_dim, Token_t]
+        return: [Batch, Token_t, Mel_t]
+        '''
+        std_Square_R = torch.exp(-2 * log_std)
+        # [Batch, Token_t, 1] [Batch, Token_t, Mel_t] [Batch, Token_t, Mel_t] [Batch, Token_t, 1]
+        return \
+            torch.sum(-0.5 * math.log(2 * math.pi) - log_std, dim= 1).unsqueeze(-1) + \
+            std_Square_R.transpose(2, 1) @ (-0.5 * (z ** 2)) + \
+            (mean * std_Square_R).transpose(2, 1) @ z + \
+            torch.sum(-0.5 * (mean ** 2) * std_Square_R, dim= 1).unsqueeze(-1)
+
+    def Path_Index_Generate(self, durations, mel_masks):
         '''
         durations: [Batch, Token_t]
-        masks: [Batch, Token_t, Mel_t]
+        mel_masks: [Batch, 1, Mel_t]
+        return: the token of each mel step [Batch, Mel_t] and the mel steps which have a token [Batch, 1, Mel_t]
+        '''
+        batch, token_Time = durations.size()
+        mel_Indices = torch.arange(mel_masks.size(2), device= durations.device, dtype= durations.dtype)[None].expand(batch, -1).contiguous()
+        path_Indices = torch.searchsorted(torch.cumsum(durations, dim= 1), mel_Indices, right= True)   # The tokens which end before or at the mel step.
+        path_Masks = (path_Indices < token_Time).unsqueeze(1).to(mel_masks.dtype) * mel_masks
+
+        return path_Indices.clamp(max= token_Time - 1), path_Masks
+
+    def Expand(self, x, path_indices, mel_masks):
         '''
-        batch, token_Time, mel_Time = masks.size()
-        durations = torch.cumsum(durations, dim= 1)
-        paths = self.Mask_Generate(
-            lengths= durations.view(-1),
-            max_lengths= mel_Time,
-            dtype= masks.dtype
-            ).to(device= masks.device)
-        paths = paths.view(batch, token_Time, mel_Time)
-        paths = paths - torch.nn.functional.pad(paths, [0,0,1,0,0,0])[:, :-1]
-        paths = paths * masks
+        Same as 'x @ attentions' with the 0/1 alignment, but by the gather. In backward, the gradient is summed to the tokens by the scatter.
+        x: [Batch, Dim, Token_t]
+        path_indices: [Batch, Mel_t]
+        mel_masks: [Batch, 1, Mel_t]
+        return: [Batch, Dim, Mel_t]
+        '''
+        return x.gather(2, path_indices.unsqueeze(1).expand(-1, x.size(1), -1)) * mel_masks
 
-        return paths
+    def Attention_Generate(self, path_indices, masks):
+        '''
+        The dense alignment of the path. This is only for the images.
+        path_indices: [Batch, Mel_t]
+        masks: [Batch, Token_t, Mel_t]
+        '''
+        return torch.nn.functional.one_hot(path_indices, masks.size(1)).transpose(2, 1).to(masks.dtype) * masks
 
 
 class Encoder(torch.nn.Module):
@@ -679,6 +748,7 @@ class Activation_Norm(torch.nn.Module):
             torch.zeros(1, hp.Sound.Mel_Dim * hp.Decoder.Num_Squeeze, 1)
             )
 
+    @Full_Precision
     def forward(self, x, mask, reverse= False, **kwargs):   # kwargs is to skip speaker embedding
         if mask is None:
             mask = torch.ones(x.size(0), 1, x.size(2)).to(device=x.device, dtype= x.dtype)
@@ -724,6 +794,7 @@ class Invertible_1x1_Conv(torch.nn.Module):
 
         self.weight = torch.nn.Parameter(weight)
 
+    @Full_Precision
     def forward(self, x, mask= None, reverse= False, **kwargs):   # kwargs is to skip speaker embedding
         batch, channels, time = x.size()
         assert channels % hp.Decoder.Num_Split == 0
@@ -790,7 +861,7 @@ class Affine_Coupling_Layer(torch.nn.Module):
         
         x = self.layer_Dict['Start'](x_a) * mask
         x = self.layer_Dict['WaveNet'](x, mask, speakers, prosodies, pitches)
-        outs = self.layer_Dict['End'](x)
+        outs = self.layer_Dict['End'](x).float()    # The scale and its log determinant are in float32 with the mixed precision.
 
         mean, logs = torch.split(
             tensor= outs,
@@ -927,9 +998,22 @@ class Unsqueeze(torch.nn.Module):
 class Maximum_Path_Generater(torch.nn.Module):
     def __init__(self):
         super(Maximum_Path_Generater, self).__init__()
-        if hp.Use_Cython_Alignment:
+        if hp.Alignment.upper() == 'TORCH':
+            self.forward = Maximum_Path_Torch
+        elif hp.Alignment.upper() == 'CYTHON':
             import monotonic_align
             self.forward = monotonic_align.maximum_path
+        elif hp.Alignment.upper() != 'PYTHON':
+            raise ValueError('Unsupported alignment: {}'.format(hp.Alignment))
+
+    def Indices(self, log_p, mask):
+        '''
+        return: the token of each mel step, [Batch, Mel_t]. The padded mel steps are 0.
+        The torch implementation makes the indices directly without the dense path.
+        '''
+        if hp.Alignment.upper() == 'TORCH':
+            return Maximum_Path_Torch(log_p, mask, return_indices= True)
+        return self(log_p, mask).argmax(dim= 1)
 
     def forward(self, log_p, mask):
         '''
@@ -959,26 +1043,78 @@ class Maximum_Path_Generater(torch.nn.Module):
         for mel_Index in range(mel_length):
             for token_Index in range(max(0, token_length + mel_Index - mel_length), min(token_length, mel_Index + 1)):
                 if mel_Index == token_Index:
-                    current_Q = -1e+7
+                    current_Q = -1e+9
                 else:
                     current_Q = x[token_Index, mel_Index - 1]   # Stayed current token
                 if token_Index == 0:
                     if mel_Index == 0:
                         prev_Q = 0.0
                     else:
-                        prev_Q = -1e+7
+                        prev_Q = -1e+9
                 else:
                     prev_Q = x[token_Index - 1, mel_Index - 1]  # Moved to next token
-            x[token_Index, mel_Index] = max(current_Q, prev_Q) + x[token_Index, mel_Index]
+                x[token_Index, mel_Index] = max(current_Q, prev_Q) + x[token_Index, mel_Index]
 
         token_Index = token_length - 1
         for mel_Index in range(mel_length - 1, -1, -1):
             path[token_Index, mel_Index] = 1
-            if token_Index == mel_Index or x[token_Index, mel_Index - 1] < x[token_Index - 1, mel_Index - 1]:
-                token_Index = max(0, token_Index - 1)
+            if token_Index != 0 and (token_Index == mel_Index or x[token_Index, mel_Index - 1] < x[token_Index - 1, mel_Index - 1]):
+                token_Index -= 1
 
         return path
 
+@torch.no_grad()
+def Maximum_Path_Torch(log_p, mask, max_neg_value= -1e+9, return_indices= False):
+    '''
+    Same result as the cython 'maximum_path', but on the device of log_p without a copy to the host.
+    Every cell of a mel step depends on the previous mel step only, so the DP sweeps the mel steps
+    and each step updates the tokens of the whole batch at once. The token move of every cell is decided at once after the DP,
+    so the backtracking is one gather per mel step for the whole batch.
+    log_p: [Batch, Token_t, Mel_t]
+    mask: [Batch, Token_t, Mel_t]
+    return_indices: if True, the token of each mel step [Batch, Mel_t] is returned instead of the dense path.
+    '''
+    batch, token_Time, mel_Time = log_p.size()
+    device, dtype = log_p.device, log_p.dtype
+    token_Lengths = mask.sum(dim= 1)[:, 0].long()  # [Batch]
+    mel_Lengths = mask.sum(dim= 2)[:, 0].long()    # [Batch]
+
+    token_Indices = torch.arange(token_Time, device= device)[None, None]   # [1, 1, Token_t]
+    mel_Indices = torch.arange(mel_Time, device= device)[:, None, None]    # [Mel_t, 1, 1]
+    bands = \
+        (token_Indices >= (token_Lengths - mel_Lengths)[None, :, None] + mel_Indices) & \
+        (token_Indices < token_Lengths[None, :, None]) & \
+        (token_Indices <= mel_Indices)    # [Mel_t, Batch, Token_t], the cells which the DP updates.
+    diagonals = (token_Indices == mel_Indices)[:, 0]    # [Mel_t, Token_t], a token cannot stay before the tokens before it are used.
+
+    # values[mel + 1, :, token + 1] is the cell. The padding is the start: only the first token is reachable at the first mel step.
+    values = torch.full((mel_Time + 1, batch, token_Time + 1), max_neg_value, device= device)
+    values[0, :, 0] = 0.0
+    values[1:, :, 1:] = (log_p * mask).float().permute(2, 0, 1)
+    max_Neg = torch.tensor(max_neg_value, device= device)
+    for mel_Index in range(mel_Time):
+        previous = values[mel_Index]
+        current = values[mel_Index + 1, :, 1:]
+        stayed = torch.where(diagonals[mel_Index], max_Neg, previous[:, 1:])
+        current.copy_(torch.where(bands[mel_Index], torch.maximum(stayed, previous[:, :-1]) + current, current))
+
+    moves = (values[1:-1, :, 1:] < values[1:-1, :, :-1]) | diagonals[1:, None]  # [Mel_t - 1, Batch, Token_t]
+    indices = token_Lengths - 1 # [Batch]
+    path_Indices = torch.empty(mel_Time, batch, dtype= torch.long, device= device)
+    for mel_Index in range(mel_Time - 1, 0, -1):
+        path_Indices[mel_Index] = indices
+        moved = moves[mel_Index - 1].gather(1, indices[:, None])[:, 0] & (indices != 0) & (mel_Index < mel_Lengths)
+        indices = indices - moved.long()
+    path_Indices[0] = indices
+    valids = mel_Indices[:, :, 0] < mel_Lengths[None]    # [Mel_t, Batch]
+    if return_indices:
+        return (path_Indices * valids).t()
+
+    paths = torch.nn.functional.one_hot(path_Indices, token_Time).to(dtype)   # [Mel_t, Batch, Token_t]
+    paths *= valids.unsqueeze(-1).to(dtype)
+
+    return paths.permute(1, 2, 0)
+
 
 class Conv1d(torch.nn.Conv1d):
     def __init__(self, w_init_gain= 'relu', *args, **kwargs):
@@ -1018,6 +1154,7 @@ class Conv2d(torch.nn.Conv2d):
 
 
 class MLE_Loss(torch.nn.modules.loss._Loss):
+    @Full_Precision
     def forward(self, z, mean, std, log_dets, lengths):
         '''
         https://github.com/jaywalnut310/glow-tts/issues/6
@@ -1028,6 +1165,15 @@ class MLE_Loss(torch.nn.modules.loss._Loss):
 
         return loss
 
+class Length_Loss(torch.nn.modules.loss._Loss):
+    @Full_Precision
+    def forward(self, log_durations, log_duration_targets, lengths):
+        '''
+        The squared errors are averaged over the real tokens. Both inputs are zero at the padding,
+        so the loss does not change with the padding or the batch size.
+        '''
+        return torch.sum((log_durations - log_duration_targets) ** 2) / torch.sum(lengths)
+
 
 if __name__ == "__main__":
     # glowTTS = GlowTTS()
@@ -0,0 +1,202 @@
+import os, mmap, pickle, tempfile, uuid, atexit, bisect, shutil, logging
+from collections import OrderedDict
+from multiprocessing.managers import BaseManager
+
+header_Size = 8    # The generation of the block. 0 is an invalid block.
+
+class Cache_Index:
+    '''
+    The allocation, LRU order and statistics of the arena. This lives in the manager process and is shared by all processes.
+    Evicted blocks are invalidated before they are reused, so a reader of an evicted pattern sees a different generation.
+    '''
+    def __init__(self, arena_file, size):
+        self.size = size
+        self.arena_File = open(arena_file, 'r+b')
+        self.arena = mmap.mmap(self.arena_File.fileno(), 0)
+        self.entry_Dict = OrderedDict() # key -> (offset, length, generation). The first item is the least recently used.
+        self.pending_Dict = {}  # Reserved blocks which are being written. These are not visible and not evicted.
+        self.free_List = [(0, size)]    # Sorted (offset, length).
+        self.generation = 0
+        self.stat_Dict = {'Hit': 0, 'Miss': 0, 'Put': 0, 'Eviction': 0, 'Stale': 0, 'Reject': 0}
+
+    def Get(self, key):
+        if key in self.entry_Dict.keys():
+            self.entry_Dict.move_to_end(key)
+            self.stat_Dict['Hit'] += 1
+            return self.entry_Dict[key]
+
+        self.stat_Dict['Miss'] += 1
+        return None
+
+    def Stale(self):
+        '''
+        A reader found that the block was reused while reading. This is counted as a miss instead of a hit.
+        '''
+        self.stat_Dict['Hit'] -= 1
+        self.stat_Dict['Miss'] += 1
+        self.stat_Dict['Stale'] += 1
+
+    def Reserve(self, key, length):
+        if key in self.entry_Dict.keys() or key in self.pending_Dict.keys():
+            return None     # Another worker cached or is caching it.
+        if length > self.size:
+            self.stat_Dict['Reject'] += 1
+            return None
+
+        offset = self.Allocate(length)
+        while offset is None and len(self.entry_Dict) > 0:
+            evicted_Offset, evicted_Length, _ = self.entry_Dict.popitem(last= False)[1]
+            self.arena[evicted_Offset:evicted_Offset + header_Size] = bytes(header_Size)
+            self.Free(evicted_Offset, evicted_Length)
+            self.stat_Dict['Eviction'] += 1
+            offset = self.Allocate(length)
+        if offset is None:  # The rest is reserved by the writing workers.
+            self.stat_Dict['Reject'] += 1
+            return None
+
+        self.generation += 1
+        self.pending_Dict[key] = (offset, length, self.generation)
+
+        return offset, self.generation
+
+    def Commit(self, key):
+        self.entry_Dict[key] = self.pending_Dict.pop(key)
+        self.stat_Dict['Put'] += 1
+
+    def Abort(self, key):
+        offset, length, _ = self.pending_Dict.pop(key)
+        self.Free(offset, length)
+
+    def Allocate(self, length):
+        for index, (offset, free_Length) in enumerate(self.free_List):
+            if free_Length < length:
+                continue
+            if free_Length == length:
+                del self.free_List[index]
+            else:
+                self.free_List[index] = (offset + length, free_Length - length)
+            return offset
+
+        return None
+
+    def Free(self, offset, length):
+        index = bisect.bisect(self.free_List, (offset, length))
+        if index < len(self.free_List) and offset + length == self.free_List[index][0]:  # Merge with the next block.
+            length += self.free_List.pop(index)[1]
+        if index > 0 and self.free_List[index - 1][0] + self.free_List[index - 1][1] == offset:  # Merge with the previous block.
+            offset, previous_Length = self.free_List.pop(index - 1)
+            length += previous_Length
+            index -= 1
+        self.free_List.insert(index, (offset, length))
+
+    def Stats(self):
+        stat_Dict = dict(self.stat_Dict)
+        stat_Dict['Items'] = len(self.entry_Dict)
+        stat_Dict['Used'] = sum([length for _, length, _ in self.entry_Dict.values()])
+        stat_Dict['Size'] = self.size
+
+        return stat_Dict
+
+class Cache_Manager(BaseManager):
+    pass
+Cache_Manager.register('Cache_Index', Cache_Index)
+
+class Pattern_Cache:
+    '''
+    A pattern cache shared by the main process and all DataLoader workers.
+    The patterns are pickled into one memory-mapped arena file of max_size MB. The arena is in '/dev/shm' when it exists and has the space.
+    A write past the free space of a sparse file kills the process by SIGBUS, so the size is clamped to the free space.
+    The index is served by a manager process, and the least recently used patterns are evicted when the arena is full.
+    The object is picklable, so it can be a member of the datasets. Each process maps the arena when it is used first.
+    '''
+    def __init__(self, max_size= 2048, path= None):
+        self.size = int(max_size * 1024 ** 2)
+        if path is None:
+            # '/dev/shm' of a docker container is 64 MB by default.
+            paths = [x for x in ['/dev/shm', tempfile.gettempdir()] if os.path.isdir(x)]
+            path = next((x for x in paths if self.Free_Space(x) >= self.size), max(paths, key= self.Free_Space))
+        free_Space = self.Free_Space(path)
+        if free_Space < self.size:
+            logging.warning('Pattern cache: {} has only {:.1f} MB free. The cache size is reduced from {:.1f} MB.'.format(
+                path,
+                free_Space / 1024 ** 2,
+                self.size / 1024 ** 2
+                ))
+            self.size = free_Space
+        self.arena_File = os.path.join(path, 'PATTERN_CACHE.{}.ARENA'.format(uuid.uuid4().hex.upper())).replace('\\', '/')
+        with open(self.arena_File, 'wb') as f:
+            f.truncate(self.size)   # Sparse. Memory is used only by the written blocks.
+
+        self.manager = Cache_Manager()
+        self.manager.start()
+        self.index = self.manager.Cache_Index(self.arena_File, self.size)
+        self.arena = None
+        self.owner_PID = os.getpid()
+        atexit.register(self.Close)
+
+    @staticmethod
+    def Free_Space(path):
+        '''
+        The free bytes of the file system, with a margin for the other users of the same file system.
+        '''
+        return max(int(shutil.disk_usage(path).free * 0.9), 0)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['manager'] = None
+        state['arena'] = None
+        return state
+
+    def Arena(self):
+        if self.arena is None:
+            with open(self.arena_File, 'r+b') as f:
+                self.arena = mmap.mmap(f.fileno(), 0)
+        return self.arena
+
+    def Generation(self, offset):
+        return int.from_bytes(self.arena[offset:offset + header_Size], 'little')
+
+    def Get(self, key):
+        location = self.index.Get(key)
+        if location is None:
+            return None
+
+        offset, length, generation = location
+        self.Arena()
+        if self.Generation(offset) != generation:
+            self.index.Stale()
+            return None
+        data = self.arena[offset + header_Size:offset + length]
+        if self.Generation(offset) != generation:   # Evicted and overwritten while copying.
+            self.index.Stale()
+            return None
+
+        return pickle.loads(data)
+
+    def Put(self, key, value):
+        data = pickle.dumps(value, protocol= 4)
+        location = self.index.Reserve(key, header_Size + len(data))
+        if location is None:
+            return
+
+        offset, generation = location
+        try:
+            self.Arena()
+            # The header is written first. A reader of the previous block at this offset checks it after copying.
+            self.arena[offset:offset + header_Size] = generation.to_bytes(header_Size, 'little')
+            self.arena[offset + header_Size:offset + header_Size + len(data)] = data
+        except:
+            self.index.Abort(key)
+            raise
+        self.index.Commit(key)
+
+    def Stats(self):
+        return self.index.Stats()
+
+    def Close(self):
+        if os.getpid() != self.owner_PID or self.manager is None:
+            return
+        self.manager.shutdown()
+        self.manager = None
+        if os.path.exists(self.arena_File):
+            os.remove(self.arena_File)
@@ -1,13 +1,21 @@
 import numpy as np
-import yaml, os, time, pickle, librosa, re, argparse
-from concurrent.futures import ThreadPoolExecutor as PE
+import torch
+import yaml, os, time, pickle, librosa, argparse, uuid, math
+import soundfile as sf
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor as PE, ProcessPoolExecutor as PPE, as_completed
 from collections import deque
 from threading import Thread
 from random import shuffle
 from tqdm import tqdm
 
-from Audio import Audio_Prep, Mel_Generate
-from yin import pitch_calc
+from Audio import Audio_Prep, Audio_Prep_Stream, Mel_Extractor
+from yin import pitch_calc, Pitch_Stream
+from scipy.ndimage import gaussian_filter1d
+from Corpus_Index import Corpus_Index
+from Text_Frontend import Text_Frontend
+from Pattern_Store import Shard_Writer, Store_Path, Shard_Index_Load, Index_Merge, Pattern_Save, store_Directory
+from Metadata import Metadata, Metadata_Builder
 
 from Arg_Parser import Recursive_Parse
 hp = Recursive_Parse(yaml.load(
@@ -15,28 +23,26 @@ hp = Recursive_Parse(yaml.load(
     Loader=yaml.Loader
     ))
 
-using_Extension = [x.upper() for x in ['.wav', '.m4a', '.flac']]
-regex_Checker = re.compile('[A-Z,.?!\'\-\s]+')
+using_Extension = set([x.upper() for x in ['.wav', '.m4a', '.flac']])
+manifest_Directory = 'MANIFEST'
 top_DB_Dict = {'LJ': 60, 'BC2013': 60, 'VCTK': 15, 'VC1': 23, 'VC1T': 23, 'VC2': 23, 'Libri': 23, 'CMUA': 60}  # VC1 and Libri is from 'https://github.com/CorentinJ/Real-Time-Voice-Cloning'
+text_Frontend = Text_Frontend()   # The token dict is set by Token_Dict_Generate before the patterns are generated.
 
 def Text_Filtering(text):
-    remove_Letter_List = ['(', ')', '\"', '[', ']', ':', ';']
-    replace_List = [('  ', ' '), (' ,', ','), ('\' ', '\'')]
+    return text_Frontend.Filter(text)
 
-    text = text.upper().strip()
-    for filter in remove_Letter_List:
-        text= text.replace(filter, '')
-    for filter, replace_STR in replace_List:
-        text= text.replace(filter, replace_STR)
-
-    text= text.strip()
-    
-    if len(regex_Checker.findall(text)) != 1:
-        return None
-    elif text.startswith('\''):
-        return None
-    else:
-        return regex_Checker.findall(text)[0]
+def Mel_Extractor_Generate():
+    return Mel_Extractor(
+        sample_rate= hp.Sound.Sample_Rate,
+        num_frequency= hp.Sound.Spectrogram_Dim,
+        num_mel= hp.Sound.Mel_Dim,
+        window_length= hp.Sound.Frame_Length,
+        hop_length= hp.Sound.Frame_Shift,
+        mel_fmin= hp.Sound.Mel_F_Min,
+        mel_fmax= hp.Sound.Mel_F_Max,
+        max_abs_value= hp.Sound.Max_Abs_Mel
+        )
+mel_Extractor = Mel_Extractor_Generate()    # Shared by the pattern generation and the inference datasets.
 
 def Pitch_Generate(audio):
     pitch = pitch_calc(
@@ -49,72 +55,272 @@ def Pitch_Generate(audio):
         confidence_threshold= hp.Sound.Confidence_Threshold,
         gaussian_smoothing_sigma = hp.Sound.Gaussian_Smoothing_Sigma
         )
+    return Pitch_Normalize(pitch)
+
+def Pitch_Normalize(pitch):
     return (pitch - np.min(pitch)) / (np.max(pitch) - np.min(pitch) + 1e-7)
 
 def Pattern_Generate(path, top_db= 60):
     audio = Audio_Prep(path, hp.Sound.Sample_Rate, top_db)
-    mel = Mel_Generate(
-        audio= audio,
-        sample_rate= hp.Sound.Sample_Rate,
-        num_frequency= hp.Sound.Spectrogram_Dim,
-        num_mel= hp.Sound.Mel_Dim,
-        window_length= hp.Sound.Frame_Length,
-        hop_length= hp.Sound.Frame_Shift,
-        mel_fmin= hp.Sound.Mel_F_Min,
-        mel_fmax= hp.Sound.Mel_F_Max,
-        max_abs_value= hp.Sound.Max_Abs_Mel
-        )
+    mel = mel_Extractor(audio)
     pitch = Pitch_Generate(audio)
 
     return audio, mel, pitch
 
-def Pattern_File_Generate(path, speaker_ID, speaker, dataset, text= None, tag='', eval= False):
-    pattern_Path = hp.Train.Eval_Pattern.Path if eval else hp.Train.Train_Pattern.Path
+def Feature_Stream(path, top_db= 60, block_size= 2 ** 16):
+    '''
+    Bounded-memory feature extraction for long recordings. The file is read by blocks, and the mel and pitch frames are yielded
+    as soon as they are complete. The frames are the same as Pattern_Generate, but the pitch is not smoothed or normalized yet
+    because both need the whole sequence.
+    return: the length of the prepared audio and a generator of (mel, pitch) blocks.
+    '''
+    length, blocks = Audio_Prep_Stream(path, hp.Sound.Sample_Rate, top_db, block_size)
+
+    def Features():
+        mel_Stream = mel_Extractor.Stream(length)
+        pitch_Stream = Pitch_Stream(length, sr= hp.Sound.Sample_Rate, confidence_threshold= hp.Sound.Confidence_Threshold)
+        for block in blocks:
+            yield mel_Stream.Feed(block), pitch_Stream.Feed(block)
+        yield mel_Stream.Flush(), pitch_Stream.Flush()
+
+    return length, Features()
+
+def Pattern_Generate_Stream(path, top_db= 60, block_size= 2 ** 16):
+    '''
+    Same as Pattern_Generate with Feature_Stream, but the mel is float32 as it is saved.
+    The audio length is returned instead of the audio.
+    '''
+    length, features = Feature_Stream(path, top_db, block_size)
+    mels, pitches = [], []
+    for mel, pitch in features:
+        mels.append(mel.astype(np.float32))
+        pitches.append(pitch)
+
+    pitch = np.concatenate(pitches)
+    if hp.Sound.Gaussian_Smoothing_Sigma > 0.0:
+        pitch = gaussian_filter1d(pitch, sigma= hp.Sound.Gaussian_Smoothing_Sigma)
+
+    return length, np.concatenate(mels), Pitch_Normalize(pitch)
+
+def Source_Length(path):
+    '''
+    The audio length after resampling, from the file header. The silence is not trimmed yet, so this is the upper bound.
+    '''
+    try:
+        info = sf.info(path)
+        seconds = info.frames / info.samplerate
+    except RuntimeError:    # Formats which soundfile cannot read (e.g. m4a).
+        seconds = librosa.get_duration(path= path)
+
+    return int(seconds * hp.Sound.Sample_Rate)
 
+def Pattern_File_Name(path, speaker, dataset, tag= ''):
+    '''
+    The relative path of the pattern. This is the key of the metadata and the pattern store.
+    '''
     file = '{}.{}{}.PICKLE'.format(
         speaker if dataset in speaker else '{}.{}'.format(dataset, speaker),
         '{}.'.format(tag) if tag != '' else '',
         os.path.splitext(os.path.basename(path))[0]
         ).upper()
-    file = os.path.join(pattern_Path, dataset, speaker, file).replace("\\", "/")
-
-    if os.path.exists(file):
-        return
-
+    
+    return os.path.join(dataset, speaker, file).replace("\\", "/")
+
+def Pattern_Dict_Generate(path, speaker_ID, speaker, dataset, text= None, stream= False, raw= False):
+    '''
+    If stream is True, the features are extracted by Pattern_Generate_Stream and only the audio length is kept.
+    If raw is True, no feature is extracted. The pattern has the source path and the lengths estimated from the file header,
+    and the datasets extract the features from the source when training (See 'Train/Raw_Audio').
+    '''
     try:
-        audio, mel, pitch = Pattern_Generate(path, top_DB_Dict[dataset])
+        if raw:
+            audio_Length = Source_Length(path)
+            new_Pattern_Dict = {
+                'Source': os.path.abspath(path).replace('\\', '/'),
+                'Audio_Length': audio_Length,
+                'Mel_Length': audio_Length // hp.Sound.Frame_Shift + 1,    # Centered frames.
+                'Pitch_Length': audio_Length // hp.Sound.Frame_Shift + 1,
+                'Speaker_ID': speaker_ID,
+                'Speaker': speaker,
+                'Dataset': dataset,
+                }
+            if not text is None:
+                new_Pattern_Dict['Text'] = text
+                new_Pattern_Dict['Token'] = text_Frontend.Tokenize(text)
+                new_Pattern_Dict['Token_Dict_Hash'] = text_Frontend.Hash()
+            return new_Pattern_Dict
+        elif stream:
+            audio_Length, mel, pitch = Pattern_Generate_Stream(path, top_DB_Dict[dataset])
+            new_Pattern_Dict = {'Audio_Length': audio_Length}
+        else:
+            audio, mel, pitch = Pattern_Generate(path, top_DB_Dict[dataset])
+            new_Pattern_Dict = {'Audio': audio.astype(np.float32)}
         assert mel.shape[0] == pitch.shape[0], 'Mel_shape != Pitch_shape {} != {}'.format(mel.shape, pitch.shape)
-        new_Pattern_Dict = {
-            'Audio': audio.astype(np.float32),
+        new_Pattern_Dict.update({
             'Mel': mel.astype(np.float32),
             'Pitch': pitch.astype(np.float32),
             'Speaker_ID': speaker_ID,
             'Speaker': speaker,
             'Dataset': dataset,
-            }
+            })
         if not text is None:
             new_Pattern_Dict['Text'] = text
+            new_Pattern_Dict['Token'] = text_Frontend.Tokenize(text)
+            new_Pattern_Dict['Token_Dict_Hash'] = text_Frontend.Hash()    # The datasets tokenize again when the token dict is changed.
     except Exception as e:
         print('Error: {} in {}'.format(e, path))
-        return
+        return None
 
+    return new_Pattern_Dict
 
-    os.makedirs(os.path.join(pattern_Path, dataset, speaker).replace('\\', '/'), exist_ok= True)
-    with open(os.path.join(pattern_Path, dataset, file).replace("\\", "/"), 'wb') as f:
-        pickle.dump(new_Pattern_Dict, f, protocol=4)
+def Pattern_File_Generate(path, speaker_ID, speaker, dataset, text= None, tag='', eval= False, save_audio= True, stream= False, raw= False):
+    '''
+    The audio is saved apart from the pickle, so loading the training fields does not deserialize it.
+    If save_audio is False, only the audio length is saved.
+    '''
+    pattern_Path = hp.Train.Eval_Pattern.Path if eval else hp.Train.Train_Pattern.Path
 
+    file = os.path.join(pattern_Path, Pattern_File_Name(path, speaker, dataset, tag)).replace("\\", "/")
+
+    if os.path.exists(file):
+        return None
+
+    new_Pattern_Dict = Pattern_Dict_Generate(path, speaker_ID, speaker, dataset, text, stream, raw)
+    if new_Pattern_Dict is None:
+        return None
+
+    os.makedirs(os.path.dirname(file), exist_ok= True)
+    Pattern_Save(
+        path= file,
+        pattern_dict= new_Pattern_Dict,
+        detach_fields= ('Audio',) if save_audio else (),
+        drop_fields= () if save_audio else ('Audio',)
+        )
+
+    return Manifest_Record_Generate(new_Pattern_Dict)
+
+def Manifest_Record_Generate(pattern_dict):
+    '''
+    The lightweight description of a pattern which is enough to generate the metadata.
+    '''
+    record = {
+        '{}_Length'.format(key): value.shape[0]
+        for key, value in pattern_dict.items()
+        if isinstance(value, np.ndarray)
+        }
+    record.update({key: value for key, value in pattern_dict.items() if key.endswith('_Length')})   # Detached or dropped fields.
+    record.update({key: pattern_dict[key] for key in ('Speaker_ID', 'Speaker', 'Dataset')})
+    if 'Text' in pattern_dict.keys():
+        record['Text_Length'] = len(pattern_dict['Text'])
+
+    return record
+
+def Manifest_Save(pattern_path, record_dict):
+    if len(record_dict) == 0:
+        return
+
+    manifest_Path = os.path.join(pattern_path, manifest_Directory).replace('\\', '/')
+    os.makedirs(manifest_Path, exist_ok= True)
+    with open(os.path.join(manifest_Path, '{}.PICKLE'.format(uuid.uuid4().hex.upper())).replace('\\', '/'), 'wb') as f:
+        pickle.dump(record_dict, f, protocol= 4)
+
+def Manifest_Load(pattern_path):
+    manifest_Path = os.path.join(pattern_path, manifest_Directory).replace('\\', '/')
+    record_Dict = {}
+    if not os.path.exists(manifest_Path):
+        return record_Dict
+
+    for file in sorted(os.listdir(manifest_Path)):
+        with open(os.path.join(manifest_Path, file).replace('\\', '/'), 'rb') as f:
+            record_Dict.update(pickle.load(f))
+
+    return record_Dict
+
+def Manifest_Compact(pattern_path, record_dict):
+    '''
+    Replaces the manifest files of the chunks by one file. Records of removed patterns are dropped.
+    '''
+    manifest_Path = os.path.join(pattern_path, manifest_Directory).replace('\\', '/')
+    old_Files = os.listdir(manifest_Path) if os.path.exists(manifest_Path) else []
+    Manifest_Save(pattern_path, record_dict)
+    for file in old_Files:
+        os.remove(os.path.join(manifest_Path, file).replace('\\', '/'))
+
+def Worker_Initialize(hp_path= 'Hyper_Parameters.yaml'):
+    '''
+    Process pool initializer. Each worker parses the hyper parameters once and keeps them for all chunks.
+    Torch is limited to one thread because the workers already use all cores.
+    '''
+    global hp, mel_Extractor
+    hp = Recursive_Parse(yaml.load(
+        open(hp_path, encoding='utf-8'),
+        Loader=yaml.Loader
+        ))
+    mel_Extractor = Mel_Extractor_Generate()
+    torch.set_num_threads(1)
+
+def Pattern_File_Generate_Chunk(params_List, save_audio= True, stream= False, raw= False):
+    '''
+    Pool job. A chunk of 'Pattern_File_Generate' parameters is handled in one call to amortize the IPC cost.
+    The manifest records of the chunk are saved together. All parameters in a chunk must share the eval flag.
+    '''
+    start_Time = time.time()
+    pattern_Path = hp.Train.Eval_Pattern.Path if params_List[0][-1] else hp.Train.Train_Pattern.Path
+
+    record_Dict = {}
+    for path, speaker_ID, speaker, dataset, text, tag, eval in params_List:
+        record = Pattern_File_Generate(path, speaker_ID, speaker, dataset, text, tag, eval, save_audio, stream, raw)
+        if not record is None:
+            record_Dict[Pattern_File_Name(path, speaker, dataset, tag)] = record
+    Manifest_Save(pattern_Path, record_Dict)
+
+    return os.getpid(), len(params_List), time.time() - start_Time
+
+def Pattern_Shard_Generate(params_List, stream= False, raw= False):
+    '''
+    Pool job for the pattern store. A chunk of up to 'shard_size' patterns becomes one shard. All parameters in a chunk must share the eval flag.
+    '''
+    start_Time = time.time()
+    pattern_Path = hp.Train.Eval_Pattern.Path if params_List[0][-1] else hp.Train.Train_Pattern.Path
+
+    writer = Shard_Writer(Store_Path(pattern_Path))
+    for path, speaker_ID, speaker, dataset, text, tag, _ in params_List:
+        new_Pattern_Dict = Pattern_Dict_Generate(path, speaker_ID, speaker, dataset, text, stream, raw)
+        if new_Pattern_Dict is None:
+            continue
+        writer.Add(Pattern_File_Name(path, speaker, dataset, tag), new_Pattern_Dict)
+    writer.Close()
+
+    return os.getpid(), len(params_List), time.time() - start_Time
+
+def Patterns_Generate(params_List, max_worker= 10, multi_process= False, chunk_size= 16, use_store= False, shard_size= 256, save_audio= True, stream= False, raw= False, desc= None):
+    # Librosa, mel and YIN hold the GIL, so threads do not scale. With multi_process, chunks of paths are sent to worker processes instead.
+    # Each chunk saves one manifest file, or is written as one shard when the store is used.
+    if use_store:   # Large shards for the sequential reads, but smaller when a worker would have no shard.
+        chunk_size = max(min(shard_size, math.ceil(len(params_List) / max_worker)), 1)
+    chunks = [params_List[index:index + chunk_size] for index in range(0, len(params_List), chunk_size)]
+    if use_store:
+        job = partial(Pattern_Shard_Generate, stream= stream, raw= raw)
+    else:
+        job = partial(Pattern_File_Generate_Chunk, save_audio= save_audio, stream= stream, raw= raw)
+    executor = PPE(max_workers= max_worker, initializer= Worker_Initialize) if multi_process else PE(max_workers= max_worker)
+    worker_Dict = {}
+    with executor, tqdm(total= len(params_List), desc= desc) as files_TQDM:
+        for future in as_completed([executor.submit(job, chunk) for chunk in chunks]):
+            pid, count, elapsed = future.result()
+            worker_Count, worker_Time = worker_Dict.get(pid, (0, 0.0))
+            worker_Dict[pid] = (worker_Count + count, worker_Time + elapsed)
+            files_TQDM.update(count)
+
+    if not multi_process:
+        return
+    for index, (pid, (count, elapsed)) in enumerate(sorted(worker_Dict.items())):
+        print('Worker {} (PID {}): {} files, {:.3f} files/sec'.format(index, pid, count, count / max(elapsed, 1e-7)))
 
-def LJ_Info_Load(path, use_text= False):
-    paths = []
-    for root, _, files in os.walk(path):
-        for file in files:
-            file = os.path.join(root, file).replace('\\', '/')
-            if not os.path.splitext(file)[1].upper() in using_Extension:
-                continue
-            paths.append(file)
 
+def LJ_Info_Load(path, use_text= False, index_path= None, max_worker= 16):
     text_Dict = {}
-    if use_text:        
+    if use_text:    # The paths are the keys of the metadata, so the corpus is not scanned.
         for line in open(os.path.join(path, 'metadata.csv').replace('\\', '/'), 'r', encoding= 'utf-8').readlines():
             file, _, text = line.strip().split('|')
             text = Text_Filtering(text)
@@ -123,6 +329,8 @@ def LJ_Info_Load(path, use_text= False):
             text_Dict[os.path.join(path, 'wavs', '{}.wav'.format(file)).replace('\\', '/')] = text
         
         paths = list(text_Dict.keys())
+    else:
+        paths = Corpus_Index(path, index_path= index_path, max_worker= max_worker).Files(extensions= using_Extension)
 
     speaker_Dict = {
         path: 'LJ'
@@ -132,21 +340,21 @@ def LJ_Info_Load(path, use_text= False):
     print('LJ info generated: {}'.format(len(paths)))
     return paths, text_Dict, speaker_Dict
 
-def BC2013_Info_Load(path, use_text= False):
-    paths = []
-    for root, _, files in os.walk(path):
-        for file in files:
-            file = os.path.join(root, file).replace('\\', '/')
-            if not os.path.splitext(file)[1].upper() in using_Extension:
-                continue
-            paths.append(file)
+def BC2013_Info_Load(path, use_text= False, index_path= None, max_worker= 16):
+    corpus_Index = Corpus_Index(path, index_path= index_path, max_worker= max_worker)
+    paths = corpus_Index.Files(extensions= using_Extension)
 
     text_Dict = {}
     if use_text:
-        for path in paths:
-            text = Text_Filtering(open(path.replace('wav', 'txt'), 'r').readlines()[0].strip())
-            if not text is None:
-                text_Dict[path] = text
+        texts = corpus_Index.Map(
+            lambda path: Text_Filtering(open(path.replace('wav', 'txt'), 'r').readlines()[0].strip()),
+            paths
+            )
+        text_Dict = {
+            path: text
+            for path, text in zip(paths, texts)
+            if not text is None
+            }
         paths = list(text_Dict.keys())
 
     speaker_Dict = {
@@ -157,27 +365,24 @@ def BC2013_Info_Load(path, use_text= False):
     print('BC2013 info generated: {}'.format(len(paths)))
     return paths, text_Dict, speaker_Dict
 
-def CMUA_Info_Load(path, use_text= False):
-    paths = []
-    for root, _, files in os.walk(path):
-        for file in files:
-            file = os.path.join(root, file).replace('\\', '/')
-            if not os.path.splitext(file)[1].upper() in using_Extension:
-                continue
-            paths.append(file)
+def CMUA_Info_Load(path, use_text= False, index_path= None, max_worker= 16):
+    corpus_Index = Corpus_Index(path, index_path= index_path, max_worker= max_worker)
+    paths = corpus_Index.Files(extensions= using_Extension)
 
     text_Dict = {}
     if use_text:
-        for root, _, _ in os.walk(path):
-            if not os.path.exists(os.path.join(root, 'txt.done.data')):
-                continue
-            for line in open(os.path.join(root, 'txt.done.data'), 'r').readlines():
+        def Text_Read(text_File):
+            root = os.path.dirname(text_File)
+            file_Text_Dict = {}
+            for line in open(text_File, 'r').readlines():
                 file, text, _ = line.strip().split('"')
                 file = file.strip().split(' ')[1]
-                path = os.path.join(root.replace('etc', 'wav'), '{}.wav'.format(file)).replace('\\', '/')
                 text = Text_Filtering(text)
                 if not text is None:
-                    text_Dict[path] = text
+                    file_Text_Dict[os.path.join(root.replace('etc', 'wav'), '{}.wav'.format(file)).replace('\\', '/')] = text
+            return file_Text_Dict
+        for file_Text_Dict in corpus_Index.Map(Text_Read, corpus_Index.Files(names= {'txt.done.data'})):
+            text_Dict.update(file_Text_Dict)
 
         paths = list(text_Dict.keys())
 
@@ -189,33 +394,32 @@ def CMUA_Info_Load(path, use_text= False):
     print('CMUA info generated: {}'.format(len(paths)))
     return paths, text_Dict, speaker_Dict
 
-def VCTK_Info_Load(path, use_text= False):
+def VCTK_Info_Load(path, use_text= False, index_path= None, max_worker= 16):
     path = os.path.join(path, 'wav48').replace('\\', '/')
     try:
         with open(os.path.join(path, 'VCTK.NonOutlier.txt').replace('\\', '/'), 'r') as f:
-            vctk_Non_Outlier_List = [x.strip() for x in f.readlines()]
+            vctk_Non_Outlier_Set = set([x.strip() for x in f.readlines()])
     except:
-        vctk_Non_Outlier_List = None
-
-    paths = []
-    for root, _, files in os.walk(path):
-        for file in files:
-            if not vctk_Non_Outlier_List is None and not file in vctk_Non_Outlier_List:
-                continue
-            file = os.path.join(root, file).replace('\\', '/')
-            if not os.path.splitext(file)[1].upper() in using_Extension:
-                continue
+        vctk_Non_Outlier_Set = None
 
-            paths.append(file)
+    corpus_Index = Corpus_Index(path, index_path= index_path, max_worker= max_worker)
+    paths = corpus_Index.Files(extensions= using_Extension, names= vctk_Non_Outlier_Set)
 
     text_Dict = {}
     if use_text:
-        for path in paths:
-            if 'p315'.upper() in path.upper():  #Officially, 'p315' text is lost in VCTK dataset.
-                continue
-            text = Text_Filtering(open(path.replace('wav48', 'txt').replace('wav', 'txt'), 'r').readlines()[0])
-            if not text is None:
-                text_Dict[path] = text
+        paths = [
+            path for path in paths
+            if not 'p315'.upper() in path.upper()   #Officially, 'p315' text is lost in VCTK dataset.
+            ]
+        texts = corpus_Index.Map(
+            lambda path: Text_Filtering(open(path.replace('wav48', 'txt').replace('wav', 'txt'), 'r').readlines()[0]),
+            paths
+            )
+        text_Dict = {
+            path: text
+            for path, text in zip(paths, texts)
+            if not text is None
+            }
         paths = list(text_Dict.keys())
 
     speaker_Dict = {
@@ -226,21 +430,21 @@ def VCTK_Info_Load(path, use_text= False):
     print('VCTK info generated: {}'.format(len(paths)))
     return paths, text_Dict, speaker_Dict
 
-def Libri_Info_Load(path, use_text= False):
-    paths = []
-    for root, _, files in os.walk(path):
-        for file in files:
-            file = os.path.join(root, file).replace('\\', '/')
-            if not os.path.splitext(file)[1].upper() in using_Extension:
-                continue
-            paths.append(file)
+def Libri_Info_Load(path, use_text= False, index_path= None, max_worker= 16):
+    corpus_Index = Corpus_Index(path, index_path= index_path, max_worker= max_worker)
+    paths = corpus_Index.Files(extensions= using_Extension)
 
     text_Dict = {}
     if use_text:
-        for path in paths:
-            text = Text_Filtering(open('{}.normalized.txt'.format(os.path.splitext(path)[0]), 'r', encoding= 'utf-8').readlines()[0])
-            if not text is None:
-                text_Dict[path] = text
+        texts = corpus_Index.Map(
+            lambda path: Text_Filtering(open('{}.normalized.txt'.format(os.path.splitext(path)[0]), 'r', encoding= 'utf-8').readlines()[0]),
+            paths
+            )
+        text_Dict = {
+            path: text
+            for path, text in zip(paths, texts)
+            if not text is None
+            }
         paths = list(text_Dict.keys())
 
     speaker_Dict = {
@@ -252,17 +456,11 @@ def Libri_Info_Load(path, use_text= False):
     return paths, text_Dict, speaker_Dict
 
 
-def VC1_Info_Load(path, use_text= False):
+def VC1_Info_Load(path, use_text= False, index_path= None, max_worker= 16):
     if use_text:
         raise ValueError('VC1 does not support the text.')
 
-    paths = []
-    for root, _, files in os.walk(path):
-        for file in files:
-            file = os.path.join(root, file).replace('\\', '/')
-            if not os.path.splitext(file)[1].upper() in using_Extension:
-                continue
-            paths.append(file)
+    paths = Corpus_Index(path, index_path= index_path, max_worker= max_worker).Files(extensions= using_Extension)
     
     speaker_Dict = {
         path: 'VC1.{}'.format(path.split('/')[-3].upper())
@@ -276,17 +474,11 @@ def VC1_Info_Load(path, use_text= False):
     print('VC1 info generated: {}'.format(len(paths)))
     return paths, speaker_Dict, tag_Dict
 
-def VC2_Info_Load(path, use_text= False):
+def VC2_Info_Load(path, use_text= False, index_path= None, max_worker= 16):
     if use_text:
         raise ValueError('VC2 does not support the text.')
 
-    paths = []
-    for root, _, files in os.walk(path):
-        for file in files:
-            wav_File_Path = os.path.join(root, file).replace('\\', '/')
-            if not os.path.splitext(wav_File_Path)[1].upper() in using_Extension:
-                continue
-            paths.append(wav_File_Path)
+    paths = Corpus_Index(path, index_path= index_path, max_worker= max_worker).Files(extensions= using_Extension)
     
     speaker_Dict = {
         path: 'VC2.{}'.format(path.split('/')[-3].upper())
@@ -301,17 +493,11 @@ def VC2_Info_Load(path, use_text= False):
     return paths, speaker_Dict, tag_Dict
 
 
-def VC1T_Info_Load(path, use_text= False):
+def VC1T_Info_Load(path, use_text= False, index_path= None, max_worker= 16):
     if use_text:
         raise ValueError('VC1-Test does not support the text.')
 
-    paths = []
-    for root, _, files in os.walk(path):
-        for file in files:
-            file = os.path.join(root, file).replace('\\', '/')
-            if not os.path.splitext(file)[1].upper() in using_Extension:
-                continue
-            paths.append(file)
+    paths = Corpus_Index(path, index_path= index_path, max_worker= max_worker).Files(extensions= using_Extension)
     
     speaker_Dict = {
         path: 'VC1T.{}'.format(path.split('/')[-3].upper())
@@ -337,64 +523,85 @@ def Split_Eval(paths, eval_ratio= 0.001, min_Eval= 1):
     index = max(int(len(paths) * eval_ratio), min_Eval)
     return paths[index:], paths[:index]
 
-def Metadata_Generate(eval= False, use_text= False):
+def Metadata_Generate(eval= False, use_text= False, use_store= False, incremental= True):
+    '''
+    When incremental, the previous metadata is reused. Only new patterns are looked up in the manifests,
+    and the patterns are unpickled only when they have no manifest record (the patterns generated by an older version).
+    '''
     pattern_Path = hp.Train.Eval_Pattern.Path if eval else hp.Train.Train_Pattern.Path
     metadata_File = hp.Train.Eval_Pattern.Metadata_File if eval else hp.Train.Train_Pattern.Metadata_File
+    metadata_Path = os.path.join(pattern_Path, metadata_File.upper()).replace("\\", "/")
 
-    new_Metadata_Dict = {
+    metadata_Builder = Metadata_Builder({
         'Spectrogram_Dim': hp.Sound.Spectrogram_Dim,
         'Mel_Dim': hp.Sound.Mel_Dim,
         'Frame_Shift': hp.Sound.Frame_Shift,
         'Frame_Length': hp.Sound.Frame_Length,
         'Sample_Rate': hp.Sound.Sample_Rate,
         'Max_Abs_Mel': hp.Sound.Max_Abs_Mel,
-        'File_List': [],
-        'Audio_Length_Dict': {},
-        'Mel_Length_Dict': {},
-        'Pitch_Length_Dict': {},
-        'Speaker_ID_Dict': {},
-        'Speaker_Dict': {},
-        'Dataset_Dict': {},
-        'File_List_by_Speaker_Dict': {},
-        }
-    if use_text:
-        new_Metadata_Dict['Text_Length_Dict'] = {}
+        }, use_text= use_text)
 
-    files_TQDM = tqdm(
-        total= sum([len(files) for root, _, files in os.walk(pattern_Path)]),
-        desc= 'Eval_Pattern' if eval else 'Train_Pattern'
-        )
-
-    for root, _, files in os.walk(pattern_Path):
-        for file in files:
-            with open(os.path.join(root, file).replace("\\", "/"), "rb") as f:
-                pattern_Dict = pickle.load(f)
-
-            file = os.path.join(root, file).replace("\\", "/").replace(pattern_Path, '').lstrip('/')
+    if use_store:
+        # The store index already has the lengths, so no pattern is loaded.
+        for file, record in tqdm(
+            sorted(Index_Merge(Store_Path(pattern_Path)).items()),
+            desc= 'Eval_Pattern' if eval else 'Train_Pattern'
+            ):
+            if use_text and not 'Text' in record.keys():
+                continue
+            metadata_Builder.Add(file, record)
+    else:
+        files = []
+        for root, directories, walk_Files in os.walk(pattern_Path):
+            for directory in (store_Directory, manifest_Directory):
+                if directory in directories:
+                    directories.remove(directory)  # These are not pattern trees.
+            files.extend([
+                os.path.join(root, file).replace("\\", "/").replace(pattern_Path, '').lstrip('/')
+                for file in walk_Files
+                if os.path.splitext(file)[1].upper() == '.PICKLE'
+                ])
+        files = [file for file in files if file != metadata_File.upper()]
+
+        previous_Metadata = None
+        if incremental and os.path.exists(metadata_Path):
+            previous_Metadata = Metadata(metadata_Path)  # The dict metadata of an older version is also read.
+            if previous_Metadata.header_Dict != metadata_Builder.header_Dict or (use_text and not previous_Metadata.use_Text):
+                previous_Metadata = None   # Sound parameters are changed. Rebuilding is required.
+        previous_Files = set(previous_Metadata.Files()) if not previous_Metadata is None else set()
+
+        manifest_Dict = Manifest_Load(pattern_Path)
+        added, removed = 0, len(previous_Files.difference(files))
+
+        for file in tqdm(files, desc= 'Eval_Pattern' if eval else 'Train_Pattern'):
+            if file in previous_Files:
+                metadata_Builder.Add(file, previous_Metadata.Record(previous_Metadata.Index(file)))
+                continue
             try:
-                if not all([
-                    key in ('Audio', 'Mel', 'Pitch', 'Speaker_ID', 'Speaker', 'Dataset', 'Text' if use_text else '')
-                    for key in pattern_Dict.keys()
-                    ]):
+                if file in manifest_Dict.keys():
+                    record = manifest_Dict[file]
+                else:
+                    with open(os.path.join(pattern_Path, file).replace("\\", "/"), "rb") as f:
+                        pattern_Dict = pickle.load(f)
+                    if not all([
+                        key in ('Audio', 'Audio_Length', 'Audio_File', 'Mel', 'Pitch', 'Speaker_ID', 'Speaker', 'Dataset', 'Text' if use_text else '', 'Token', 'Token_Dict_Hash', 'Source', 'Mel_Length', 'Pitch_Length')
+                        for key in pattern_Dict.keys()
+                        ]):
+                        continue
+                    record = Manifest_Record_Generate(pattern_Dict)
+                    manifest_Dict[file] = record
+                if use_text and not 'Text_Length' in record.keys():
                     continue
-                new_Metadata_Dict['Audio_Length_Dict'][file] = pattern_Dict['Audio'].shape[0]
-                new_Metadata_Dict['Mel_Length_Dict'][file] = pattern_Dict['Mel'].shape[0]
-                new_Metadata_Dict['Pitch_Length_Dict'][file] = pattern_Dict['Pitch'].shape[0]
-                new_Metadata_Dict['Speaker_ID_Dict'][file] = pattern_Dict['Speaker_ID']
-                new_Metadata_Dict['Speaker_Dict'][file] = pattern_Dict['Speaker']
-                new_Metadata_Dict['Dataset_Dict'][file] = pattern_Dict['Dataset']
-                new_Metadata_Dict['File_List'].append(file)
-                if not pattern_Dict['Speaker'] in new_Metadata_Dict['File_List_by_Speaker_Dict'].keys():
-                    new_Metadata_Dict['File_List_by_Speaker_Dict'][pattern_Dict['Speaker']] = []
-                new_Metadata_Dict['File_List_by_Speaker_Dict'][pattern_Dict['Speaker']].append(file)
-                if use_text:
-                    new_Metadata_Dict['Text_Length_Dict'][file] = len(pattern_Dict['Text'])
+                metadata_Builder.Add(file, record)
+                added += 1
             except:
                 print('File \'{}\' is not correct pattern file. This file is ignored.'.format(file))
-            files_TQDM.update(1)
 
-    with open(os.path.join(pattern_Path, metadata_File.upper()).replace("\\", "/"), 'wb') as f:
-        pickle.dump(new_Metadata_Dict, f, protocol= 4)
+        Manifest_Compact(pattern_Path, {file: manifest_Dict[file] for file in files if file in manifest_Dict.keys()})
+        print('Metadata: {} patterns are added and {} patterns are removed.'.format(added, removed))
+        previous_Metadata = None    # The records are copied. The maps are released, so Write can remove the older columns on Windows too.
+
+    metadata_Builder.Write(metadata_Path)
 
     print('Metadata generate done.')
 
@@ -403,12 +610,14 @@ def Token_Dict_Generate(text_Dict):
     for text in text_Dict.values():
         tokens = tokens.union(set(text))
 
+    token_Dict = {token: index for index, token in enumerate(['<S>', '<E>'] + sorted(tokens))}
     os.makedirs(os.path.dirname(hp.Token_Path), exist_ok= True)
     #I don't use yaml.dump in this case to sort clearly.
     yaml.dump(
-        {token: index for index, token in enumerate(['<S>', '<E>'] + sorted(tokens))},
+        token_Dict,
         open(hp.Token_Path, 'w')
         )
+    text_Frontend.Set_Token_Dict(token_Dict)
 
 if __name__ == '__main__':
     argParser = argparse.ArgumentParser()
@@ -426,8 +635,25 @@ if __name__ == '__main__':
     argParser.add_argument("-evalr", "--eval_ratio", default= 0.001, type= float)
     argParser.add_argument("-evalm", "--eval_min", default= 1, type= int)
     argParser.add_argument("-mw", "--max_worker", default= 10, required=False, type= int)
+    argParser.add_argument("-mp", "--multi_process", action= 'store_true')   # Process pool instead of thread pool.
+    argParser.add_argument("-cs", "--chunk_size", default= 16, required=False, type= int)   # Paths per process pool job without '-store'.
+    argParser.add_argument("-ss", "--shard_size", default= 256, required=False, type= int)   # Patterns per shard with '-store'. Same to 'Pattern_Store.py -ss'.
+    argParser.add_argument("-store", "--use_store", action= 'store_true')   # Sharded memory-mapped store instead of one pickle per pattern.
+    argParser.add_argument("-noaudio", "--no_audio", action= 'store_true')   # Only the audio length is saved. The raw audio is not saved.
+    argParser.add_argument("-stream", "--stream", action= 'store_true')   # Features are extracted by blocks with bounded memory. The raw audio is not saved.
+    argParser.add_argument("-raw", "--raw_audio", action= 'store_true')   # No feature is extracted. The patterns point to the source audio for 'Train/Raw_Audio'.
+    argParser.add_argument("-mo", "--metadata_only", action= 'store_true')   # Only the metadata is updated from the manifests.
+    argParser.add_argument("-rm", "--rebuild_metadata", action= 'store_true')   # The previous metadata is not reused.
+    argParser.add_argument("-idx", "--corpus_index_path", default= 'Corpus_Index.Cache', required=False)   # Saved file indexes of the corpora. Only changed directories are listed again.
+    argParser.add_argument("-noidx", "--no_corpus_index", action= 'store_true')   # The corpora are scanned without the saved file indexes.
 
     args = argParser.parse_args()
+    corpus_Index_Path = None if args.no_corpus_index else args.corpus_index_path
+
+    if args.metadata_only:
+        Metadata_Generate(use_text= args.use_text, use_store= args.use_store, incremental= not args.rebuild_metadata)
+        Metadata_Generate(eval= True, use_text= args.use_text, use_store= args.use_store, incremental= not args.rebuild_metadata)
+        exit(0)
 
     paths = []
     text_Dict = {}
@@ -436,55 +662,55 @@ if __name__ == '__main__':
     tag_Dict = {}
 
     if not args.lj_path is None:
-        lj_Paths, lj_Text_Dict, lj_Speaker_Dict = LJ_Info_Load(path= args.lj_path, use_text= args.use_text)
+        lj_Paths, lj_Text_Dict, lj_Speaker_Dict = LJ_Info_Load(path= args.lj_path, use_text= args.use_text, index_path= corpus_Index_Path, max_worker= args.max_worker)
         paths.extend(lj_Paths)
         text_Dict.update(lj_Text_Dict)
         speaker_Dict.update(lj_Speaker_Dict)
         dataset_Dict.update({path: 'LJ' for path in lj_Paths})
         tag_Dict.update({path: '' for path in lj_Paths})
     if not args.bc2013_path is None:
-        bc2013_Paths, bc2013_Text_Dict, bc2013_Speaker_Dict = BC2013_Info_Load(path= args.bc2013_path, use_text= args.use_text)
+        bc2013_Paths, bc2013_Text_Dict, bc2013_Speaker_Dict = BC2013_Info_Load(path= args.bc2013_path, use_text= args.use_text, index_path= corpus_Index_Path, max_worker= args.max_worker)
         paths.extend(bc2013_Paths)
         text_Dict.update(bc2013_Text_Dict)
         speaker_Dict.update(bc2013_Speaker_Dict)
         dataset_Dict.update({path: 'BC2013' for path in bc2013_Paths})
         tag_Dict.update({path: '' for path in bc2013_Paths})
     if not args.cmua_path is None:
-        cmua_Paths, cuma_Text_Dict, cmua_Speaker_Dict = CMUA_Info_Load(path= args.cmua_path, use_text= args.use_text)
+        cmua_Paths, cuma_Text_Dict, cmua_Speaker_Dict = CMUA_Info_Load(path= args.cmua_path, use_text= args.use_text, index_path= corpus_Index_Path, max_worker= args.max_worker)
         paths.extend(cmua_Paths)
         text_Dict.update(cuma_Text_Dict)
         speaker_Dict.update(cmua_Speaker_Dict)
         dataset_Dict.update({path: 'CMUA' for path in cmua_Paths})
         tag_Dict.update({path: '' for path in cmua_Paths})
     if not args.vctk_path is None:
-        vctk_Paths, vctk_Text_Dict, vctk_Speaker_Dict = VCTK_Info_Load(path= args.vctk_path, use_text= args.use_text)
+        vctk_Paths, vctk_Text_Dict, vctk_Speaker_Dict = VCTK_Info_Load(path= args.vctk_path, use_text= args.use_text, index_path= corpus_Index_Path, max_worker= args.max_worker)
         paths.extend(vctk_Paths)
         text_Dict.update(vctk_Text_Dict)
         speaker_Dict.update(vctk_Speaker_Dict)
         dataset_Dict.update({path: 'VCTK' for path in vctk_Paths})
         tag_Dict.update({path: '' for path in vctk_Paths})
     if not args.libri_path is None:
-        libri_Paths, libri_Text_Dict, libri_Speaker_Dict = Libri_Info_Load(path= args.libri_path, use_text= args.use_text)
+        libri_Paths, libri_Text_Dict, libri_Speaker_Dict = Libri_Info_Load(path= args.libri_path, use_text= args.use_text, index_path= corpus_Index_Path, max_worker= args.max_worker)
         paths.extend(libri_Paths)
         text_Dict.update(libri_Text_Dict)
         speaker_Dict.update(libri_Speaker_Dict)
         dataset_Dict.update({path: 'Libri' for path in libri_Paths})
         tag_Dict.update({path: '' for path in libri_Paths})
     if not args.vc1_path is None:
-        vc1_Paths, vc1_Speaker_Dict, vc1_Tag_Dict = VC1_Info_Load(path= args.vc1_path, use_text= args.use_text)
+        vc1_Paths, vc1_Speaker_Dict, vc1_Tag_Dict = VC1_Info_Load(path= args.vc1_path, use_text= args.use_text, index_path= corpus_Index_Path, max_worker= args.max_worker)
         paths.extend(vc1_Paths)
         speaker_Dict.update(vc1_Speaker_Dict)
         dataset_Dict.update({path: 'VC1' for path in vc1_Paths})
         tag_Dict.update(vc1_Tag_Dict)
     if not args.vc2_path is None:
-        vc2_Paths, vc2_Speaker_Dict, vc2_Tag_Dict = VC2_Info_Load(path= args.vc2_path, use_text= args.use_text)
+        vc2_Paths, vc2_Speaker_Dict, vc2_Tag_Dict = VC2_Info_Load(path= args.vc2_path, use_text= args.use_text, index_path= corpus_Index_Path, max_worker= args.max_worker)
         paths.extend(vc2_Paths)
         speaker_Dict.update(vc2_Speaker_Dict)
         dataset_Dict.update({path: 'VC2' for path in vc2_Paths})
         tag_Dict.update(vc2_Tag_Dict)
 
     if not args.vc1_test_path is None:
-        vc1t_Paths, vc1t_Speaker_Dict, vc1t_Tag_Dict = VC1T_Info_Load(path= args.vc1_test_path, use_text= args.use_text)
+        vc1t_Paths, vc1t_Speaker_Dict, vc1t_Tag_Dict = VC1T_Info_Load(path= args.vc1_test_path, use_text= args.use_text, index_path= corpus_Index_Path, max_worker= args.max_worker)
         paths.extend(vc1t_Paths)
         speaker_Dict.update(vc1t_Speaker_Dict)
         dataset_Dict.update({path: 'VC1T' for path in vc1t_Paths})
@@ -500,52 +726,44 @@ if __name__ == '__main__':
 
     train_Paths, eval_Paths = Split_Eval(paths, args.eval_ratio)
 
-    with PE(max_workers = args.max_worker) as pe:
-        for _ in tqdm(            
-            pe.map(
-                lambda params: Pattern_File_Generate(*params),
-                [
-                    (
-                        path,
-                        speaker_Index_Dict[speaker_Dict[path]],
-                        speaker_Dict[path],
-                        dataset_Dict[path],
-                        text_Dict[path] if args.use_text else None,
-                        tag_Dict[path],
-                        False
-                        )
-                    for path in train_Paths
-                    ]
-                ),
-            total= len(train_Paths)
-            ):
-            pass
-        for _ in tqdm(
-            pe.map(
-                lambda params: Pattern_File_Generate(*params),
-                [
-                    (
-                        path,
-                        speaker_Index_Dict[speaker_Dict[path]],
-                        speaker_Dict[path],
-                        dataset_Dict[path],
-                        text_Dict[path] if args.use_text else None,
-                        tag_Dict[path],
-                        True
-                        )
-                    for path in eval_Paths
-                    ]
-                ),
-            total= len(eval_Paths)
-            ):
-            pass
-
-    Metadata_Generate(use_text= args.use_text)
-    Metadata_Generate(eval= True, use_text= args.use_text)
+    for eval, generate_Paths in [(False, train_Paths), (True, eval_Paths)]:
+        if args.use_store:  # Patterns already in the store are skipped.
+            exist_Keys = set(Shard_Index_Load(Store_Path(hp.Train.Eval_Pattern.Path if eval else hp.Train.Train_Pattern.Path)).keys())
+            generate_Paths = [
+                path for path in generate_Paths
+                if not Pattern_File_Name(path, speaker_Dict[path], dataset_Dict[path], tag_Dict[path]) in exist_Keys
+                ]
+        Patterns_Generate(
+            params_List= [
+                (
+                    path,
+                    speaker_Index_Dict[speaker_Dict[path]],
+                    speaker_Dict[path],
+                    dataset_Dict[path],
+                    text_Dict[path] if args.use_text else None,
+                    tag_Dict[path],
+                    eval
+                    )
+                for path in generate_Paths
+                ],
+            max_worker= args.max_worker,
+            multi_process= args.multi_process,
+            chunk_size= args.chunk_size,
+            use_store= args.use_store,
+            shard_size= args.shard_size,
+            save_audio= not args.no_audio,
+            stream= args.stream,
+            raw= args.raw_audio,
+            desc= 'Eval_Pattern' if eval else 'Train_Pattern'
+            )
+
+    Metadata_Generate(use_text= args.use_text, use_store= args.use_store, incremental= not args.rebuild_metadata)
+    Metadata_Generate(eval= True, use_text= args.use_text, use_store= args.use_store, incremental= not args.rebuild_metadata)
 
 
 # python Pattern_Generator.py -lj "D:\Pattern\ENG\LJSpeech" -bc2013 "D:\Pattern\ENG\BC2013" -cmua "D:\Pattern\ENG\CMUA" -vctk "D:\Pattern\ENG\VCTK" -libri "D:\Pattern\ENG\LibriTTS"
 # python Pattern_Generator.py -lj "D:\Pattern\ENG\LJSpeech" -vctk "D:\Pattern\ENG\VCTK" -libri "D:\Pattern\ENG\LibriTTS" -text
 # python Pattern_Generator.py -lj "D:\Pattern\ENG\LJSpeech" -text
 # python Pattern_Generator.py -lj /home/heejo/data/Eng/LJSpeech-1.1 -text
-# python Pattern_Generator.py -vc2 "D:\Pattern\ENG\VC2" -mw 1
\ No newline at end of file
+# python Pattern_Generator.py -vc2 "D:\Pattern\ENG\VC2" -mw 1
+# python Pattern_Generator.py -libri "D:\Pattern\ENG\LibriTTS" -vctk "D:\Pattern\ENG\VCTK" -vc2 "D:\Pattern\ENG\VC2" -mw 64 -mp
\ No newline at end of file
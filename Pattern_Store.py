@@ -0,0 +1,248 @@
+import numpy as np
+import os, pickle, uuid, argparse
+from tqdm import tqdm
+
+store_Directory = 'STORE'
+index_File = 'INDEX.PICKLE'
+shard_Index_Extension = '.INDEX.PICKLE'
+default_Shard_Fields = ('Mel', 'Pitch', 'Token')
+
+def Store_Path(pattern_path):
+    return os.path.join(pattern_path, store_Directory).replace('\\', '/')
+
+def Pattern_Save(path, pattern_dict, detach_fields= ('Audio',), drop_fields= ()):
+    '''
+    Saves a pickle pattern. Heavy fields are kept out of the pickle:
+    a detached field is saved as '<Pattern>.<FIELD>.NPY' next to the pickle and loaded only when requested,
+    and a dropped field is not saved. Only '<Field>_Length' is kept for both.
+    '''
+    pattern_Dict = {}
+    for field, value in pattern_dict.items():
+        if not field in detach_fields + drop_fields:
+            pattern_Dict[field] = value
+            continue
+        pattern_Dict['{}_Length'.format(field)] = value.shape[0]
+        if field in drop_fields:
+            continue
+        file = '{}.{}.NPY'.format(os.path.splitext(os.path.basename(path))[0], field.upper())
+        with open(os.path.join(os.path.dirname(path), file).replace('\\', '/'), 'wb') as f:
+            np.save(f, value, allow_pickle= False)
+        pattern_Dict['{}_File'.format(field)] = file
+
+    with open(path, 'wb') as f:   # The pickle is written last, so its existence means the pattern is complete.
+        pickle.dump(pattern_Dict, f, protocol= 4)
+
+def Pattern_Load(path, fields= None):
+    '''
+    Loads a pickle pattern. When fields is not None, only those fields are returned,
+    and detached payloads are memory mapped only when they are in fields.
+    '''
+    with open(path, 'rb') as f:
+        pattern_Dict = pickle.load(f)
+
+    for field in [key[:-len('_File')] for key in pattern_Dict.keys() if key.endswith('_File')]:
+        if fields is None or field in fields:
+            pattern_Dict[field] = np.load(
+                os.path.join(os.path.dirname(path), pattern_Dict['{}_File'.format(field)]).replace('\\', '/'),
+                mmap_mode= 'r'
+                )
+
+    if fields is None:
+        return pattern_Dict
+
+    return {field: pattern_Dict[field] for field in fields if field in pattern_Dict.keys()}
+
+def Pattern_Detach(pattern_path, detach_fields= ('Audio',), drop_fields= ()):
+    '''
+    Rewrites the pickle patterns of an older version which have the heavy fields inside.
+    '''
+    files = [
+        os.path.join(root, file).replace('\\', '/')
+        for root, _, files in os.walk(pattern_path)
+        if not root.replace('\\', '/').startswith(Store_Path(pattern_path))
+        for file in files
+        if os.path.splitext(file)[1].upper() == '.PICKLE'
+        ]
+
+    count = 0
+    for file in tqdm(files, desc= 'Pattern_Detach'):
+        with open(file, 'rb') as f:
+            pattern_Dict = pickle.load(f)
+        if not isinstance(pattern_Dict, dict) or not any([
+            isinstance(pattern_Dict.get(field), np.ndarray)
+            for field in detach_fields + drop_fields
+            ]):
+            continue
+        Pattern_Save(file, pattern_Dict, detach_fields, drop_fields)
+        count += 1
+
+    return count
+
+class Shard_Writer:
+    '''
+    Accumulates patterns and writes them as one shard.
+    Every array field becomes one contiguous '<Shard>.<Field>.NPY' file. Other fields and the offsets are kept in '<Shard>.INDEX.PICKLE'.
+    The shard index is written last, so an interrupted shard is never read.
+    '''
+    def __init__(self, store_path, fields= default_Shard_Fields, shard_name= None):
+        self.store_Path = store_path
+        self.fields = fields
+        self.shard_Name = shard_name or uuid.uuid4().hex.upper()
+
+        self.array_Dict = {field: [] for field in fields}
+        self.offset_Dict = {field: 0 for field in fields}
+        self.record_Dict = {}
+
+    def Add(self, key, pattern_dict):
+        record = {'Shard': self.shard_Name}
+        for field, value in pattern_dict.items():
+            if not isinstance(value, np.ndarray):
+                record[field] = value
+                continue
+            record['{}_Length'.format(field)] = value.shape[0]
+            if not field in self.fields:
+                continue
+            record[field] = (self.offset_Dict[field], value.shape[0])
+            self.array_Dict[field].append(value)
+            self.offset_Dict[field] += value.shape[0]
+
+        self.record_Dict[key] = record
+
+    def Close(self):
+        if len(self.record_Dict) == 0:
+            return {}
+
+        os.makedirs(self.store_Path, exist_ok= True)
+        for field, arrays in self.array_Dict.items():
+            if len(arrays) == 0:
+                continue
+            with open(os.path.join(self.store_Path, '{}.{}.NPY'.format(self.shard_Name, field.upper())).replace('\\', '/'), 'wb') as f:
+                np.save(f, np.concatenate(arrays, axis= 0), allow_pickle= False)
+        with open(os.path.join(self.store_Path, self.shard_Name + shard_Index_Extension).replace('\\', '/'), 'wb') as f:
+            pickle.dump(self.record_Dict, f, protocol= 4)
+
+        return self.record_Dict
+
+class Shard_Reader:
+    '''
+    Reads patterns from the merged store index. Shards are opened lazily with np.load(mmap_mode='r'),
+    so a sample costs only a dict lookup and slicing, and each DataLoader worker maps the shards by itself.
+    '''
+    def __init__(self, store_path):
+        self.store_Path = store_path
+        with open(os.path.join(store_path, index_File).replace('\\', '/'), 'rb') as f:
+            self.record_Dict = pickle.load(f)
+
+        self.shard_Dict = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['shard_Dict'] = {}  # Memory maps must not be pickled to the workers.
+        return state
+
+    def __contains__(self, key):
+        return key in self.record_Dict
+
+    def __len__(self):
+        return len(self.record_Dict)
+
+    def keys(self):
+        return self.record_Dict.keys()
+
+    def Shard_Get(self, shard_name, field):
+        if not (shard_name, field) in self.shard_Dict:
+            self.shard_Dict[shard_name, field] = np.load(
+                os.path.join(self.store_Path, '{}.{}.NPY'.format(shard_name, field.upper())).replace('\\', '/'),
+                mmap_mode= 'r'
+                )
+        return self.shard_Dict[shard_name, field]
+
+    def Load(self, key, fields= None):
+        record = self.record_Dict[key]
+        pattern_Dict = {}
+        for field, value in record.items():
+            if not fields is None and not field in fields:
+                continue
+            if isinstance(value, tuple):
+                offset, length = value
+                value = self.Shard_Get(record['Shard'], field)[offset:offset + length]
+            pattern_Dict[field] = value
+
+        return pattern_Dict
+
+def Shard_Index_Load(store_path):
+    record_Dict = {}
+    if not os.path.exists(store_path):
+        return record_Dict
+
+    for file in sorted(os.listdir(store_path)):
+        if not file.endswith(shard_Index_Extension):
+            continue
+        with open(os.path.join(store_path, file).replace('\\', '/'), 'rb') as f:
+            record_Dict.update(pickle.load(f))
+
+    return record_Dict
+
+def Index_Merge(store_path):
+    '''
+    Merges the indices of all shards into 'INDEX.PICKLE', which is what the reader loads.
+    '''
+    record_Dict = Shard_Index_Load(store_path)
+    os.makedirs(store_path, exist_ok= True)
+    with open(os.path.join(store_path, index_File).replace('\\', '/'), 'wb') as f:
+        pickle.dump(record_Dict, f, protocol= 4)
+
+    return record_Dict
+
+def Pickle_to_Store(pattern_path, shard_size= 256, fields= default_Shard_Fields):
+    '''
+    Converts an existing pickle pattern tree. The keys are the same relative paths used by the metadata.
+    '''
+    store_Path = Store_Path(pattern_path)
+    exist_Keys = set(Shard_Index_Load(store_Path).keys())
+
+    files = sorted([
+        os.path.join(root, file).replace('\\', '/').replace(pattern_path.replace('\\', '/'), '').lstrip('/')
+        for root, _, files in os.walk(pattern_path)
+        if not root.replace('\\', '/').startswith(store_Path)
+        for file in files
+        if os.path.splitext(file)[1].upper() == '.PICKLE'
+        ])
+
+    writer = Shard_Writer(store_Path, fields= fields)
+    for file in tqdm(files, desc= 'Pickle_to_Store'):
+        if file in exist_Keys:
+            continue
+        with open(os.path.join(pattern_path, file).replace('\\', '/'), 'rb') as f:
+            pattern_Dict = pickle.load(f)
+        if not all([key in pattern_Dict.keys() for key in ('Mel', 'Pitch', 'Speaker_ID', 'Speaker', 'Dataset')]):
+            continue    # Metadata or another non-pattern pickle.
+        writer.Add(file, pattern_Dict)
+        if len(writer.record_Dict) >= shard_size:
+            writer.Close()
+            writer = Shard_Writer(store_Path, fields= fields)
+    writer.Close()
+
+    return Index_Merge(store_Path)
+
+if __name__ == '__main__':
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument('-p', '--pattern_path', required= True)
+    argParser.add_argument('-ss', '--shard_size', default= 256, type= int)
+    argParser.add_argument('-detach', '--detach_audio', action= 'store_true')  # Rewrites the pickle patterns instead of converting to the store.
+    argParser.add_argument('-noaudio', '--drop_audio', action= 'store_true')    # With '-detach', the audio is removed instead of being detached.
+    args = argParser.parse_args()
+
+    if args.detach_audio:
+        count = Pattern_Detach(
+            args.pattern_path,
+            detach_fields= () if args.drop_audio else ('Audio',),
+            drop_fields= ('Audio',) if args.drop_audio else ()
+            )
+        print('{} patterns are rewritten.'.format(count))
+    else:
+        record_Dict = Pickle_to_Store(args.pattern_path, args.shard_size)
+        print('{} patterns are in the store.'.format(len(record_Dict)))
+
+# python Pattern_Store.py -p "C:/Pattern/24K.Pattern.LJVCTK/Train"
+# python Pattern_Store.py -p "C:/Pattern/24K.Pattern.LJVCTK/Train" -detach
@@ -0,0 +1,103 @@
+import torch
+import time
+from queue import Queue, Full
+from threading import Thread, Event
+
+class Prefetcher:
+    '''
+    Keeps the next 'depth' batches of a DataLoader on the device by a background thread, so the data handoff overlaps the step.
+    On CUDA, the batches are copied by non-blocking copies on a side stream, and the step stream waits the copy event.
+    On CPU, the background thread only prepares the batches.
+    'wait_Time' is the seconds the last batch was waited for. Non-tensor items of a batch are passed as they are.
+    '''
+    def __init__(self, data_loader, device, depth= 2):
+        self.data_Loader = data_loader
+        self.device = device
+        self.depth = max(depth, 1)
+        self.use_CUDA = device.type == 'cuda'
+        self.wait_Time = 0.0
+
+        self.queue = None
+        self.stop_Event = None
+        self.thread = None
+
+    def Stage(self, batch):
+        if not self.use_CUDA:
+            return batch, None
+
+        with torch.cuda.stream(self.stream):
+            batch = tuple([
+                x.to(self.device, non_blocking= True) if torch.is_tensor(x) else x
+                for x in batch
+                ])
+            event = torch.cuda.Event()
+            event.record(self.stream)
+
+        return batch, event
+
+    def Produce(self):
+        try:
+            for batch in self.data_Loader:
+                if self.stop_Event.is_set():
+                    return
+                item = self.Stage(batch)
+                while not self.Put(item):
+                    if self.stop_Event.is_set():
+                        return
+            item = None     # The end of the loader.
+        except Exception as e:
+            item = e
+        while not self.Put(item) and not self.stop_Event.is_set():
+            pass
+
+    def Put(self, item):
+        try:
+            self.queue.put(item, timeout= 0.1)
+            return True
+        except Full:
+            return False
+
+    def __iter__(self):
+        self.Close()
+        self.queue = Queue(maxsize= self.depth)
+        self.stop_Event = Event()
+        if self.use_CUDA:
+            self.stream = torch.cuda.Stream(device= self.device)
+        self.thread = Thread(target= self.Produce, daemon= True)
+        self.thread.start()
+
+        try:
+            while True:
+                start_Time = time.perf_counter()
+                item = self.queue.get()
+                self.wait_Time = time.perf_counter() - start_Time
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+
+                batch, event = item
+                if not event is None:
+                    current_Stream = torch.cuda.current_stream(self.device)
+                    current_Stream.wait_event(event)
+                    for x in batch:
+                        if torch.is_tensor(x):
+                            x.record_stream(current_Stream) # The memory is not reused before the step stream finishes.
+                yield batch
+        finally:
+            self.Close()
+
+    def Close(self):
+        '''
+        Stops the background thread when the iteration is stopped before the end of the loader.
+        '''
+        if self.thread is None:
+            return
+        self.stop_Event.set()
+        while not self.queue.empty():   # The thread may be blocked to put.
+            self.queue.get_nowait()
+        self.thread.join()
+        self.thread = None
+
+    def __len__(self):
+        return len(self.data_Loader)
@@ -0,0 +1,217 @@
+import numpy as np
+import yaml, os, io, time, json, pickle, platform, argparse, tempfile, librosa, torch
+import soundfile as sf
+from concurrent.futures import ProcessPoolExecutor as PPE
+
+import Pattern_Generator
+from Pattern_Generator import Pitch_Generate, Worker_Initialize
+
+from Arg_Parser import Recursive_Parse
+hp = Recursive_Parse(yaml.load(
+    open('Hyper_Parameters.yaml', encoding='utf-8'),
+    Loader=yaml.Loader
+    ))
+
+stages = ['Load', 'Resample', 'Trim', 'Mel', 'Pitch', 'Serialize', 'Write']
+
+def Synthetic_Audio_Generate(seconds, sample_rate, seed= 0):
+    '''
+    A voiced signal with a gliding pitch and harmonics, noise and silence at both ends, so every stage has real work.
+    '''
+    random_State = np.random.RandomState(seed)
+    time_Steps = np.arange(int(seconds * sample_rate)) / sample_rate
+    f0 = 150.0 + 50.0 * np.sin(2 * np.pi * 0.5 * time_Steps + random_State.uniform(0, 2 * np.pi))
+    phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+    audio = sum([np.sin(harmonic * phase) / harmonic for harmonic in range(1, 6)])
+    audio *= 0.5 + 0.5 * np.abs(np.sin(2 * np.pi * 2.0 * time_Steps))  # Syllable-like envelope.
+    audio += 0.01 * random_State.randn(audio.shape[0])
+    silence = np.zeros(int(0.3 * sample_rate))
+    audio = np.concatenate([silence, audio, silence])
+
+    return (0.5 * audio / np.max(np.abs(audio))).astype(np.float32)
+
+def Files_Generate(directory, lengths, files_per_length, sample_rate):
+    paths = []
+    for length in lengths:
+        for index in range(files_per_length):
+            path = os.path.join(directory, 'SYNTH.{:.1f}S.{:03d}.wav'.format(length, index)).replace('\\', '/')
+            sf.write(path, Synthetic_Audio_Generate(length, sample_rate, seed= len(paths)), sample_rate)
+            paths.append(path)
+
+    return paths
+
+def Pattern_Time(path, output_directory, top_db= 60):
+    '''
+    Same steps as Pattern_Generate and Pattern_File_Generate, timed one by one.
+    'Load', 'Resample' and 'Trim' are the steps of Audio_Prep. librosa.core.load with sr is the load and the resample.
+    return: the seconds of each stage and the audio seconds before trimming.
+    '''
+    times = {}
+    start_Time = time.perf_counter()
+    audio, sample_Rate = librosa.core.load(path, sr= None)
+    times['Load'] = time.perf_counter() - start_Time
+    audio_Seconds = audio.shape[0] / sample_Rate
+
+    start_Time = time.perf_counter()
+    audio = librosa.core.resample(audio, orig_sr= sample_Rate, target_sr= hp.Sound.Sample_Rate)
+    times['Resample'] = time.perf_counter() - start_Time
+
+    start_Time = time.perf_counter()
+    audio = librosa.effects.trim(audio, top_db= top_db, frame_length= 512, hop_length= 256)[0]
+    audio = librosa.util.normalize(audio)
+    times['Trim'] = time.perf_counter() - start_Time
+
+    start_Time = time.perf_counter()
+    mel = Pattern_Generator.mel_Extractor(audio)
+    times['Mel'] = time.perf_counter() - start_Time
+
+    start_Time = time.perf_counter()
+    pitch = Pitch_Generate(audio)
+    times['Pitch'] = time.perf_counter() - start_Time
+
+    # Pattern_Save writes the audio as '.NPY' and the other fields as the pickle.
+    start_Time = time.perf_counter()
+    audio_Bytes = io.BytesIO()
+    np.save(audio_Bytes, audio.astype(np.float32))
+    pattern_Bytes = pickle.dumps({
+        'Audio_File': 'SYNTH.AUDIO.NPY',
+        'Audio_Length': audio.shape[0],
+        'Mel': mel.astype(np.float32),
+        'Pitch': pitch.astype(np.float32),
+        'Speaker_ID': 0,
+        'Speaker': 'SYNTH',
+        'Dataset': 'SYNTH',
+        }, protocol= 4)
+    times['Serialize'] = time.perf_counter() - start_Time
+
+    start_Time = time.perf_counter()
+    file = os.path.join(output_directory, os.path.splitext(os.path.basename(path))[0]).replace('\\', '/')
+    with open('{}.AUDIO.NPY'.format(file), 'wb') as f:
+        f.write(audio_Bytes.getbuffer())
+    with open('{}.PICKLE'.format(file), 'wb') as f:
+        f.write(pattern_Bytes)
+    times['Write'] = time.perf_counter() - start_Time
+
+    return times, audio_Seconds
+
+def Pattern_Time_Chunk(paths, output_directory, top_db= 60):
+    return [Pattern_Time(path, output_directory, top_db) for path in paths]
+
+def Summary(results, wall_time, worker):
+    '''
+    files/sec and RTF (processing seconds / audio seconds) of each stage and of the whole run.
+    With several workers, the stage seconds are summed over the workers, and the total is the wall time.
+    '''
+    audio_Seconds = sum([seconds for _, seconds in results])
+    stage_Dict = {}
+    for stage in stages:
+        stage_Time = sum([times[stage] for times, _ in results])
+        stage_Dict[stage] = {
+            'Seconds': stage_Time,
+            'Files_per_Second': len(results) / max(stage_Time, 1e-7),
+            'RTF': stage_Time / audio_Seconds,
+            }
+
+    return {
+        'Worker': worker,
+        'Files': len(results),
+        'Audio_Seconds': audio_Seconds,
+        'Wall_Seconds': wall_time,
+        'Files_per_Second': len(results) / wall_time,
+        'RTF': wall_time / audio_Seconds,
+        'Stages': stage_Dict,
+        }
+
+def Benchmark(paths, output_directory, worker= 1, chunk_size= 4, top_db= 60):
+    if worker == 1:
+        Worker_Initialize()     # Same thread setting as a process pool worker.
+        Pattern_Time(paths[0], output_directory, top_db)    # Warm up. The first call builds the mel basis and the torch kernels.
+        start_Time = time.perf_counter()
+        results = Pattern_Time_Chunk(paths, output_directory, top_db)
+        return Summary(results, time.perf_counter() - start_Time, worker)
+
+    chunks = [paths[index:index + chunk_size] for index in range(0, len(paths), chunk_size)]
+    with PPE(max_workers= worker, initializer= Worker_Initialize) as executor:
+        list(executor.map(Pattern_Time_Chunk, [paths[:1]] * worker, [output_directory] * worker, [top_db] * worker))  # Warm up and start all workers.
+        start_Time = time.perf_counter()
+        results = [
+            result
+            for chunk_Results in executor.map(Pattern_Time_Chunk, chunks, [output_directory] * len(chunks), [top_db] * len(chunks))
+            for result in chunk_Results
+            ]
+        return Summary(results, time.perf_counter() - start_Time, worker)
+
+def Print(summary):
+    print('Worker: {}\tFiles: {}\tAudio: {:.1f}s\tWall: {:.3f}s\t{:.3f} files/sec\tRTF: {:.4f}'.format(
+        summary['Worker'], summary['Files'], summary['Audio_Seconds'], summary['Wall_Seconds'], summary['Files_per_Second'], summary['RTF']
+        ))
+    for stage, stage_Dict in summary['Stages'].items():
+        print('    {:<10}{:>10.3f}s{:>12.3f} files/sec    RTF: {:.4f}'.format(
+            stage, stage_Dict['Seconds'], stage_Dict['Files_per_Second'], stage_Dict['RTF']
+            ))
+
+def Compare(summaries, previous_path):
+    '''
+    Prints the RTF ratio (current / previous) of each stage for the same worker counts. A ratio above 1 is a slowdown.
+    '''
+    with open(previous_path, 'r') as f:
+        previous_Summary_Dict = {summary['Worker']: summary for summary in json.load(f)['Results']}
+    for summary in summaries:
+        if not summary['Worker'] in previous_Summary_Dict.keys():
+            continue
+        previous_Summary = previous_Summary_Dict[summary['Worker']]
+        print('Worker: {}\tTotal RTF ratio: {:.3f}'.format(summary['Worker'], summary['RTF'] / previous_Summary['RTF']))
+        for stage in stages:
+            print('    {:<10}RTF ratio: {:.3f}'.format(
+                stage, summary['Stages'][stage]['RTF'] / max(previous_Summary['Stages'][stage]['RTF'], 1e-7)
+                ))
+
+if __name__ == '__main__':
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument("-l", "--lengths", default= '2,5,10', required=False)   # Seconds of the synthetic files.
+    argParser.add_argument("-n", "--files_per_length", default= 8, required=False, type= int)
+    argParser.add_argument("-sr", "--source_sample_rate", default= 44100, required=False, type= int)   # Different from hp.Sound.Sample_Rate to include the resampling.
+    argParser.add_argument("-mw", "--max_worker", default= '1,4', required=False)   # Worker counts to compare.
+    argParser.add_argument("-cs", "--chunk_size", default= 4, required=False, type= int)
+    argParser.add_argument("-db", "--top_db", default= 60, required=False, type= int)
+    argParser.add_argument("-o", "--output_path", default= 'Preprocessing_Benchmark.json', required=False)
+    argParser.add_argument("-c", "--compare_path", required=False)   # A previous result to compare.
+    args = argParser.parse_args()
+
+    lengths = [float(x) for x in args.lengths.split(',')]
+    workers = [int(x) for x in args.max_worker.split(',')]
+
+    with tempfile.TemporaryDirectory() as directory:
+        audio_Directory = os.path.join(directory, 'Audio').replace('\\', '/')
+        pattern_Directory = os.path.join(directory, 'Pattern').replace('\\', '/')
+        os.makedirs(audio_Directory)
+        os.makedirs(pattern_Directory)
+        paths = Files_Generate(audio_Directory, lengths, args.files_per_length, args.source_sample_rate)
+
+        summaries = []
+        for worker in workers:
+            summaries.append(Benchmark(paths, pattern_Directory, worker, args.chunk_size, args.top_db))
+            Print(summaries[-1])
+
+    with open(args.output_path, 'w') as f:
+        json.dump({
+            'Time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'Environment': {
+                'Python': platform.python_version(),
+                'Platform': platform.platform(),
+                'CPU_Count': os.cpu_count(),
+                'Numpy': np.__version__,
+                'Librosa': librosa.__version__,
+                'Torch': torch.__version__,
+                },
+            'Sound': vars(hp.Sound),
+            'Lengths': lengths,
+            'Files_per_Length': args.files_per_length,
+            'Source_Sample_Rate': args.source_sample_rate,
+            'Top_DB': args.top_db,
+            'Results': summaries,
+            }, f, indent= 4)
+    print('Saved: {}'.format(args.output_path))
+
+    if not args.compare_path is None:
+        Compare(summaries, args.compare_path)
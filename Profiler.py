@@ -0,0 +1,103 @@
+import torch
+import numpy as np
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+class Profiler:
+    '''
+    Opt-in latency measurement of the model parts. It is disabled at first, and then no hook is registered
+    and every section is a shared null context, so the model runs as without the profiler.
+    When enabled, the modules of Enable() are timed by forward hooks and the other parts by Section().
+    On CUDA, the times are CUDA events which are recorded on the current stream and read only at Collect(),
+    so the host is not synchronized with the device while the model runs. On CPU, the times are the wall clock.
+    Collect() returns the latencies in ms of each tag since the last call.
+    '''
+    null_Context = nullcontext()
+
+    def __init__(self):
+        self.enabled = False
+        self.use_CUDA = False
+        self.phase = ''
+        self.handles = []
+        self.start_Dict = defaultdict(list)  # tag -> the starts of the running calls. A module can be called in itself.
+        self.pending = []   # (tag, start, end) which are not read yet.
+
+    def Enable(self, module_dict, use_cuda= None):
+        '''
+        module_dict: {tag: module}. The forward of each module is timed.
+        use_cuda: if None, the CUDA events are used when CUDA is available.
+        '''
+        self.Disable()
+        self.enabled = True
+        self.use_CUDA = torch.cuda.is_available() if use_cuda is None else use_cuda
+        for tag, module in module_dict.items():
+            self.handles.append(module.register_forward_pre_hook(lambda module, inputs, tag= tag: self.Start(tag)))
+            self.handles.append(module.register_forward_hook(lambda module, inputs, outputs, tag= tag: self.End(tag)))
+
+    def Disable(self):
+        for handle in self.handles:
+            handle.remove()
+        self.handles = []
+        self.enabled = False
+        self.start_Dict.clear()
+
+    def Mark(self):
+        if self.use_CUDA:
+            event = torch.cuda.Event(enable_timing= True)
+            event.record()
+            return event
+        return time.perf_counter()
+
+    def Start(self, tag):
+        self.start_Dict[self.phase + tag].append(self.Mark())
+
+    def End(self, tag):
+        tag = self.phase + tag
+        self.pending.append((tag, self.start_Dict[tag].pop(), self.Mark()))
+
+    def Section(self, tag):
+        if not self.enabled:
+            return self.null_Context
+        return self.Timed_Section(tag)
+
+    @contextmanager
+    def Timed_Section(self, tag):
+        self.Start(tag)
+        try:
+            yield
+        finally:
+            self.End(tag)
+
+    def Phase(self, phase):
+        '''
+        The tags in this context are '<phase>/<tag>', e.g. to split the inference from the train forward.
+        '''
+        if not self.enabled:
+            return self.null_Context
+        return self.Phase_Context(phase)
+
+    @contextmanager
+    def Phase_Context(self, phase):
+        previous_Phase = self.phase
+        self.phase = '{}{}/'.format(previous_Phase, phase)
+        try:
+            yield
+        finally:
+            self.phase = previous_Phase
+
+    def Collect(self):
+        '''
+        return: {tag: latencies in ms}
+        '''
+        if len(self.pending) == 0:
+            return {}
+        if self.use_CUDA:
+            torch.cuda.synchronize()    # Only here, to read the events.
+
+        latency_Dict = defaultdict(list)
+        for tag, start, end in self.pending:
+            latency_Dict[tag].append(start.elapsed_time(end) if self.use_CUDA else (end - start) * 1000.0)
+        self.pending = []
+
+        return {tag: np.array(latencies, dtype= np.float64) for tag, latencies in latency_Dict.items()}
@@ -0,0 +1,248 @@
+import torch
+import numpy as np
+import yaml, os, pickle, hashlib, argparse, logging, sys
+from tqdm import tqdm
+
+from Datasets import Mel_Stack
+from Metadata import Metadata
+from Pattern_Store import Shard_Reader, Store_Path, Pattern_Load
+
+from Arg_Parser import Recursive_Parse
+hp = Recursive_Parse(yaml.load(
+    open('Hyper_Parameters.yaml', encoding='utf-8'),
+    Loader=yaml.Loader
+    ))
+
+logging.basicConfig(
+    level=logging.INFO, stream=sys.stdout,
+    format= '%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s'
+    )
+
+header_File = 'PROSODY.PICKLE'
+column_Files = ('VECTORS', 'NORMS', 'SPEAKERS')
+
+def Column_Path(index_path, column):
+    return os.path.join(index_path, 'PROSODY.{}.NPY'.format(column)).replace('\\', '/')
+
+def Encoder_Hash(prosody_encoder):
+    '''
+    The vectors are valid only for the same encoder weights.
+    '''
+    hash = hashlib.sha1()
+    for key, value in sorted(prosody_encoder.state_dict().items()):
+        hash.update(key.encode('utf-8'))
+        hash.update(value.detach().cpu().numpy().tobytes())
+
+    return hash.hexdigest().upper()
+
+class Prosody_Index:
+    '''
+    The GST prosody vectors of the patterns with their speaker labels.
+    The vectors are one memory-mapped [N, Prosody_dim] array, and the row index is the ID of the prosody.
+    The nearest neighbours are searched by the cosine similarity, so no audio and no encoder is needed to pick a prosody.
+    '''
+    def __init__(self, index_path):
+        self.index_Path = index_path
+        self.Load()
+
+    def Load(self):
+        header_Path = os.path.join(self.index_Path, header_File).replace('\\', '/')
+        if not os.path.exists(header_Path):
+            self.header_Dict = {'Encoder_Hash': None, 'Files': [], 'Speakers': []}
+            self.vectors = np.zeros((0, hp.Prosody_Encoder.Size), dtype= np.float32)
+            self.norms = np.zeros((0,), dtype= np.float32)
+            self.speakers = np.zeros((0,), dtype= np.int32)
+        else:
+            with open(header_Path, 'rb') as f:
+                self.header_Dict = pickle.load(f)
+            self.vectors, self.norms, self.speakers = [
+                np.load(Column_Path(self.index_Path, column), mmap_mode= 'r')
+                for column in column_Files
+                ]
+        self.index_Dict = {file: index for index, file in enumerate(self.header_Dict['Files'])}
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    def File(self, index):
+        return self.header_Dict['Files'][index]
+
+    def Speaker(self, index):
+        return self.header_Dict['Speakers'][self.speakers[index]]
+
+    def Get(self, key):
+        '''
+        key: the ID (row index) or the pattern file.
+        return: [Prosody_dim]
+        '''
+        if isinstance(key, str):
+            key = self.index_Dict[key]
+        return np.array(self.vectors[key])
+
+    def Search(self, queries, k= 1, speaker= None, chunk_size= 65536):
+        '''
+        queries: [Prosody_dim] or [Query, Prosody_dim]
+        speaker: if not None, only the prosodies of this speaker are searched.
+        return: the IDs and the cosine similarities, [Query, k] each. Without the query axis when the queries are one vector.
+        '''
+        single = np.ndim(queries) == 1
+        queries = np.atleast_2d(np.asarray(queries, dtype= np.float32))
+        queries = queries / np.maximum(np.linalg.norm(queries, axis= 1, keepdims= True), 1e-7)
+
+        scores = np.empty((queries.shape[0], len(self)), dtype= np.float32)
+        for start in range(0, len(self), chunk_size):
+            vectors = self.vectors[start:start + chunk_size]
+            scores[:, start:start + chunk_size] = queries @ vectors.T / np.maximum(self.norms[start:start + chunk_size], 1e-7)
+        if not speaker is None:
+            mask = np.isin(self.speakers, [index for index, name in enumerate(self.header_Dict['Speakers']) if name == speaker])
+            scores[:, ~mask] = -np.inf
+            k = min(k, int(mask.sum()))
+        k = min(k, len(self))
+        if k == 0:
+            raise ValueError('There is no prosody to search.')
+
+        indices = np.argpartition(-scores, k - 1, axis= 1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, indices, axis= 1), axis= 1)
+        indices = np.take_along_axis(indices, order, axis= 1)
+        scores = np.take_along_axis(scores, indices, axis= 1)
+
+        if single:
+            return indices[0], scores[0]
+        return indices, scores
+
+    def Update(self, prosody_encoder, pattern_path, metadata_file, use_store= False, batch_size= 64, num_workers= 0, device= torch.device('cpu')):
+        '''
+        Encodes the patterns which are not in the index yet and removes the patterns which are not in the metadata anymore.
+        When the encoder weights are different from the weights of the index, every pattern is encoded again.
+        return: the numbers of the added and the removed patterns.
+        '''
+        metadata = Metadata(os.path.join(pattern_path, metadata_file).replace('\\', '/'))
+        files = metadata.Files()
+        encoder_Hash = Encoder_Hash(prosody_encoder)
+        if self.header_Dict['Encoder_Hash'] != encoder_Hash:    # No vector is kept.
+            self.index_Dict = {}
+            self.header_Dict['Speakers'] = []
+        file_Set = set(files)
+
+        kept_Files = [file for file in self.header_Dict['Files'] if file in self.index_Dict.keys() and file in file_Set]
+        new_Indices = [index for index, file in enumerate(files) if not file in self.index_Dict.keys()]
+        new_Indices.sort(key= lambda index: metadata.records['Mel_Length'][index])    # Similar lengths are batched together.
+
+        dataLoader = torch.utils.data.DataLoader(
+            dataset= Prosody_Index_Dataset(pattern_path, [files[index] for index in new_Indices], use_store),
+            shuffle= False,
+            collate_fn= Prosody_Index_Collater(),
+            batch_size= batch_size,
+            num_workers= num_workers,
+            pin_memory= True
+            )
+        new_Vectors = []
+        prosody_encoder.eval()
+        with torch.no_grad():
+            for mels, mel_Lengths in tqdm(dataLoader, desc= '[Prosody_Index]'):
+                new_Vectors.append(prosody_encoder(mels.to(device), mel_Lengths.to(device)).cpu().numpy())
+
+        speaker_Dict = {speaker: index for index, speaker in enumerate(self.header_Dict['Speakers'])}
+        new_Speakers = []
+        for index in new_Indices:
+            speaker = metadata.Record(index)['Speaker']
+            if not speaker in speaker_Dict.keys():
+                speaker_Dict[speaker] = len(speaker_Dict)
+            new_Speakers.append(speaker_Dict[speaker])
+
+        kept_Indices = np.array([self.index_Dict[file] for file in kept_Files], dtype= np.int64)
+        vectors = np.concatenate([np.asarray(self.vectors[kept_Indices], dtype= np.float32)] + new_Vectors, axis= 0)
+        column_Dict = {
+            'VECTORS': vectors,
+            'NORMS': np.linalg.norm(vectors, axis= 1).astype(np.float32),
+            'SPEAKERS': np.concatenate([
+                np.asarray(self.speakers[kept_Indices], dtype= np.int32),
+                np.array(new_Speakers, dtype= np.int32)
+                ]),
+            }
+        header_Dict = {
+            'Encoder_Hash': encoder_Hash,
+            'Prosody_Dim': vectors.shape[1],
+            'Pattern_Path': pattern_path,
+            'Files': kept_Files + [files[index] for index in new_Indices],
+            'Speakers': list(speaker_Dict.keys()),
+            }
+        removed = len(self) - len(kept_Files)
+
+        # The kept rows are copied, so the maps of the old columns are released. A mapped file cannot be replaced on Windows.
+        self.vectors = self.norms = self.speakers = None
+
+        # Same as the metadata, the columns are replaced before the header.
+        os.makedirs(self.index_Path, exist_ok= True)
+        for column, array in list(column_Dict.items()) + [(None, header_Dict)]:
+            path = Column_Path(self.index_Path, column) if not column is None else os.path.join(self.index_Path, header_File).replace('\\', '/')
+            with open('{}.TMP'.format(path), 'wb') as f:
+                if column is None:
+                    pickle.dump(array, f, protocol= 4)
+                else:
+                    np.save(f, array, allow_pickle= False)
+            os.replace('{}.TMP'.format(path), path)
+        self.Load()
+
+        return len(new_Indices), removed
+
+class Prosody_Index_Dataset(torch.utils.data.Dataset):
+    def __init__(self, pattern_path, files, use_store= False):
+        super(Prosody_Index_Dataset, self).__init__()
+        self.pattern_Path = pattern_path
+        self.file_List = files
+        self.store = Shard_Reader(Store_Path(pattern_path)) if use_store else None
+
+    def __getitem__(self, idx):
+        file = self.file_List[idx]
+        if not self.store is None:
+            return self.store.Load(file, fields= ('Mel',))['Mel']
+        return Pattern_Load(os.path.join(self.pattern_Path, file).replace('\\', '/'), fields= ('Mel',))['Mel']
+
+    def __len__(self):
+        return len(self.file_List)
+
+class Prosody_Index_Collater:
+    def __call__(self, mels):
+        mel_Lengths = torch.LongTensor([mel.shape[0] for mel in mels])   # [Batch]
+        mels = torch.from_numpy(Mel_Stack(mels))   # [Batch, Mel_dim, Time]
+
+        return mels, mel_Lengths
+
+def Prosody_Encoder_Load(checkpoint_path, device= torch.device('cpu')):
+    from Modules import GlowTTS
+    if not hp.Mode.upper() in ['PE', 'GR']:
+        raise ValueError('The prosody encoder is used only in \'PE\' and \'GR\' modes. Current mode: {}'.format(hp.Mode))
+
+    model = GlowTTS()
+    state_Dict = torch.load(checkpoint_path, map_location= 'cpu')
+    model.load_state_dict(state_Dict['Model'])
+    logging.info('Checkpoint loaded at {} steps.'.format(state_Dict['Steps']))
+
+    return model.layer_Dict['Prosody_Encoder'].to(device)
+
+if __name__ == '__main__':
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument('-c', '--checkpoint', required= True)
+    argParser.add_argument('-p', '--pattern_path', default= hp.Train.Train_Pattern.Path)
+    argParser.add_argument('-m', '--metadata_file', default= hp.Train.Train_Pattern.Metadata_File)
+    argParser.add_argument('-o', '--index_path', default= 'Prosody_Index')
+    argParser.add_argument('-bs', '--batch_size', default= 64, type= int)
+    argParser.add_argument('-store', '--use_store', action= 'store_true')
+    args = argParser.parse_args()
+
+    if not hp.Device is None:
+        os.environ['CUDA_VISIBLE_DEVICES']= hp.Device
+    device = torch.device('cuda:0') if torch.cuda.is_available() else torch.device('cpu')
+
+    prosody_Index = Prosody_Index(args.index_path)
+    added, removed = prosody_Index.Update(
+        prosody_encoder= Prosody_Encoder_Load(args.checkpoint, device),
+        pattern_path= args.pattern_path,
+        metadata_file= args.metadata_file,
+        use_store= args.use_store,
+        batch_size= args.batch_size,
+        num_workers= hp.Train.Num_Workers,
+        device= device
+        )
+    logging.info('Prosody index: {} patterns are added and {} patterns are removed. Total {}.'.format(added, removed, len(prosody_Index)))
@@ -0,0 +1,103 @@
+import numpy as np
+import yaml, re, hashlib
+
+from Arg_Parser import Recursive_Parse
+hp = Recursive_Parse(yaml.load(
+    open('Hyper_Parameters.yaml', encoding='utf-8'),
+    Loader=yaml.Loader
+    ))
+
+class Text_Frontend:
+    '''
+    Text normalization and tokenization with memoization.
+    The token dict is loaded from 'hp.Token_Path' when it is used first, because the pattern generator makes that file.
+    Tokens are looked up by a table indexed by the character code, and a batch of texts is looked up at once.
+    '''
+    remove_Table = str.maketrans('', '', '()"[]:;')
+    replace_List = [('  ', ' '), (' ,', ','), ('\' ', '\'')]
+    regex_Checker = re.compile(r"[A-Z,.?!'\-\s]+")
+
+    def __init__(self, token_dict= None, max_memo_items= 2 ** 20):
+        self.max_Memo_Items = max_memo_items
+        self.filter_Memo_Dict = {}
+        self.token_Memo_Dict = {}
+        self.token_Dict = None
+        if not token_dict is None:
+            self.Set_Token_Dict(token_dict)
+
+    def Set_Token_Dict(self, token_dict):
+        self.token_Dict = token_dict
+        self.token_Dict_Hash = hashlib.sha1(repr(sorted(token_dict.items())).encode('utf-8')).hexdigest().upper()
+        self.start_Token = token_dict['<S>']
+        self.end_Token = token_dict['<E>']
+
+        characters = [token for token in token_dict.keys() if len(token) == 1]
+        self.token_LUT = np.full(max([ord(character) for character in characters] + [0]) + 1, -1, dtype= np.int32)
+        for character in characters:
+            self.token_LUT[ord(character)] = token_dict[character]
+        self.token_Memo_Dict = {}
+
+    def Token_Dict(self):
+        if self.token_Dict is None:
+            with open(hp.Token_Path) as f:
+                self.Set_Token_Dict(yaml.load(f, Loader=yaml.Loader))
+        return self.token_Dict
+
+    def Hash(self):
+        self.Token_Dict()
+        return self.token_Dict_Hash
+
+    def Filter(self, text):
+        '''
+        Upper case and punctuation normalization. None if the text has a character which is not supported.
+        '''
+        if text in self.filter_Memo_Dict.keys():
+            return self.filter_Memo_Dict[text]
+
+        filtered_Text = text.upper().strip().translate(self.remove_Table)
+        for filter, replace_STR in self.replace_List:
+            filtered_Text = filtered_Text.replace(filter, replace_STR)
+        filtered_Text = filtered_Text.strip()
+
+        matches = self.regex_Checker.findall(filtered_Text)
+        if len(matches) != 1 or filtered_Text.startswith('\''):
+            filtered_Text = None
+        else:
+            filtered_Text = matches[0]
+
+        if len(self.filter_Memo_Dict) >= self.max_Memo_Items:
+            self.filter_Memo_Dict.clear()
+        self.filter_Memo_Dict[text] = filtered_Text
+
+        return filtered_Text
+
+    def Filter_Batch(self, texts):
+        return [self.Filter(text) for text in texts]
+
+    def Tokenize(self, text):
+        '''
+        return: [<S>, characters..., <E>] int32
+        '''
+        return self.Tokenize_Batch([text])[0]
+
+    def Tokenize_Batch(self, texts):
+        self.Token_Dict()
+        if len(self.token_Memo_Dict) + len(texts) > self.max_Memo_Items:
+            self.token_Memo_Dict.clear()
+        new_Texts = list(set([text for text in texts if not text in self.token_Memo_Dict.keys()]))
+        if len(new_Texts) > 0:
+            codes = np.frombuffer(''.join(new_Texts).encode('utf-32-le'), dtype= '<u4')
+            unknown = codes >= self.token_LUT.shape[0]
+            ids = self.token_LUT[np.where(unknown, 0, codes)]
+            unknown |= ids < 0
+            if unknown.any():
+                raise KeyError(chr(codes[np.argmax(unknown)]))
+
+            for text, text_IDs in zip(new_Texts, np.split(ids, np.cumsum([len(text) for text in new_Texts])[:-1])):
+                token = np.empty(len(text) + 2, dtype= np.int32)
+                token[0] = self.start_Token
+                token[1:-1] = text_IDs
+                token[-1] = self.end_Token
+                self.token_Memo_Dict[text] = token
+
+        return [self.token_Memo_Dict[text] for text in texts]
@@ -11,8 +11,11 @@ from scipy.io import wavfile
 from random import sample
 
 from Logger import Logger
-from Modules import GlowTTS, MLE_Loss
-from Datasets import Dataset, Inference_Dataset, Prosody_Check_Dataset, Collater, Inference_Collater, Prosody_Check_Collater
+from Modules import GlowTTS, MLE_Loss, Length_Loss, Autocast, Autocast_Dtype
+from Pattern_Cache import Pattern_Cache
+from Feature_Cache import Feature_Cache
+from Prefetcher import Prefetcher
+from Datasets import Dataset, Bucket_Batch_Sampler, Inference_Dataset, Prosody_Check_Dataset, Collater, Inference_Collater, Prosody_Check_Collater
 from Noam_Scheduler import Modified_Noam_Scheduler
 from Radam import RAdam
 
@@ -39,13 +42,6 @@ logging.basicConfig(
     format= '%(asctime)s (%(module)s:%(lineno)d) %(levelname)s: %(message)s'
     )
 
-if hp.Use_Mixed_Precision:
-    try:
-        from apex import amp
-    except:
-        logging.info('There is no apex modules in the environment. Mixed precision does not work.')
-        hp.Use_Mixed_Precision = False
-
 class Trainer:
     def __init__(self, steps= 0):
         self.steps = steps
@@ -67,15 +63,28 @@ class Trainer:
         self.Load_Checkpoint()
 
     def Datset_Generate(self):
+        # One cache is shared by the main process and all DataLoader workers, and it is kept through the epochs.
+        self.pattern_Cache = Pattern_Cache(max_size= hp.Train.Pattern_Cache_Size) if hp.Train.Use_Pattern_Cache else None
+        self.pattern_Cache_Stat_Dict = None
+        # With the raw audio, the workers extract the features from the source audio, and the features are kept in the disk cache.
+        self.feature_Cache = Feature_Cache(
+            cache_path= hp.Train.Raw_Audio.Cache_Path,
+            max_disk_size= hp.Train.Raw_Audio.Max_Cache_Size,
+            max_memory_items= 0,
+            shared= True
+            ) if hp.Train.Raw_Audio.Use else None
+        self.feature_Cache_Stat_Dict = None
+
         train_Dataset = Dataset(
             pattern_path= hp.Train.Train_Pattern.Path,
             metadata_file= hp.Train.Train_Pattern.Metadata_File,
-            accumulated_dataset_epoch= hp.Train.Train_Pattern.Accumulated_Dataset_Epoch,
             mel_length_min= hp.Train.Train_Pattern.Mel_Length.Min,
             mel_length_max= hp.Train.Train_Pattern.Mel_Length.Max,
             text_length_min= hp.Train.Train_Pattern.Text_Length.Min,
             text_length_max= hp.Train.Train_Pattern.Text_Length.Max,
-            use_cache = hp.Train.Use_Pattern_Cache
+            pattern_cache= self.pattern_Cache,
+            feature_cache= self.feature_Cache,
+            use_store = hp.Train.Use_Pattern_Store
             )
         dev_Dataset = Dataset(
             pattern_path= hp.Train.Eval_Pattern.Path,
@@ -84,32 +93,58 @@ class Trainer:
             mel_length_max= hp.Train.Eval_Pattern.Mel_Length.Max,
             text_length_min= hp.Train.Eval_Pattern.Text_Length.Min,
             text_length_max= hp.Train.Eval_Pattern.Text_Length.Max,
-            use_cache = hp.Train.Use_Pattern_Cache 
+            pattern_cache= self.pattern_Cache,
+            feature_cache= self.feature_Cache,
+            use_store = hp.Train.Use_Pattern_Store
             )
         inference_Dataset = Inference_Dataset(
             pattern_path= hp.Train.Inference_Pattern_File_in_Train
             )
-        logging.info('The number of train patterns = {}.'.format(len(train_Dataset) // hp.Train.Train_Pattern.Accumulated_Dataset_Epoch))
+        logging.info('The number of train patterns = {}.'.format(len(train_Dataset)))
         logging.info('The number of development patterns = {}.'.format(len(dev_Dataset)))
         logging.info('The number of inference patterns = {}.'.format(len(inference_Dataset)))
 
         collater = Collater()
         inference_Collater = Inference_Collater()
 
+        # The train sampler does not stop at the end of an epoch, so the DataLoader workers are not restarted every epoch.
+        # Its position is saved with the checkpoint.
+        sampler_Dict = {
+            tag: Bucket_Batch_Sampler(
+                mel_lengths= dataset.mel_Length_List,
+                text_lengths= dataset.text_Length_List,
+                batch_size= hp.Train.Batch_Size,
+                bucket_size= hp.Train.Bucket_Size,
+                shuffle= True,
+                max_frames= hp.Train.Frame_Budget.Max_Frames,
+                max_area= hp.Train.Frame_Budget.Max_Area,
+                seed= hp.Train.Sampler_Seed,
+                infinite= tag == 'Train'
+                )
+            for tag, dataset in [('Train', train_Dataset), ('Dev', dev_Dataset)]
+            }
+        for tag, sampler in sampler_Dict.items():
+            random_Sampler = Bucket_Batch_Sampler(sampler.mel_Lengths, sampler.text_Lengths, hp.Train.Batch_Size, bucket_size= 1)
+            logging.info('{} padding efficiency (bucketed / random): {}.'.format(tag, ', '.join([
+                '{} {:.3f} / {:.3f}'.format(key, bucketed_Efficiency, random_Efficiency)
+                for (key, bucketed_Efficiency), random_Efficiency in zip(
+                    sampler.Efficiency(sampler.Batches(sampler.epoch)).items(),
+                    random_Sampler.Efficiency(random_Sampler.Batches(0)).values()
+                    )
+                ])))
+
         self.dataLoader_Dict = {}
         self.dataLoader_Dict['Train'] = torch.utils.data.DataLoader(
             dataset= train_Dataset,
-            shuffle= True,
+            batch_sampler= sampler_Dict['Train'],
             collate_fn= collater,
-            batch_size= hp.Train.Batch_Size,
             num_workers= hp.Train.Num_Workers,
             pin_memory= True
             )
         self.dataLoader_Dict['Dev'] = torch.utils.data.DataLoader(
             dataset= dev_Dataset,
-            shuffle= True,
+            batch_sampler= sampler_Dict['Dev'],
             collate_fn= collater,
-            batch_size= hp.Train.Batch_Size,
             num_workers= hp.Train.Num_Workers,
             pin_memory= True
             )
@@ -129,7 +164,9 @@ class Trainer:
                     metadata_file= hp.Train.Train_Pattern.Metadata_File,
                     mel_length_min= hp.Train.Train_Pattern.Mel_Length.Min,
                     mel_length_max= hp.Train.Train_Pattern.Mel_Length.Max,
-                    use_cache = hp.Train.Use_Pattern_Cache
+                    pattern_cache= self.pattern_Cache,
+                    feature_cache= self.feature_Cache,
+                    use_store = hp.Train.Use_Pattern_Store
                     ),
                 shuffle= False,
                 collate_fn= Prosody_Check_Collater(),
@@ -154,8 +191,8 @@ class Trainer:
                 ).to(device)
 
         self.criterion_Dict = {
-            'MSE': torch.nn.MSELoss().to(device),
             'MLE': MLE_Loss().to(device),
+            'Length': Length_Loss().to(device),
             'CE': torch.nn.CrossEntropyLoss().to(device)
             }
         self.optimizer = RAdam(
@@ -170,11 +207,15 @@ class Trainer:
             base = hp.Train.Learning_Rate.Base
             )
 
-        if hp.Use_Mixed_Precision:
-            self.model_Dict['GlowTTS'], self.optimizer = amp.initialize(
-                models= self.model_Dict['GlowTTS'],
-                optimizers=self.optimizer
-                )
+        # The parameters stay in float32, so a checkpoint is same with or without the mixed precision.
+        # Only float16 needs the loss scaling. With bfloat16 or without the mixed precision, the scaler does nothing.
+        self.scaler = torch.amp.GradScaler(
+            device.type,
+            enabled= hp.Mixed_Precision.Use and Autocast_Dtype(device) == torch.float16
+            )
+
+        if hp.Train.Use_Profiler:
+            self.model_Dict['GlowTTS'].Profile(use_cuda= device.type == 'cuda')
 
         logging.info(self.model_Dict['GlowTTS'])
 
@@ -190,56 +231,61 @@ class Trainer:
         mels_for_ge2e = mels_for_ge2e.to(device)
         pitches = pitches.to(device)
 
-        z, mel_Mean, mel_Log_Std, log_Dets, log_Durations, log_Duration_Targets, _, classified_Speakers = self.model_Dict['GlowTTS'](
-            tokens= tokens,
-            token_lengths= token_lengths,
-            mels= mels,
-            mel_lengths= mel_lengths,
-            speakers= speakers,
-            mels_for_ge2e= mels_for_ge2e,
-            pitches= pitches
-            )
+        with Autocast(device):
+            z, mel_Mean, mel_Log_Std, log_Dets, log_Durations, log_Duration_Targets, _, classified_Speakers = self.model_Dict['GlowTTS'](
+                tokens= tokens,
+                token_lengths= token_lengths,
+                mels= mels,
+                mel_lengths= mel_lengths,
+                speakers= speakers,
+                mels_for_ge2e= mels_for_ge2e,
+                pitches= pitches
+                )
 
-        loss_Dict['MLE'] = self.criterion_Dict['MLE'](
-            z= z,
-            mean= mel_Mean,
-            std= mel_Log_Std,
-            log_dets= log_Dets,
-            lengths= mel_lengths
-            )
-        loss_Dict['Length'] = self.criterion_Dict['MSE'](log_Durations, log_Duration_Targets)
-        loss_Dict['Total'] = loss_Dict['MLE'] + loss_Dict['Length']
+            loss_Dict['MLE'] = self.criterion_Dict['MLE'](
+                z= z,
+                mean= mel_Mean,
+                std= mel_Log_Std,
+                log_dets= log_Dets,
+                lengths= mel_lengths
+                )
+            loss_Dict['Length'] = self.criterion_Dict['Length'](log_Durations, log_Duration_Targets, token_lengths)
+            loss_Dict['Total'] = loss_Dict['MLE'] + loss_Dict['Length']
 
-        loss = loss_Dict['Total']
-        if not classified_Speakers is None:
-            loss_Dict['Speaker'] = self.criterion_Dict['CE'](classified_Speakers, speakers)
-            loss = loss_Dict['Total'] + loss_Dict['Speaker']
+            loss = loss_Dict['Total']
+            if not classified_Speakers is None:
+                loss_Dict['Speaker'] = self.criterion_Dict['CE'](classified_Speakers, speakers)
+                loss = loss_Dict['Total'] + loss_Dict['Speaker']
 
         self.optimizer.zero_grad()
-        if hp.Use_Mixed_Precision:
-            with amp.scale_loss(loss, self.optimizer) as scaled_loss:
-                scaled_loss.backward()            
-            torch.nn.utils.clip_grad_norm_(
-                parameters= amp.master_params(self.optimizer),
-                max_norm= hp.Train.Gradient_Norm
-                )
-        else:
-            loss.backward()
-            torch.nn.utils.clip_grad_norm_(
-                parameters= self.model_Dict['GlowTTS'].parameters(),
-                max_norm= hp.Train.Gradient_Norm
-                )
-        self.optimizer.step()
+        self.scaler.scale(loss).backward()
+        self.scaler.unscale_(self.optimizer)    # The gradients are clipped by the real norm.
+        torch.nn.utils.clip_grad_norm_(
+            parameters= self.model_Dict['GlowTTS'].parameters(),
+            max_norm= hp.Train.Gradient_Norm
+            )
+        self.scaler.step(self.optimizer)    # The step is skipped when the scaled gradients overflowed.
+        self.scaler.update()
         self.scheduler.step()
         self.steps += 1
         self.tqdm.update(1)
 
         for tag, loss in loss_Dict.items():
             self.scalar_Dict['Train']['Loss/{}'.format(tag)] += loss
+        self.scalar_Dict['Train']['Batch/Size'] += tokens.size(0)   # The batch size changes with the frame budget.
+        self.scalar_Dict['Train']['Batch/Frames'] += mels.size(0) * mels.size(2)
 
     def Train_Epoch(self):
-        for tokens, token_Lengths, mels, mel_Lengths, speakers, mels_for_GE2E, pitches in self.dataLoader_Dict['Train']:
+        '''
+        The train sampler is infinite, so this returns at the max step only.
+        '''
+        sampler = self.dataLoader_Dict['Train'].batch_sampler
+        prefetcher = Prefetcher(self.dataLoader_Dict['Train'], device, depth= hp.Train.Prefetch_Depth)
+        for tokens, token_Lengths, mels, mel_Lengths, speakers, mels_for_GE2E, pitches in prefetcher:
             self.Train_Step(tokens, token_Lengths, mels, mel_Lengths, speakers, mels_for_GE2E, pitches)
+            sampler.Consume()   # A checkpoint from now on resumes at the next batch.
+            self.epochs = sampler.epoch
+            self.scalar_Dict['Train']['Data/Wait_Time'] += prefetcher.wait_Time    # Seconds per step which the step waited for the data.
             
             if self.steps % hp.Train.Checkpoint_Save_Interval == 0:
                 self.Save_Checkpoint()
@@ -250,7 +296,14 @@ class Trainer:
                     for tag, loss in self.scalar_Dict['Train'].items()
                     }
                 self.scalar_Dict['Train']['Learning_Rate'] = self.scheduler.get_last_lr()
+                self.scalar_Dict['Train'].update(self.Pattern_Cache_Scalar_Dict())
+                self.scalar_Dict['Train'].update(self.Feature_Cache_Scalar_Dict())
+                self.scalar_Dict['Train'].update({
+                    'Padding_Efficiency/{}'.format(key): efficiency
+                    for key, efficiency in self.dataLoader_Dict['Train'].batch_sampler.efficiency_Dict.items()
+                    })
                 self.writer_Dict['Train'].add_scalar_dict(self.scalar_Dict['Train'], self.steps)
+                self.writer_Dict['Train'].add_latency_dict(self.model_Dict['GlowTTS'].profiler.Collect(), self.steps)
                 self.scalar_Dict['Train'] = defaultdict(float)
 
             if self.steps % hp.Train.Evaluation_Interval == 0:
@@ -262,7 +315,44 @@ class Trainer:
             if self.steps >= hp.Train.Max_Step:
                 return
 
-        self.epochs += hp.Train.Train_Pattern.Accumulated_Dataset_Epoch
+    def Pattern_Cache_Scalar_Dict(self):
+        '''
+        The hit rate is of the patterns loaded since the last call.
+        '''
+        if self.pattern_Cache is None:
+            return {}
+
+        stat_Dict = self.pattern_Cache.Stats()
+        previous_Stat_Dict = self.pattern_Cache_Stat_Dict or {key: 0 for key in stat_Dict.keys()}
+        self.pattern_Cache_Stat_Dict = stat_Dict
+        hits = stat_Dict['Hit'] - previous_Stat_Dict['Hit']
+        misses = stat_Dict['Miss'] - previous_Stat_Dict['Miss']
+
+        return {
+            'Pattern_Cache/Hit_Rate': hits / max(hits + misses, 1),
+            'Pattern_Cache/Evictions': stat_Dict['Eviction'] - previous_Stat_Dict['Eviction'],
+            'Pattern_Cache/Items': stat_Dict['Items'],
+            'Pattern_Cache/Used_MB': stat_Dict['Used'] / 1024 ** 2,
+            }
+
+    def Feature_Cache_Scalar_Dict(self):
+        '''
+        The hit rate is of the features extracted or loaded since the last call. A miss means the extraction from the source audio.
+        '''
+        if self.feature_Cache is None:
+            return {}
+
+        stat_Dict = self.feature_Cache.Stats()
+        previous_Stat_Dict = self.feature_Cache_Stat_Dict or {key: 0 for key in stat_Dict.keys()}
+        self.feature_Cache_Stat_Dict = stat_Dict
+        hits = stat_Dict['Disk_Hit'] - previous_Stat_Dict['Disk_Hit']
+        misses = stat_Dict['Miss'] - previous_Stat_Dict['Miss']
+
+        return {
+            'Feature_Cache/Hit_Rate': hits / max(hits + misses, 1),
+            'Feature_Cache/Extractions': misses,
+            'Feature_Cache/Disk_MB': stat_Dict['Disk_Size'] / 1024 ** 2,
+            }
 
     @torch.no_grad()
     def Evaluation_Step(self, tokens, token_lengths, mels, mel_lengths, speakers, mels_for_ge2e, pitches):
@@ -276,49 +366,69 @@ class Trainer:
         mels_for_ge2e = mels_for_ge2e.to(device)
         pitches = pitches.to(device)
 
-        z, mel_Mean, mel_Log_Std, log_Dets, log_Durations, log_Duration_Targets, attentions_from_Train, classified_Speakers = self.model_Dict['GlowTTS'](
-            tokens= tokens,
-            token_lengths= token_lengths,
-            mels= mels,
-            mel_lengths= mel_lengths,
-            speakers= speakers,
-            mels_for_ge2e= mels_for_ge2e,
-            pitches= pitches
-            )
-
-        loss_Dict['MLE'] = self.criterion_Dict['MLE'](
-            z= z,
-            mean= mel_Mean,
-            std= mel_Log_Std,
-            log_dets= log_Dets,
-            lengths= mel_lengths
-            )
-        loss_Dict['Length'] = self.criterion_Dict['MSE'](log_Durations, log_Duration_Targets)
-        loss_Dict['Total'] = loss_Dict['MLE'] + loss_Dict['Length']
-        if not classified_Speakers is None:
-            loss_Dict['Speaker'] = self.criterion_Dict['CE'](classified_Speakers, speakers)
+        with Autocast(device):
+            z, mel_Mean, mel_Log_Std, log_Dets, log_Durations, log_Duration_Targets, attentions_from_Train, classified_Speakers = self.model_Dict['GlowTTS'](
+                tokens= tokens,
+                token_lengths= token_lengths,
+                mels= mels,
+                mel_lengths= mel_lengths,
+                speakers= speakers,
+                mels_for_ge2e= mels_for_ge2e,
+                pitches= pitches
+                )
 
-        for tag, loss in loss_Dict.items():
-            self.scalar_Dict['Evaluation']['Loss/{}'.format(tag)] += loss
-
-
-        # For tensorboard images
-        mels, _, attentions_from_Inference = self.model_Dict['GlowTTS'].inference(
-            tokens= tokens,
-            token_lengths= token_lengths,
-            mels_for_prosody= mels,
-            mel_lengths_for_prosody= mel_lengths,
-            speakers= speakers,
-            mels_for_ge2e= mels_for_ge2e,
-            pitches= pitches,
-            pitch_lengths= mel_lengths,
-            length_scale= torch.FloatTensor([1.0]).to(device)
-            )
+            loss_Dict['MLE'] = self.criterion_Dict['MLE'](
+                z= z,
+                mean= mel_Mean,
+                std= mel_Log_Std,
+                log_dets= log_Dets,
+                lengths= mel_lengths
+                )
+            loss_Dict['Length'] = self.criterion_Dict['Length'](log_Durations, log_Duration_Targets, token_lengths)
+            loss_Dict['Total'] = loss_Dict['MLE'] + loss_Dict['Length']
+            if not classified_Speakers is None:
+                loss_Dict['Speaker'] = self.criterion_Dict['CE'](classified_Speakers, speakers)
+
+            for tag, loss in loss_Dict.items():
+                self.scalar_Dict['Evaluation']['Loss/{}'.format(tag)] += loss
+
+            # For tensorboard images
+            mels, _, attentions_from_Inference = self.model_Dict['GlowTTS'].inference(
+                tokens= tokens,
+                token_lengths= token_lengths,
+                mels_for_prosody= mels,
+                mel_lengths_for_prosody= mel_lengths,
+                speakers= speakers,
+                mels_for_ge2e= mels_for_ge2e,
+                pitches= pitches,
+                pitch_lengths= mel_lengths,
+                length_scale= torch.FloatTensor([1.0]).to(device)
+                )
 
         return mels, attentions_from_Train, attentions_from_Inference, classified_Speakers
     
     def Evaluation_Epoch(self):
         logging.info('(Steps: {}) Start evaluation.'.format(self.steps))
+        if not self.pattern_Cache is None:
+            stat_Dict = self.pattern_Cache.Stats()
+            logging.info('Pattern cache: {} hits, {} misses ({:.1f}% hit), {} items, {:.1f} / {:.1f} MB, {} evictions.'.format(
+                stat_Dict['Hit'],
+                stat_Dict['Miss'],
+                stat_Dict['Hit'] / max(stat_Dict['Hit'] + stat_Dict['Miss'], 1) * 100,
+                stat_Dict['Items'],
+                stat_Dict['Used'] / 1024 ** 2,
+                stat_Dict['Size'] / 1024 ** 2,
+                stat_Dict['Eviction']
+                ))
+        if not self.feature_Cache is None:
+            stat_Dict = self.feature_Cache.Stats()
+            logging.info('Feature cache: {} hits, {} extractions ({:.1f}% hit), {:.1f} / {:.1f} MB.'.format(
+                stat_Dict['Disk_Hit'],
+                stat_Dict['Miss'],
+                stat_Dict['Disk_Hit'] / max(stat_Dict['Disk_Hit'] + stat_Dict['Miss'], 1) * 100,
+                stat_Dict['Disk_Size'] / 1024 ** 2,
+                hp.Train.Raw_Audio.Max_Cache_Size
+                ))
 
         for model in self.model_Dict.values():
             model.eval()
@@ -326,7 +436,7 @@ class Trainer:
         for step, (tokens, token_Lengths, mels, mel_Lengths, speakers, mels_for_GE2E, pitches) in tqdm(
             enumerate(self.dataLoader_Dict['Dev'], 1),
             desc='[Evaluation]',
-            total= math.ceil(len(self.dataLoader_Dict['Dev'].dataset) / hp.Train.Batch_Size)
+            total= len(self.dataLoader_Dict['Dev'])
             ):
             mel_Predictions, attentions_from_Train, attentions_from_Inference, classified_Speakers = self.Evaluation_Step(tokens, token_Lengths, mels, mel_Lengths, speakers, mels_for_GE2E, pitches)
 
@@ -336,6 +446,7 @@ class Trainer:
             }
         self.writer_Dict['Evaluation'].add_scalar_dict(self.scalar_Dict['Evaluation'], self.steps)
         self.writer_Dict['Evaluation'].add_histogram_model(self.model_Dict['GlowTTS'], self.steps, delete_keywords=['layer_Dict', 'layer', 'GE2E'])
+        self.writer_Dict['Evaluation'].add_latency_dict(self.model_Dict['GlowTTS'].profiler.Collect(), self.steps)
         self.scalar_Dict['Evaluation'] = defaultdict(float)
 
         image_Dict = {
@@ -347,7 +458,7 @@ class Trainer:
         if not classified_Speakers is None:
             image_Dict.update({
                 'Speaker/Original': (torch.nn.functional.one_hot(speakers, hp.Speaker_Embedding.Num_Speakers).cpu().numpy(), None),
-                'Speaker/Predicted': (torch.softmax(classified_Speakers, dim= -1).cpu().numpy(), None),
+                'Speaker/Predicted': (torch.softmax(classified_Speakers.float(), dim= -1).cpu().numpy(), None),
                 })
         self.writer_Dict['Evaluation'].add_image_dict(image_Dict, self.steps)
 
@@ -368,17 +479,18 @@ class Trainer:
         pitches = pitches.to(device)
         length_scales = length_scales.to(device)
 
-        mels, mel_Lengths, attentions = self.model_Dict['GlowTTS'].inference(
-            tokens= tokens,
-            token_lengths= token_lengths,
-            mels_for_prosody= mels_for_prosody,
-            mel_lengths_for_prosody= mel_lengths_for_prosody,
-            speakers= speakers,
-            mels_for_ge2e= mels_for_ge2e,
-            pitches= pitches,
-            pitch_lengths= pitch_lengths,
-            length_scale= length_scales
-            )
+        with Autocast(device):
+            mels, mel_Lengths, attentions = self.model_Dict['GlowTTS'].inference(
+                tokens= tokens,
+                token_lengths= token_lengths,
+                mels_for_prosody= mels_for_prosody,
+                mel_lengths_for_prosody= mel_lengths_for_prosody,
+                speakers= speakers,
+                mels_for_ge2e= mels_for_ge2e,
+                pitches= pitches,
+                pitch_lengths= pitch_lengths,
+                length_scale= length_scales
+                )
 
         files = []
         for index, label in enumerate(labels):
@@ -454,6 +566,7 @@ class Trainer:
             total= math.ceil(len(self.dataLoader_Dict['Inference'].dataset) / (hp.Inference_Batch_Size or hp.Train.Batch_Size))
             ):
             self.Inference_Step(tokens, token_Lengths, mels_for_Prosody, mel_Lengths_for_Prosody, speakers, mels_for_GE2E, pitches, pitch_Lengths, length_Scales, labels, texts, start_index= step * (hp.Inference_Batch_Size or hp.Train.Batch_Size))
+        self.writer_Dict['Evaluation'].add_latency_dict(self.model_Dict['GlowTTS'].profiler.Collect(), self.steps)
 
         for model in self.model_Dict.values():
             model.train()
@@ -517,12 +630,15 @@ class Trainer:
         self.scheduler.load_state_dict(state_Dict['Scheduler'])
         self.steps = state_Dict['Steps']
         self.epochs = state_Dict['Epochs']
+        if 'Sampler' in state_Dict.keys():
+            self.dataLoader_Dict['Train'].batch_sampler.load_state_dict(state_Dict['Sampler'])
+        else:
+            logging.info('No sampler state is in the checkpoint. The train batches restart from a new epoch.')
 
-        if hp.Use_Mixed_Precision:
-            if not 'AMP' in state_Dict.keys():
-                logging.info('No AMP state dict is in the checkpoint. Model regards this checkpoint is trained without mixed precision.')
-            else:                
-                amp.load_state_dict(state_Dict['AMP'])
+        if len(state_Dict.get('Scaler', {})) > 0:   # The state of a disabled scaler is empty.
+            self.scaler.load_state_dict(state_Dict['Scaler'])
+        elif 'AMP' in state_Dict.keys():
+            logging.info('The apex AMP state in the checkpoint is ignored. The loss scale restarts from the default.')
 
         for flow in self.model_Dict['GlowTTS'].layer_Dict['Decoder'].layer_Dict['Flows']:
             flow.layers[0].initialized = True   # Activation_Norm is already initialized when checkpoint is loaded.
@@ -541,9 +657,9 @@ class Trainer:
             'Scheduler': self.scheduler.state_dict(),
             'Steps': self.steps,
             'Epochs': self.epochs,
+            'Sampler': self.dataLoader_Dict['Train'].batch_sampler.state_dict(),
+            'Scaler': self.scaler.state_dict(),
             }
-        if hp.Use_Mixed_Precision:
-            state_Dict['AMP'] = amp.state_dict()
 
         torch.save(
             state_Dict,
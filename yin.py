@@ -154,12 +154,81 @@ def compute_yin(sig, sr, w_len=512, w_step=256, f0_min=100, f0_max=500,
 
     return np.array(pitches), np.array(harmonic_rates), argmins, times
 
+def compute_yin_vectorized(sig, sr, w_len=512, w_step=256, f0_min=100, f0_max=500,
+                harmo_thresh=0.1, center = True, pad_mode='reflect', n_fft=2048, frame_batch=1024):
+    """
+
+    Vectorized version of compute_yin. The results are the same up to the floating point rounding.
+    All frames are made by a strided view of the signal, and the difference function, CMND and pitch search are computed for
+    frame_batch frames at once instead of a python loop over frames.
+
+    :param frame_batch: the number of frames computed at once. This limits the memory of the batched FFT.
+    """
+    if center:
+        sig = np.pad(sig, (w_step + w_len - sig.shape[0] % w_step) // 2, mode=pad_mode)
+
+    timeScale = range(0, len(sig) - w_len, w_step)  # time values for each analysis window
+    times = [t/float(sr) for t in timeScale]
+    if len(timeScale) == 0:
+        return np.zeros(0), np.zeros(0), [], times
+    frames = np.lib.stride_tricks.sliding_window_view(sig, w_len)[::w_step][:len(timeScale)]
+
+    pitches, harmonic_rates, argmins = zip(*[
+        compute_yin_frames(frames[start:start + frame_batch], sr, w_len, f0_min, f0_max, harmo_thresh)
+        for start in range(0, frames.shape[0], frame_batch)
+        ])
+
+    return np.concatenate(pitches), np.concatenate(harmonic_rates), np.concatenate(argmins).tolist(), times
+
+def compute_yin_frames(frames, sr, w_len=512, f0_min=100, f0_max=500, harmo_thresh=0.1):
+    """
+    The YIN results of each frame. The result of a frame does not depend on the other frames.
 
+    :param frames: [Frame, w_len] array
+    :returns: pitches, harmonic_rates and argmins of the frames
+    """
+    tau_min = int(sr / f0_max)
+    tau_max = int(sr / f0_min)
+
+    # Same as differenceFunction
+    df_tau_max = min(tau_max, w_len)
+    size = w_len + df_tau_max
+    p2 = (size // 32).bit_length()
+    nice_numbers = (16, 18, 20, 24, 25, 27, 30, 32)
+    size_pad = min(x * 2 ** p2 for x in nice_numbers if x * 2 ** p2 >= size)
+
+    x = np.array(frames, np.float64)
+    x_cumsum = np.concatenate((np.zeros((x.shape[0], 1)), (x * x).cumsum(axis=1)), axis=1)
+    fc = np.fft.rfft(x, size_pad, axis=1)
+    conv = np.fft.irfft(np.multiply(fc, fc.conjugate()), axis=1)[:, :df_tau_max]
+    df = x_cumsum[:, w_len:w_len - df_tau_max:-1] + x_cumsum[:, w_len:w_len + 1] - x_cumsum[:, :df_tau_max] - 2 * conv
+
+    # Same as cumulativeMeanNormalizedDifferenceFunction
+    cmdf = df[:, 1:] * np.arange(1, tau_max) / (np.cumsum(df[:, 1:], axis=1).astype(float) + 1e-8)
+    cmdf = np.concatenate((np.ones((cmdf.shape[0], 1)), cmdf), axis=1)
+
+    # Same as getPitch: the first tau under the threshold, then the descent to the local minimum.
+    taus = np.arange(tau_max)
+    below = (cmdf < harmo_thresh) & (taus >= tau_min)
+    voiced = below.any(axis=1)
+    first = np.argmax(below, axis=1)
+    stop = np.ones_like(cmdf, dtype=bool)   # The descent stops at tau when cmdf[tau + 1] is not smaller or tau + 1 reaches tau_max.
+    stop[:, :-1] = ~(cmdf[:, 1:] < cmdf[:, :-1])
+    stop &= taus >= first[:, None]
+    p = np.where(voiced, np.argmax(stop, axis=1), 0)
+
+    argmin = np.argmin(cmdf, axis=1)
+    argmins = np.where(argmin > tau_min, sr / np.maximum(argmin, 1), 0.0)
+    pitches = np.where(p != 0, sr / np.maximum(p, 1), 0.0)
+    harmonic_rates = np.where(p != 0, cmdf[np.arange(cmdf.shape[0]), p], np.min(cmdf, axis=1))
+
+    return pitches, harmonic_rates, argmins
 
 
 
 # This part is added from CODEJIN, Jaekoo
 from scipy.ndimage import gaussian_filter1d
+from Audio import Overlap_Framer
 def pitch_calc(
     sig,
     sr,
@@ -170,7 +239,7 @@ def pitch_calc(
     confidence_threshold=0.85,
     gaussian_smoothing_sigma = 1.0
     ):
-    pitch = compute_yin(
+    pitch = compute_yin_vectorized(
         sig= sig,
         sr= sr,
         w_len= 1024,
@@ -181,4 +250,54 @@ def pitch_calc(
         pitch = gaussian_filter1d(pitch, sigma= gaussian_smoothing_sigma)
     
     return pitch
-    
\ No newline at end of file
+
+class Pitch_Stream:
+    '''
+    Streaming version of pitch_calc. The audio is received by blocks and the pitches of the complete frames are returned.
+    The length of the full audio must be known for the centered padding.
+    The gaussian smoothing needs the whole pitch sequence, so it is not applied here.
+    '''
+    def __init__(self, length, sr, confidence_threshold=0.85, w_len=1024, w_step=256, f0_min=100, f0_max=500):
+        pad = (w_step + w_len - length % w_step) // 2
+        self.sr = sr
+        self.w_len = w_len
+        self.w_step = w_step
+        self.f0_min = f0_min
+        self.f0_max = f0_max
+        self.harmo_thresh = 1 - confidence_threshold
+        self.framer = Overlap_Framer(
+            length= length,
+            frame_length= w_len,
+            hop_length= w_step,
+            pad= pad,
+            pad_mode= 'reflect',
+            frame_count= len(range(0, length + 2 * pad - w_len, w_step))
+            )
+
+    def Pitch(self, segment):
+        if segment is None:
+            return np.zeros(0)
+        frames = np.lib.stride_tricks.sliding_window_view(segment, self.w_len)[::self.w_step]
+        return compute_yin_frames(frames, self.sr, self.w_len, self.f0_min, self.f0_max, self.harmo_thresh)[0]
+
+    def Feed(self, block):
+        return self.Pitch(self.framer.Feed(block))
+
+    def Flush(self):
+        return self.Pitch(self.framer.Flush())
+
+if __name__ == '__main__':
+    # Speed comparison between the frame loop and the vectorized version.
+    import librosa, time
+    from glob import glob
+    for path in sorted(glob('Wav_for_Inference/*.wav')):
+        sig = librosa.load(path, sr= 22050)[0]
+        start_Time = time.time()
+        loop_Pitch = compute_yin(sig= sig, sr= 22050, w_len= 1024, w_step= 256, harmo_thresh= 0.15)[0]
+        loop_Time = time.time() - start_Time
+        start_Time = time.time()
+        vectorized_Pitch = compute_yin_vectorized(sig= sig, sr= 22050, w_len= 1024, w_step= 256, harmo_thresh= 0.15)[0]
+        vectorized_Time = time.time() - start_Time
+        print('{}\tFrames: {}\tLoop: {:.3f}s\tVectorized: {:.3f}s\tx{:.1f}\tClose: {}'.format(
+            path, loop_Pitch.shape[0], loop_Time, vectorized_Time, loop_Time / vectorized_Time, np.allclose(loop_Pitch, vectorized_Pitch)
+            ))